@@ -9,6 +9,7 @@ import { SidebarProvider, SidebarTrigger } from "@/components/ui/sidebar";
 import { AppSidebar } from "@/components/app-sidebar";
 import { AuthProvider, useAuth } from "@/lib/auth-context";
 import { mcpClient } from "@/lib/mcp-client";
+import { useEventStream } from "@/hooks/use-event-stream";
 import NotFound from "@/pages/not-found";
 import Home from "@/pages/home";
 import Queue from "@/pages/queue";
@@ -98,6 +99,8 @@ function AppContent() {
     enabled: !!user,
   });
 
+  useEventStream(!!user && !!organization);
+
   const sidebarStyle = {
     "--sidebar-width": "16rem",
     "--sidebar-width-icon": "3.5rem",
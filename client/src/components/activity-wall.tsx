@@ -59,7 +59,7 @@ export function ActivityWall({ limit = 20, showTitle = true, className = "" }: A
   const { data: events, isLoading } = useQuery<ActivityEvent[]>({
     queryKey: ['/mcp/activity/events', limit],
     queryFn: () => mcpClient.getActivityEvents(limit) as Promise<ActivityEvent[]>,
-    refetchInterval: 30000,
+    refetchInterval: 300000,
   });
 
   if (isLoading) {
@@ -1,7 +1,8 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { TicketCard } from "./ticket-card";
 import { PostCard } from "./post-card";
 import { ActivitySheet } from "./activity-sheet";
+import { mcpClient } from "@/lib/mcp-client";
 import { PostCommentsSheet } from "./post-comments-sheet";
 import { Skeleton } from "@/components/ui/skeleton";
 import type { FeedTicket, Post, FeedItem } from "@shared/schema";
@@ -14,8 +15,14 @@ interface MixedFeedProps {
   onEscalate: (ticketId: string) => void;
   onLikePost: (postId: string) => void;
   onRefresh: () => void;
+  hasMore?: boolean;
+  isLoadingMore?: boolean;
+  onLoadMore?: () => void;
 }
 
+// Fetch the next page when this few cards are left in the stack.
+const LOAD_MORE_THRESHOLD = 5;
+
 export function MixedFeed({ 
   items, 
   isLoading,
@@ -23,7 +30,10 @@ export function MixedFeed({
   onResolve, 
   onEscalate,
   onLikePost,
-  onRefresh 
+  onRefresh,
+  hasMore,
+  isLoadingMore,
+  onLoadMore,
 }: MixedFeedProps) {
   const [currentIndex, setCurrentIndex] = useState(0);
   const [selectedTicketId, setSelectedTicketId] = useState<string | null>(null);
@@ -31,12 +41,18 @@ export function MixedFeed({
   const [activityOpen, setActivityOpen] = useState(false);
   const [commentsOpen, setCommentsOpen] = useState(false);
 
+  useEffect(() => {
+    if (hasMore && !isLoadingMore && currentIndex >= items.length - LOAD_MORE_THRESHOLD) {
+      onLoadMore?.();
+    }
+  }, [hasMore, isLoadingMore, currentIndex, items.length]);
+
   const handleSkip = (itemId: string) => {
     if (items.length <= 1) return;
     
     if (currentIndex < items.length - 1) {
       setCurrentIndex(prev => prev + 1);
-    } else {
+    } else if (!hasMore) {
       setCurrentIndex(0);
     }
   };
@@ -56,6 +72,7 @@ export function MixedFeed({
   };
 
   const handleViewActivity = (ticketId: string) => {
+    mcpClient.viewTicket(ticketId).catch(() => {});
     setSelectedTicketId(ticketId);
     setActivityOpen(true);
   };
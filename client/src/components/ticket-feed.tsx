@@ -1,6 +1,7 @@
-import { useState } from "react";
+import { useEffect, useState } from "react";
 import { TicketCard } from "./ticket-card";
 import { ActivitySheet } from "./activity-sheet";
+import { mcpClient } from "@/lib/mcp-client";
 import { Skeleton } from "@/components/ui/skeleton";
 import type { FeedTicket } from "@shared/schema";
 
@@ -11,26 +12,41 @@ interface TicketFeedProps {
   onResolve: (ticketId: string) => void;
   onEscalate: (ticketId: string) => void;
   onRefresh: () => void;
+  hasMore?: boolean;
+  isLoadingMore?: boolean;
+  onLoadMore?: () => void;
 }
 
+// Fetch the next page when this few cards are left in the stack.
+const LOAD_MORE_THRESHOLD = 5;
+
 export function TicketFeed({ 
   tickets, 
   isLoading,
   onAssign, 
   onResolve, 
   onEscalate,
-  onRefresh 
+  onRefresh,
+  hasMore,
+  isLoadingMore,
+  onLoadMore,
 }: TicketFeedProps) {
   const [currentIndex, setCurrentIndex] = useState(0);
   const [selectedTicketId, setSelectedTicketId] = useState<string | null>(null);
   const [activityOpen, setActivityOpen] = useState(false);
 
+  useEffect(() => {
+    if (hasMore && !isLoadingMore && currentIndex >= tickets.length - LOAD_MORE_THRESHOLD) {
+      onLoadMore?.();
+    }
+  }, [hasMore, isLoadingMore, currentIndex, tickets.length]);
+
   const handleSkip = (ticketId: string) => {
     if (tickets.length <= 1) return;
     
     if (currentIndex < tickets.length - 1) {
       setCurrentIndex(prev => prev + 1);
-    } else {
+    } else if (!hasMore) {
       setCurrentIndex(0);
     }
   };
@@ -50,6 +66,7 @@ export function TicketFeed({
   };
 
   const handleViewActivity = (ticketId: string) => {
+    mcpClient.viewTicket(ticketId).catch(() => {});
     setSelectedTicketId(ticketId);
     setActivityOpen(true);
   };
@@ -0,0 +1,62 @@
+import { useEffect } from "react";
+import { queryClient } from "@/lib/queryClient";
+import { supabase } from "@/lib/supabase";
+
+const RECONNECT_DELAY_MS = 3000;
+
+const INVALIDATIONS: Record<string, string[]> = {
+  activity: ['/mcp/activity/events'],
+  'ticket.assigned': ['/mcp/feed/mixed', '/mcp/tickets/feed', '/mcp/tickets/queue'],
+  'ticket.resolved': ['/mcp/feed/mixed', '/mcp/tickets/feed', '/mcp/tickets/queue', '/mcp/tickets/resolved', '/mcp/leaderboard'],
+  'ticket.escalated': ['/mcp/feed/mixed', '/mcp/tickets/feed', '/mcp/tickets/queue', '/mcp/tickets/escalated'],
+  'ticket.sla_warning': ['/mcp/tickets/feed', '/mcp/tickets/queue'],
+  'tickets.bulk': ['/mcp/feed/mixed', '/mcp/tickets/feed', '/mcp/tickets/queue', '/mcp/tickets/resolved', '/mcp/tickets/escalated', '/mcp/leaderboard'],
+  'tickets.import': ['/mcp/feed/mixed', '/mcp/tickets/feed', '/mcp/tickets/queue', '/mcp/tickets/resolved', '/mcp/tickets/escalated'],
+};
+
+function invalidate(keys: string[]) {
+  keys.forEach((key) => queryClient.invalidateQueries({ queryKey: [key] }));
+}
+
+// Keeps one /mcp/stream connection open and refreshes the affected queries
+// when other agents change tickets or post activity in the organization.
+export function useEventStream(enabled: boolean) {
+  useEffect(() => {
+    if (!enabled) return;
+
+    let source: EventSource | null = null;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let lastEventId = '';
+    let closed = false;
+
+    const connect = async () => {
+      const { data: { session } } = await supabase.auth.getSession();
+      if (closed || !session?.access_token) return;
+
+      const params = new URLSearchParams({ access_token: session.access_token });
+      if (lastEventId) params.set('lastEventId', lastEventId);
+      source = new EventSource(`/mcp/stream?${params.toString()}`);
+
+      const handle = (type: string) => (event: MessageEvent) => {
+        lastEventId = event.lastEventId || lastEventId;
+        invalidate(INVALIDATIONS[type]);
+      };
+      Object.keys(INVALIDATIONS).forEach((type) => source?.addEventListener(type, handle(type)));
+      source.addEventListener('reset', (event) => {
+        lastEventId = (event as MessageEvent).lastEventId || '';
+        invalidate(Array.from(new Set(Object.values(INVALIDATIONS).flat())));
+      });
+      source.onerror = () => {
+        source?.close();
+        if (!closed) retry = setTimeout(connect, RECONNECT_DELAY_MS);
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retry);
+      source?.close();
+    };
+  }, [enabled]);
+}
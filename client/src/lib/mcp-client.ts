@@ -1,4 +1,5 @@
 import { supabase } from './supabase';
+import type { BusinessHours, FeedItem, FeedTicket } from '@shared/schema';
 
 const MCP_BASE_URL = '/mcp';
 
@@ -13,11 +14,17 @@ async function getAuthHeaders(): Promise<HeadersInit> {
   return headers;
 }
 
-export async function mcpRequest<T>(
+export class McpError extends Error {
+  constructor(message: string, public status: number, public detail?: any) {
+    super(message);
+  }
+}
+
+async function mcpFetch(
   method: 'GET' | 'POST' | 'PUT' | 'DELETE',
   endpoint: string,
   body?: unknown
-): Promise<T> {
+): Promise<Response> {
   const headers = await getAuthHeaders();
   
   const response = await fetch(`${MCP_BASE_URL}${endpoint}`, {
@@ -28,12 +35,40 @@ export async function mcpRequest<T>(
 
   if (!response.ok) {
     const errorText = await response.text();
-    throw new Error(errorText || `Request failed with status ${response.status}`);
+    let detail;
+    try {
+      detail = JSON.parse(errorText).detail;
+    } catch {
+      detail = undefined;
+    }
+    throw new McpError(errorText || `Request failed with status ${response.status}`, response.status, detail);
   }
 
+  return response;
+}
+
+export async function mcpRequest<T>(
+  method: 'GET' | 'POST' | 'PUT' | 'DELETE',
+  endpoint: string,
+  body?: unknown
+): Promise<T> {
+  const response = await mcpFetch(method, endpoint, body);
   return response.json();
 }
 
+// Keyset-paginated lists return one page and the cursor for the next one
+// in X-Next-Cursor (absent on the last page).
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+export async function mcpPage<T>(endpoint: string, cursor?: string | null): Promise<Page<T>> {
+  const url = cursor ? `${endpoint}?cursor=${encodeURIComponent(cursor)}` : endpoint;
+  const response = await mcpFetch('GET', url);
+  return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+}
+
 export interface CreateTicketData {
   title: string;
   description: string;
@@ -66,12 +101,19 @@ export interface CreateOrganizationData {
   logoUrl?: string;
 }
 
+export interface BulkTicketActionData {
+  action: 'assign' | 'resolve' | 'escalate' | 'comment';
+  ticketIds: string[];
+  comment?: { type: string; content: string };
+}
+
 export interface CreateSlaPolicyData {
   name: string;
   priority: string;
   responseTimeMinutes: number;
   resolutionTimeMinutes: number;
   isDefault?: boolean;
+  businessHours?: BusinessHours | null;
 }
 
 export interface CreateCategoryData {
@@ -90,8 +132,8 @@ export interface QueueFilters {
 }
 
 export const mcpClient = {
-  getFeed: () => mcpRequest('GET', '/tickets/feed'),
-  getMixedFeed: () => mcpRequest('GET', '/feed/mixed'),
+  getFeed: (cursor?: string | null) => mcpPage<FeedTicket>('/tickets/feed', cursor),
+  getMixedFeed: (cursor?: string | null) => mcpPage<FeedItem>('/feed/mixed', cursor),
   getQueue: (filters?: QueueFilters) => {
     const params = new URLSearchParams();
     if (filters?.priority) params.set('priority', filters.priority);
@@ -108,11 +150,14 @@ export const mcpClient = {
   assignTicket: (ticketId: string) => mcpRequest('POST', `/tickets/${ticketId}/assign`),
   resolveTicket: (ticketId: string) => mcpRequest('POST', `/tickets/${ticketId}/resolve`),
   escalateTicket: (ticketId: string) => mcpRequest('POST', `/tickets/${ticketId}/escalate`),
+  bulkTicketAction: (data: BulkTicketActionData) => mcpRequest('POST', '/tickets/bulk', data),
+  viewTicket: (ticketId: string) => mcpRequest('POST', `/tickets/${ticketId}/view`),
   getActivities: (ticketId: string) => mcpRequest('GET', `/tickets/${ticketId}/activities`),
   addActivity: (ticketId: string, data: { type: string; content: string }) => 
     mcpRequest('POST', `/tickets/${ticketId}/activities`, data),
   getAgentStats: () => mcpRequest('GET', '/agent/stats'),
-  getLeaderboard: () => mcpRequest('GET', '/leaderboard'),
+  getLeaderboard: (window: 'all' | 'day' | 'week' | 'month' = 'all') =>
+    mcpRequest('GET', `/leaderboard?window=${window}`),
   
   getProfiles: () => mcpRequest('GET', '/profiles'),
   getProfile: (userId: string) => mcpRequest('GET', `/profiles/${userId}`),
@@ -128,6 +173,11 @@ export const mcpClient = {
   
   getSlaPolicies: () => mcpRequest('GET', '/config/sla-policies'),
   createSlaPolicy: (data: CreateSlaPolicyData) => mcpRequest('POST', '/config/sla-policies', data),
+  updateSlaPolicy: (id: string, data: Partial<CreateSlaPolicyData>) =>
+    mcpRequest('PUT', `/config/sla-policies/${id}`, data),
+  deleteSlaPolicy: (id: string) => mcpRequest('DELETE', `/config/sla-policies/${id}`),
+  recomputeSlaDeadlines: () => mcpRequest('POST', '/config/sla-policies/recompute'),
+  getSlaRecomputes: () => mcpRequest('GET', '/config/sla-policies/recomputes'),
   
   getCategories: () => mcpRequest('GET', '/config/categories'),
   createCategory: (data: CreateCategoryData) => mcpRequest('POST', '/config/categories', data),
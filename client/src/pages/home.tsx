@@ -1,19 +1,29 @@
-import { useQuery, useMutation } from "@tanstack/react-query";
+import { useQuery, useInfiniteQuery, useMutation } from "@tanstack/react-query";
 import { MixedFeed } from "@/components/mixed-feed";
 import { AgentStats } from "@/components/agent-stats";
 import { ActivityWall } from "@/components/activity-wall";
 import { useToast } from "@/hooks/use-toast";
 import { queryClient } from "@/lib/queryClient";
-import { mcpClient } from "@/lib/mcp-client";
-import type { FeedItem, AgentStats as AgentStatsType } from "@shared/schema";
+import { mcpClient, McpError } from "@/lib/mcp-client";
+import type { AgentStats as AgentStatsType } from "@shared/schema";
 
 export default function Home() {
   const { toast } = useToast();
 
-  const { data: feedItems, isLoading: feedLoading, refetch: refetchFeed } = useQuery<FeedItem[]>({
+  const {
+    data: feedPages,
+    isLoading: feedLoading,
+    refetch: refetchFeed,
+    fetchNextPage,
+    hasNextPage,
+    isFetchingNextPage,
+  } = useInfiniteQuery({
     queryKey: ['/mcp/feed/mixed'],
-    queryFn: () => mcpClient.getMixedFeed() as Promise<FeedItem[]>,
+    queryFn: ({ pageParam }) => mcpClient.getMixedFeed(pageParam),
+    initialPageParam: null as string | null,
+    getNextPageParam: (lastPage) => lastPage.nextCursor,
   });
+  const feedItems = feedPages?.pages.flatMap((page) => page.items);
 
   const { data: stats, isLoading: statsLoading } = useQuery<AgentStatsType>({
     queryKey: ['/mcp/agent/stats'],
@@ -33,6 +43,22 @@ export default function Home() {
         description: "This ticket is now in your queue.",
       });
     },
+    onError: (error: Error) => {
+      queryClient.invalidateQueries({ queryKey: ['/mcp/feed/mixed'] });
+      if (error instanceof McpError && error.status === 409) {
+        toast({
+          title: "Already Claimed",
+          description: "Another agent picked up this ticket first.",
+          variant: "destructive",
+        });
+        return;
+      }
+      toast({
+        title: "Assign Failed",
+        description: "Could not assign this ticket. Please try again.",
+        variant: "destructive",
+      });
+    },
   });
 
   const resolveMutation = useMutation({
@@ -49,6 +75,16 @@ export default function Home() {
         description: "Great job! Your streak continues.",
       });
     },
+    onError: (error: Error) => {
+      queryClient.invalidateQueries({ queryKey: ['/mcp/feed/mixed'] });
+      toast({
+        title: error instanceof McpError && error.status === 409 ? "Already Resolved" : "Resolve Failed",
+        description: error instanceof McpError && error.status === 409
+          ? "This ticket was already resolved."
+          : "Could not resolve this ticket. Please try again.",
+        variant: "destructive",
+      });
+    },
   });
 
   const escalateMutation = useMutation({
@@ -116,6 +152,9 @@ export default function Home() {
           onEscalate={handleEscalate}
           onLikePost={handleLikePost}
           onRefresh={handleRefresh}
+          hasMore={hasNextPage}
+          isLoadingMore={isFetchingNextPage}
+          onLoadMore={() => fetchNextPage()}
         />
       </div>
 
@@ -1,17 +1,29 @@
+import { useState } from "react";
 import { useQuery } from "@tanstack/react-query";
 import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Badge } from "@/components/ui/badge";
 import { Avatar, AvatarFallback, AvatarImage } from "@/components/ui/avatar";
 import { Skeleton } from "@/components/ui/skeleton";
 import { ScrollArea } from "@/components/ui/scroll-area";
+import { Tabs, TabsList, TabsTrigger } from "@/components/ui/tabs";
 import { Trophy, Flame, Medal, Crown, Star } from "lucide-react";
 import { mcpClient } from "@/lib/mcp-client";
 import type { LeaderboardUser } from "@shared/schema";
 
+type LeaderboardWindow = 'all' | 'day' | 'week' | 'month';
+
+const WINDOW_LABELS: Record<LeaderboardWindow, { tab: string; subtitle: string }> = {
+  all: { tab: "All Time", subtitle: "Top performers of all time" },
+  month: { tab: "Month", subtitle: "Top performers this month" },
+  week: { tab: "Week", subtitle: "Top performers this week" },
+  day: { tab: "Today", subtitle: "Top performers today" },
+};
+
 export default function Leaderboard() {
+  const [period, setPeriod] = useState<LeaderboardWindow>('all');
   const { data: users, isLoading } = useQuery<LeaderboardUser[]>({
-    queryKey: ['/mcp/leaderboard'],
-    queryFn: () => mcpClient.getLeaderboard() as Promise<LeaderboardUser[]>,
+    queryKey: ['/mcp/leaderboard', period],
+    queryFn: () => mcpClient.getLeaderboard(period) as Promise<LeaderboardUser[]>,
   });
 
   const getInitials = (name: string) => {
@@ -62,19 +74,34 @@ export default function Leaderboard() {
     );
   }
 
+  const header = (
+    <div className="flex flex-wrap items-center justify-between gap-4 mb-6">
+      <div className="flex items-center gap-3">
+        <Trophy className="w-8 h-8 text-primary" />
+        <div>
+          <h1 className="text-2xl font-bold">Leaderboard</h1>
+          <p className="text-muted-foreground">{WINDOW_LABELS[period].subtitle}</p>
+        </div>
+      </div>
+      <Tabs value={period} onValueChange={(value) => setPeriod(value as LeaderboardWindow)}>
+        <TabsList>
+          {(Object.keys(WINDOW_LABELS) as LeaderboardWindow[]).map((key) => (
+            <TabsTrigger key={key} value={key} data-testid={`tab-leaderboard-${key}`}>
+              {WINDOW_LABELS[key].tab}
+            </TabsTrigger>
+          ))}
+        </TabsList>
+      </Tabs>
+    </div>
+  );
+
   const topThree = users?.slice(0, 3) || [];
   const rest = users?.slice(3) || [];
 
   if (!users || users.length === 0) {
     return (
       <div className="p-6" data-testid="page-leaderboard">
-        <div className="flex items-center gap-3 mb-6">
-          <Trophy className="w-8 h-8 text-primary" />
-          <div>
-            <h1 className="text-2xl font-bold">Leaderboard</h1>
-            <p className="text-muted-foreground">Top performers this week</p>
-          </div>
-        </div>
+        {header}
         <div className="flex flex-col items-center justify-center py-16 text-center">
           <Trophy className="w-16 h-16 text-muted-foreground/30 mb-4" />
           <h3 className="text-lg font-semibold mb-2">No agents yet</h3>
@@ -88,13 +115,7 @@ export default function Leaderboard() {
 
   return (
     <div className="p-6" data-testid="page-leaderboard">
-      <div className="flex items-center gap-3 mb-6">
-        <Trophy className="w-8 h-8 text-primary" />
-        <div>
-          <h1 className="text-2xl font-bold">Leaderboard</h1>
-          <p className="text-muted-foreground">Top performers this week</p>
-        </div>
-      </div>
+      {header}
 
       {/* Top 3 Podium */}
       <div className="grid grid-cols-1 md:grid-cols-3 gap-4 mb-8">
@@ -0,0 +1,217 @@
+"""
+Local verification of Supabase access tokens.
+
+Bearer tokens are checked against the project's signing keys instead of
+calling the Auth server on every request:
+
+- asymmetric tokens (ES256/RS256) are verified with keys from the project's
+  JWKS endpoint, refreshed in the background every JWKS_REFRESH_SECONDS and
+  on demand when an unknown key id shows up;
+- legacy HS256 tokens are verified with SUPABASE_JWT_SECRET when it is set.
+
+Decoded claims are cached by token hash for at most AUTH_CACHE_TTL_SECONDS
+and never past the token's own expiry. Tokens (and sessions) signed out
+through this server are remembered until they expire, with no size limit,
+so a revocation cannot be evicted while the token is still valid. When a
+token cannot be checked locally (no matching key, no secret) we fall back
+to the remote get_user call.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import jwt
+
+from cache import ExpiringSet, TTLCache
+from db import SUPABASE_URL, get_db, get_http_client
+
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+AUTH_AUDIENCE = os.getenv("AUTH_AUDIENCE", "authenticated")
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+JWKS_MIN_REFETCH_SECONDS = 30
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+ASYMMETRIC_ALGORITHMS = ["ES256", "RS256"]
+
+
+@dataclass
+class AuthUser:
+    id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    session_id: Optional[str] = None
+    expires_at: Optional[float] = None
+    claims: dict = field(default_factory=dict)
+
+
+class SigningKeys:
+    """JWKS keys for the Supabase project, keyed by kid."""
+
+    def __init__(self, jwks_url: Optional[str]):
+        self.jwks_url = jwks_url
+        self._keys = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self, force: bool = False):
+        if not self.jwks_url:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._fetched_at < JWKS_MIN_REFETCH_SECONDS:
+                return
+            try:
+                response = await get_http_client().get(self.jwks_url)
+                response.raise_for_status()
+                keys = {}
+                for entry in response.json().get("keys", []):
+                    try:
+                        keys[entry.get("kid")] = jwt.PyJWK(entry)
+                    except jwt.PyJWKError:
+                        continue
+                self._keys = keys
+            except Exception as e:
+                print(f"JWKS refresh error: {e}")
+            finally:
+                self._fetched_at = time.monotonic()
+
+    async def get(self, kid: Optional[str]) -> Optional[jwt.PyJWK]:
+        key = self._keys.get(kid)
+        if key is None:
+            await self.refresh()
+            key = self._keys.get(kid)
+        return key
+
+
+signing_keys = SigningKeys(
+    f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else None
+)
+_claims_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS)
+_revoked_tokens = ExpiringSet()
+_revoked_sessions = ExpiringSet()
+_refresh_task: Optional[asyncio.Task] = None
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _user_from_claims(claims: dict) -> AuthUser:
+    return AuthUser(
+        id=claims["sub"],
+        email=claims.get("email"),
+        role=claims.get("role"),
+        session_id=claims.get("session_id"),
+        expires_at=claims.get("exp"),
+        claims=claims,
+    )
+
+
+def _is_revoked(key: str, user: AuthUser) -> bool:
+    if key in _revoked_tokens:
+        return True
+    return bool(user.session_id) and user.session_id in _revoked_sessions
+
+
+async def _decode_locally(token: str) -> Optional[dict]:
+    """Verify the token signature locally. Raises jwt.InvalidTokenError
+    for bad tokens and returns None when no local key can check it."""
+    header = jwt.get_unverified_header(token)
+    algorithm = header.get("alg")
+    if algorithm == "HS256":
+        if not SUPABASE_JWT_SECRET:
+            return None
+        key = SUPABASE_JWT_SECRET
+    elif algorithm in ASYMMETRIC_ALGORITHMS:
+        signing_key = await signing_keys.get(header.get("kid"))
+        if signing_key is None:
+            return None
+        key = signing_key.key
+    else:
+        raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+    return jwt.decode(
+        token,
+        key,
+        algorithms=[algorithm],
+        audience=AUTH_AUDIENCE,
+        options={"require": ["exp", "sub"]},
+    )
+
+
+async def _fetch_remote(token: str) -> Optional[AuthUser]:
+    db = await get_db()
+    response = await db.auth.get_user(token)
+    if not response or not response.user:
+        return None
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False})
+    except jwt.InvalidTokenError:
+        claims = {}
+    return AuthUser(
+        id=response.user.id,
+        email=response.user.email,
+        role=response.user.role,
+        session_id=claims.get("session_id"),
+        expires_at=claims.get("exp"),
+        claims=claims,
+    )
+
+
+async def verify_token(token: str) -> Optional[AuthUser]:
+    key = token_hash(token)
+    user = _claims_cache.get(key)
+    if user is None:
+        try:
+            claims = await _decode_locally(token)
+            user = _user_from_claims(claims) if claims else await _fetch_remote(token)
+        except jwt.InvalidTokenError:
+            return None
+        except Exception as e:
+            print(f"Token verification error: {e}")
+            return None
+        if user is None:
+            return None
+        ttl = AUTH_CACHE_TTL_SECONDS
+        if user.expires_at:
+            ttl = min(ttl, user.expires_at - time.time())
+        if ttl > 0:
+            _claims_cache.set(key, user, ttl)
+    if user.expires_at and user.expires_at <= time.time():
+        _claims_cache.pop(key)
+        return None
+    if _is_revoked(key, user):
+        return None
+    return user
+
+
+def revoke_token(token: str, user: Optional[AuthUser] = None):
+    """Reject this token (and its session) for the rest of its lifetime."""
+    key = token_hash(token)
+    expires_at = time.time() + AUTH_CACHE_TTL_SECONDS
+    if user and user.expires_at:
+        expires_at = user.expires_at
+    _revoked_tokens.add(key, expires_at)
+    if user and user.session_id:
+        _revoked_sessions.add(user.session_id, expires_at)
+    _claims_cache.pop(key)
+
+
+async def _refresh_signing_keys_forever():
+    while True:
+        await signing_keys.refresh(force=True)
+        await asyncio.sleep(JWKS_REFRESH_SECONDS)
+
+
+def start_key_refresh():
+    global _refresh_task
+    if signing_keys.jwks_url and (_refresh_task is None or _refresh_task.done()):
+        _refresh_task = asyncio.create_task(_refresh_signing_keys_forever())
+
+
+async def stop_key_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        _refresh_task = None
@@ -0,0 +1,66 @@
+"""
+Latency benchmark: indexed full-text search vs the old ilike queue search.
+
+Runs each search term against the configured Supabase project through three
+paths and prints median / p95 / max milliseconds per path:
+
+    ilike   title/description ILIKE '%term%' (the previous /mcp/tickets/queue filter)
+    fts     search_vector @@ prefix tsquery via PostgREST (the current queue filter)
+    rpc     search_content over tickets, activities and posts, ranked
+
+Usage:
+    python bench_search.py [--runs 20] [--org ORG_ID] term [term ...]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from db import close_db, execute, get_db
+from search import SEARCH_KINDS, matches, search_content
+
+DEFAULT_TERMS = ["vpn", "print", "password reset", "lapt"]
+
+
+def _ilike(db, term, org_id):
+    query = db.table("tickets").select("*").or_(f"title.ilike.%{term}%,description.ilike.%{term}%")
+    return execute(query.eq("organization_id", org_id) if org_id else query)
+
+
+def _fts(db, term, org_id):
+    query = matches(db.table("tickets").select("*"), term)
+    return execute(query.eq("organization_id", org_id) if org_id else query)
+
+
+def _rpc(db, term, org_id):
+    return search_content(db, term, org_id, list(SEARCH_KINDS), 20)
+
+
+PATHS = {"ilike": _ilike, "fts": _fts, "rpc": _rpc}
+
+
+async def bench(terms, runs: int, org_id):
+    db = await get_db()
+    print(f"{'term':<20} {'path':<6} {'rows':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+    for term in terms:
+        for name, path in PATHS.items():
+            await path(db, term, org_id)
+            timings, rows = [], 0
+            for _ in range(runs):
+                started = time.perf_counter()
+                result = await path(db, term, org_id)
+                timings.append((time.perf_counter() - started) * 1000)
+                rows = len(result if isinstance(result, list) else result.data)
+            timings.sort()
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{term:<20} {name:<6} {rows:>5} {statistics.median(timings):>8.1f} {p95:>8.1f} {timings[-1]:>8.1f}")
+    await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("terms", nargs="*", default=DEFAULT_TERMS)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--org", default=None, help="restrict to one organization id")
+    args = parser.parse_args()
+    asyncio.run(bench(args.terms, args.runs, args.org))
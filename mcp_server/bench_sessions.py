@@ -0,0 +1,365 @@
+"""
+Load test for the /mcp routes behind the swipe UI.
+
+Seeds synthetic organizations, agents, tickets, posts and activities. Then it
+replays concurrent agent sessions against the app in-process, with no network:
+
+    feed -> view -> double-tap assign -> comment -> swipe-right resolve
+         -> swipe-left escalate -> next feed page -> mixed feed -> leaderboard
+
+For each endpoint it prints p50 / p95 / p99 latency, throughput and database
+round trips per request.
+
+It uses the SQLite backend (SQLITE_PATH, default bench.db) unless DB_BACKEND
+is set. Seeded rows are derived from --seed, so an existing database with
+the same seed is reused instead of being rebuilt. Sessions sign HS256 tokens
+with SUPABASE_JWT_SECRET, so each request also goes through the normal auth
+path.
+
+Round trips are counted with a db query listener. On SQLite, and with
+DB_RPC_MODE=local, the assign/resolve stand-ins count every table call that
+the Postgres function would make in a single round trip.
+
+--save writes the results as JSON. --baseline compares a run against saved
+results and exits 1 when an endpoint's p95 or round trips grow by more than
+--tolerance.
+
+Usage:
+    python bench_sessions.py [--tickets 10000] [--orgs 2] [--agents 20]
+                             [--sessions 200] [--concurrency 20] [--seed 1]
+                             [--fresh] [--save FILE] [--baseline FILE]
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import os
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+# The data layer reads these at import time.
+os.environ.setdefault("DB_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", "bench.db")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "streamops-bench-secret-not-for-production")
+
+import httpx
+import jwt
+
+import db
+import main
+from auth import AUTH_AUDIENCE, SUPABASE_JWT_SECRET
+from db import execute, get_db
+from pagination import NEXT_CURSOR_HEADER
+
+PRIORITIES = ["critical", "high", "medium", "low"]
+PRIORITY_WEIGHTS = [1, 3, 4, 2]
+BASE_POINTS = {"critical": 100, "high": 50, "medium": 25, "low": 10}
+SLA_MINUTES = {"critical": 120, "high": 480, "medium": 1440, "low": 2880}
+CATEGORIES = ["hardware", "software", "network", "access", "other"]
+STATUSES = ["open", "assigned", "resolved", "escalated"]
+STATUS_WEIGHTS = [60, 15, 20, 5]
+WORDS = ("vpn printer laptop password email wifi monitor license access outage "
+         "reset install slow crash badge keyboard docking sso backup calendar").split()
+BATCH_SIZE = 500
+FEED_PAGE = 10
+
+_round_trips: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar("round_trips", default=None)
+
+
+def _count_round_trip(query, seconds: float, outcome):
+    box = _round_trips.get()
+    if box is not None:
+        box[0] += 1
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _timestamp(now: datetime, rng: random.Random, days: int) -> str:
+    return (now - timedelta(minutes=rng.randint(0, days * 24 * 60))).isoformat()
+
+
+def build_agents(seed: int, orgs: int, agents: int) -> List[dict]:
+    """The synthetic orgs' agents; ids depend only on the seed."""
+    namespace = uuid.uuid5(uuid.NAMESPACE_URL, f"streamops-bench-{seed}")
+    people = []
+    for o in range(orgs):
+        org_id = str(uuid.uuid5(namespace, f"org-{o}"))
+        for i in range(agents):
+            people.append({
+                "user_id": str(uuid.uuid5(namespace, f"agent-{o}-{i}")),
+                "email": f"agent{i}@org{o}.bench",
+                "org_id": org_id,
+                "org_name": f"Bench Org {o}",
+                "role": "Admin" if i == 0 else "Agent",
+            })
+    return people
+
+
+async def _insert(database, table: str, rows: List[dict]):
+    for start in range(0, len(rows), BATCH_SIZE):
+        await execute(database.table(table).insert(rows[start:start + BATCH_SIZE]))
+
+
+async def seed(database, people: List[dict], tickets: int, seed_value: int):
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    orgs = {person["org_id"]: person["org_name"] for person in people}
+    by_org = defaultdict(list)
+    for person in people:
+        by_org[person["org_id"]].append(person)
+
+    started = time.perf_counter()
+    await _insert(database, "organizations", [
+        {"id": org_id, "name": name, "slug": f"bench-{seed_value}-{n}"}
+        for n, (org_id, name) in enumerate(orgs.items())
+    ])
+    await _insert(database, "priority_configs", [
+        {"organization_id": org_id, "name": priority.capitalize(), "level": level + 1,
+         "base_points": BASE_POINTS[priority], "resolution_time_minutes": SLA_MINUTES[priority]}
+        for org_id in orgs for level, priority in enumerate(PRIORITIES)
+    ])
+    await _insert(database, "sla_policies", [
+        {"organization_id": org_id, "name": priority.capitalize(), "priority": priority,
+         "response_time_minutes": SLA_MINUTES[priority] // 8,
+         "resolution_time_minutes": SLA_MINUTES[priority], "is_default": True}
+        for org_id in orgs for priority in PRIORITIES
+    ])
+    await _insert(database, "profiles", [
+        {"user_id": person["user_id"], "email": person["email"],
+         "display_name": person["email"].split("@")[0], "role": person["role"],
+         "organization_id": person["org_id"], "organization_name": person["org_name"]}
+        for person in people
+    ])
+    await _insert(database, "agent_stats", [
+        {"agent_id": person["user_id"], "agent_name": person["email"],
+         "organization_id": person["org_id"], "tickets_resolved": rng.randint(0, 200),
+         "coins": rng.randint(0, 5000), "streak": rng.randint(0, 10)}
+        for person in people
+    ])
+
+    ticket_ids = []
+    rows = []
+    for n in range(tickets):
+        org_id = rng.choice(list(orgs))
+        requester = rng.choice(by_org[org_id])
+        priority = rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0]
+        status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+        created_at = _timestamp(now, rng, 30)
+        row = {
+            "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+            "title": f"{_text(rng, 2)} issue".capitalize(),
+            "description": _text(rng, 12),
+            "priority": priority,
+            "status": status,
+            "category": rng.choice(CATEGORIES),
+            "requester_id": requester["user_id"],
+            "requester_name": requester["email"],
+            "organization_id": org_id,
+            "sla_deadline": (datetime.fromisoformat(created_at) + timedelta(minutes=SLA_MINUTES[priority])).isoformat(),
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        if status in ("assigned", "resolved"):
+            assignee = rng.choice(by_org[org_id])
+            row["assignee_id"] = assignee["user_id"]
+            row["assignee_name"] = assignee["email"]
+        if status == "resolved":
+            row["resolved_at"] = created_at
+        rows.append(row)
+        ticket_ids.append(row["id"])
+        if len(rows) == BATCH_SIZE or n == tickets - 1:
+            await _insert(database, "tickets", rows)
+            rows = []
+            print(f"\rseeded {n + 1}/{tickets} tickets", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+    await _insert(database, "activities", [
+        {"ticket_id": rng.choice(ticket_ids), "user_id": person["user_id"], "user_name": person["email"],
+         "type": "comment", "content": _text(rng, 8), "created_at": _timestamp(now, rng, 30)}
+        for person in (rng.choice(people) for _ in range(tickets // 4))
+    ])
+    await _insert(database, "posts", [
+        {"user_id": person["user_id"], "user_name": person["email"], "organization_id": person["org_id"],
+         "title": _text(rng, 3), "content": _text(rng, 20), "created_at": _timestamp(now, rng, 30)}
+        for person in (rng.choice(people) for _ in range(max(tickets // 20, 1)))
+    ])
+    print(f"seeded in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.round_trips: Dict[str, int] = defaultdict(int)
+        self.rejected: Dict[str, int] = defaultdict(int)
+        self.failures: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, label: str, method: str, path: str,
+                   token: str, **kwargs) -> Optional[httpx.Response]:
+        box = [0]
+        reset = _round_trips.set(box)
+        started = time.perf_counter()
+        response = None
+        try:
+            response = await client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+        except Exception as e:
+            print(f"{label} error: {e}", file=sys.stderr)
+        finally:
+            elapsed = time.perf_counter() - started
+            _round_trips.reset(reset)
+        self.latencies[label].append(elapsed * 1000)
+        self.round_trips[label] += box[0]
+        if response is None or response.status_code >= 500:
+            self.failures[label] += 1
+        elif response.status_code >= 400:
+            self.rejected[label] += 1
+        return response
+
+    def results(self, wall_seconds: float) -> Dict[str, dict]:
+        results = {}
+        for label, timings in sorted(self.latencies.items()):
+            timings = sorted(timings)
+            results[label] = {
+                "requests": len(timings),
+                "rejected": self.rejected[label],
+                "failures": self.failures[label],
+                "p50": _percentile(timings, 0.50),
+                "p95": _percentile(timings, 0.95),
+                "p99": _percentile(timings, 0.99),
+                "rps": len(timings) / wall_seconds,
+                "round_trips": self.round_trips[label] / len(timings),
+            }
+        return results
+
+
+def _percentile(values: List[float], q: float) -> float:
+    return values[max(0, min(len(values) - 1, math.ceil(q * len(values)) - 1))]
+
+
+async def agent_session(client: httpx.AsyncClient, recorder: Recorder, token: str, rng: random.Random):
+    """One agent opening the app and working through a page of the feed."""
+    call = recorder.call
+    feed = await call(client, "GET /mcp/tickets/feed", "GET", "/mcp/tickets/feed", token,
+                      params={"limit": FEED_PAGE})
+    tickets = feed.json() if feed is not None and feed.status_code == 200 else []
+    for ticket in tickets[:rng.randint(3, 6)]:
+        path = f"/mcp/tickets/{ticket['id']}"
+        await call(client, "POST /mcp/tickets/{id}/view", "POST", f"{path}/view", token)
+        action = rng.random()
+        if action < 0.4:
+            assigned = await call(client, "POST /mcp/tickets/{id}/assign", "POST", f"{path}/assign", token)
+            if assigned is None or assigned.status_code != 200:
+                continue
+            if rng.random() < 0.5:
+                await call(client, "POST /mcp/tickets/{id}/activities", "POST", f"{path}/activities", token,
+                           json={"type": "comment", "content": _text(rng, 6)})
+            await call(client, "POST /mcp/tickets/{id}/resolve", "POST", f"{path}/resolve", token)
+        elif action < 0.55:
+            await call(client, "POST /mcp/tickets/{id}/escalate", "POST", f"{path}/escalate", token)
+    cursor = feed.headers.get(NEXT_CURSOR_HEADER) if feed is not None else None
+    if cursor:
+        await call(client, "GET /mcp/tickets/feed?cursor", "GET", "/mcp/tickets/feed", token,
+                   params={"limit": FEED_PAGE, "cursor": cursor})
+    await call(client, "GET /mcp/feed/mixed", "GET", "/mcp/feed/mixed", token)
+    await call(client, "GET /mcp/leaderboard", "GET", "/mcp/leaderboard", token)
+
+
+def _token(person: dict) -> str:
+    claims = {
+        "sub": person["user_id"],
+        "email": person["email"],
+        "role": "authenticated",
+        "aud": AUTH_AUDIENCE,
+        "exp": int(time.time()) + 24 * 3600,
+    }
+    return jwt.encode(claims, SUPABASE_JWT_SECRET, algorithm="HS256")
+
+
+async def run(args) -> Dict[str, dict]:
+    people = build_agents(args.seed, args.orgs, args.agents)
+    tokens = [_token(person) for person in people]
+    recorder = Recorder()
+    db.add_query_listener(_count_round_trip)
+    async with main.app.router.lifespan_context(main.app):
+        database = await get_db()
+        existing = await execute(database.table("organizations").select("id").eq("id", people[0]["org_id"]))
+        if not existing.data:
+            await seed(database, people, args.tickets, args.seed)
+        else:
+            print("reusing seeded data (pass --fresh to rebuild)", file=sys.stderr)
+
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            remaining = iter(range(args.sessions))
+
+            async def worker(n: int):
+                rng = random.Random(args.seed * 1000 + n)
+                for session in remaining:
+                    await agent_session(client, recorder, tokens[session % len(tokens)], rng)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+            wall = time.perf_counter() - started
+    db.remove_query_listener(_count_round_trip)
+    results = recorder.results(wall)
+    total = sum(result["requests"] for result in results.values())
+    print(f"{args.sessions} sessions, {total} requests in {wall:.1f}s ({total / wall:.0f} req/s), "
+          f"backend={db.DB_BACKEND}, concurrency={args.concurrency}")
+    return results
+
+
+def report(results: Dict[str, dict]):
+    print(f"{'endpoint':<36} {'reqs':>6} {'4xx':>5} {'fail':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>7} {'trips':>6}")
+    for label, r in results.items():
+        print(f"{label:<36} {r['requests']:>6} {r['rejected']:>5} {r['failures']:>5} {r['p50']:>8.1f} {r['p95']:>8.1f} "
+              f"{r['p99']:>8.1f} {r['rps']:>7.1f} {r['round_trips']:>6.1f}")
+
+
+def regressions(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    found = []
+    for label, before in baseline.items():
+        after = results.get(label)
+        if after is None:
+            continue
+        for metric in ("p95", "round_trips"):
+            if after[metric] > before[metric] * (1 + tolerance) and after[metric] - before[metric] > 0.05:
+                found.append(f"{label}: {metric} {before[metric]:.1f} -> {after[metric]:.1f}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=10000)
+    parser.add_argument("--orgs", type=int, default=2)
+    parser.add_argument("--agents", type=int, default=20, help="agents per organization")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--fresh", action="store_true", help="delete the SQLite database first")
+    parser.add_argument("--save", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare against results saved with --save")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed growth before a regression (default 0.2)")
+    args = parser.parse_args()
+
+    if args.fresh and db.DB_BACKEND == "sqlite":
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db.SQLITE_PATH + suffix):
+                os.remove(db.SQLITE_PATH + suffix)
+    results = asyncio.run(run(args))
+    report(results)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"args": vars(args), "endpoints": results}, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f)["endpoints"], args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if found else 0)
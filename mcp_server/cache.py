@@ -0,0 +1,87 @@
+"""
+Small in-process caches shared by the MCP server.
+"""
+import heapq
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a time-to-live.
+
+    Not thread-safe; it is only touched from the event loop.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def values(self):
+        now = time.monotonic()
+        return [value for value, expires_at in self._data.values() if expires_at > now]
+
+    def clear(self):
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class ExpiringSet:
+    """Keys remembered until their own expiry time (epoch seconds).
+
+    Unlike TTLCache there is no size bound, so an entry is never dropped
+    before it expires; expired entries are pruned as new ones arrive.
+    """
+
+    def __init__(self):
+        self._expires: Dict[Hashable, float] = {}
+        self._heap: List[Tuple[float, Hashable]] = []
+
+    def add(self, key: Hashable, expires_at: float):
+        self._prune()
+        if expires_at <= time.time() or self._expires.get(key, 0) >= expires_at:
+            return
+        self._expires[key] = expires_at
+        heapq.heappush(self._heap, (expires_at, key))
+
+    def _prune(self):
+        now = time.time()
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, key = heapq.heappop(self._heap)
+            if self._expires.get(key) == expires_at:
+                del self._expires[key]
+
+    def __contains__(self, key: Hashable) -> bool:
+        expires_at = self._expires.get(key)
+        return expires_at is not None and expires_at > time.time()
+
+    def __len__(self) -> int:
+        return len(self._expires)
@@ -0,0 +1,197 @@
+"""
+Denormalized counters on posts and tickets.
+
+Likes, comments, ticket activities and ticket views only ever add or
+subtract from a counter column, so instead of select-compute-update the
+deltas are buffered in memory and applied every COUNTER_FLUSH_SECONDS as
+one bulk, atomic increment per counter column (apply_counter_deltas in
+setup_db.py). A hot post liked a hundred times in a window costs one row
+update. Reads overlay the not-yet-flushed deltas so callers see their own
+writes. COUNTER_FLUSH_SECONDS=0 applies each increment immediately.
+
+Because buffered deltas are lost if the process dies, reconcile_counters
+recomputes every counter from post_likes / post_comments / activities; it
+runs every COUNTER_RECONCILE_SECONDS in the background. It holds the flush
+lock throughout and subtracts the deltas still buffered here, whose child
+rows it already counts and which the next flush adds. Rows with a child
+written in the last COUNTER_RECONCILE_GRACE_SECONDS are left for the next
+run, since another worker may still be buffering their increments.
+
+Environment:
+    COUNTER_FLUSH_SECONDS            buffering window; 0 applies each increment immediately (default 1)
+    COUNTER_RECONCILE_SECONDS        interval between reconciles; 0 disables them (default 3600)
+    COUNTER_RECONCILE_GRACE_SECONDS  recent-write window a reconcile leaves alone (default 10)
+"""
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+
+from db import call_rpc, execute, get_db
+
+COUNTER_FLUSH_SECONDS = float(os.getenv("COUNTER_FLUSH_SECONDS", "1"))
+COUNTER_RECONCILE_SECONDS = float(os.getenv("COUNTER_RECONCILE_SECONDS", "3600"))
+COUNTER_RECONCILE_GRACE_SECONDS = int(os.getenv("COUNTER_RECONCILE_GRACE_SECONDS", "10"))
+
+# counter column -> (source table, foreign key) it is derived from
+COUNTERS = {
+    ("posts", "likes_count"): ("post_likes", "post_id"),
+    ("posts", "comments_count"): ("post_comments", "post_id"),
+    ("tickets", "activity_count"): ("activities", "ticket_id"),
+    ("tickets", "view_count"): None,
+}
+
+_pending: Dict[Tuple[str, str], Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+_inflight: Dict[Tuple[str, str], Dict[str, int]] = {}
+_flush_lock = asyncio.Lock()
+_tasks = []
+
+
+def _check(table: str, column: str):
+    if (table, column) not in COUNTERS:
+        raise ValueError(f"Unknown counter {table}.{column}")
+
+
+async def incr(table: str, column: str, row_id: str, delta: int = 1):
+    """Add delta to a counter, buffered until the next flush."""
+    _check(table, column)
+    _pending[(table, column)][str(row_id)] += delta
+    if COUNTER_FLUSH_SECONDS <= 0:
+        await flush()
+
+
+async def incr_many(table: str, column: str, row_ids: Iterable[str], delta: int = 1):
+    """Add delta to the counter of every listed row, with at most one flush."""
+    _check(table, column)
+    counter = _pending[(table, column)]
+    for row_id in row_ids:
+        counter[str(row_id)] += delta
+    if COUNTER_FLUSH_SECONDS <= 0:
+        await flush()
+
+
+def pending(table: str, column: str, row_id) -> int:
+    total = 0
+    for buffer in (_pending, _inflight):
+        counter = buffer.get((table, column))
+        if counter:
+            total += counter.get(str(row_id), 0)
+    return total
+
+
+def current(table: str, column: str, row: dict) -> int:
+    """Counter value of a fetched row including unflushed increments."""
+    return max((row.get(column) or 0) + pending(table, column, row.get("id")), 0)
+
+
+async def local_apply_counter_deltas(db, params: dict):
+    table, column = params["p_table"], params["p_column"]
+    for row_id, delta in params["p_deltas"].items():
+        result = await execute(db.table(table).select(column).eq("id", row_id))
+        if result.data:
+            value = max((result.data[0].get(column) or 0) + delta, 0)
+            await execute(db.table(table).update({column: value}).eq("id", row_id))
+    return len(params["p_deltas"])
+
+
+async def flush():
+    """Apply all buffered deltas, one bulk update per counter column."""
+    async with _flush_lock:
+        await _flush()
+
+
+async def _flush():
+    _inflight.update((key, dict(deltas)) for key, deltas in _pending.items() if deltas)
+    _pending.clear()
+    if not _inflight:
+        return
+    db = await get_db()
+    for (table, column), deltas in list(_inflight.items()):
+        deltas = {row_id: delta for row_id, delta in deltas.items() if delta}
+        try:
+            if deltas:
+                await call_rpc(db, "apply_counter_deltas", {
+                    "p_table": table,
+                    "p_column": column,
+                    "p_deltas": deltas,
+                }, local_apply_counter_deltas)
+        except Exception as e:
+            print(f"Counter flush error ({table}.{column}): {e}")
+            for row_id, delta in deltas.items():
+                _pending[(table, column)][row_id] += delta
+        finally:
+            del _inflight[(table, column)]
+
+
+async def local_reconcile_counters(db, params: dict):
+    pending_deltas = params.get("p_pending") or {}
+    cutoff = (datetime.utcnow() - timedelta(seconds=params.get("p_grace_seconds") or 0)).isoformat()
+    fixed = 0
+    for (table, column), source in COUNTERS.items():
+        if source is None:
+            continue
+        source_table, foreign_key = source
+        buffered = pending_deltas.get(f"{table}.{column}", {})
+        rows = await execute(db.table(table).select(f"id,{column}"))
+        children = await execute(db.table(source_table).select(f"{foreign_key},created_at"))
+        counts = defaultdict(int)
+        recent = set()
+        for child in children.data:
+            counts[str(child[foreign_key])] += 1
+            if (child.get("created_at") or "") >= cutoff:
+                recent.add(str(child[foreign_key]))
+        for row in rows.data:
+            row_id = str(row["id"])
+            if row_id in recent:
+                continue
+            actual = counts.get(row_id, 0) - buffered.get(row_id, 0)
+            if (row.get(column) or 0) != actual:
+                await execute(db.table(table).update({column: actual}).eq("id", row["id"]))
+                fixed += 1
+    return fixed
+
+
+async def reconcile() -> Optional[int]:
+    """Recompute derived counters from their source tables. Returns the
+    number of rows that had drifted."""
+    async with _flush_lock:
+        await _flush()
+        # Taken just before the call: anything incremented since the flush
+        # is counted in the source tables and still to be flushed.
+        buffered = {f"{table}.{column}": dict(deltas) for (table, column), deltas in _pending.items() if deltas}
+        db = await get_db()
+        try:
+            return await call_rpc(db, "reconcile_counters", {
+                "p_pending": buffered,
+                "p_grace_seconds": COUNTER_RECONCILE_GRACE_SECONDS,
+            }, local_reconcile_counters)
+        except Exception as e:
+            print(f"Counter reconcile error: {e}")
+            return None
+
+
+async def _every(seconds: float, job):
+    while True:
+        await asyncio.sleep(seconds)
+        try:
+            await job()
+        except Exception as e:
+            print(f"Counter job error: {e}")
+
+
+def start_counters():
+    if _tasks:
+        return
+    if COUNTER_FLUSH_SECONDS > 0:
+        _tasks.append(asyncio.create_task(_every(COUNTER_FLUSH_SECONDS, flush)))
+    if COUNTER_RECONCILE_SECONDS > 0:
+        _tasks.append(asyncio.create_task(_every(COUNTER_RECONCILE_SECONDS, reconcile)))
+
+
+async def stop_counters():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    await flush()
@@ -0,0 +1,145 @@
+"""
+Shared async data layer for the MCP server.
+
+A single Supabase AsyncClient is created per process on top of one pooled
+HTTP/2 httpx client, so PostgREST calls reuse connections instead of
+building a new client per request. Queries are awaited through execute(),
+which caps how many round trips are in flight at once.
+
+With DB_BACKEND=sqlite the same query API is served by an embedded SQLite
+database instead (see sqlite_backend.py), so the server runs without a
+Supabase project.
+
+Tuning (environment variables):
+    DB_MAX_CONNECTIONS   pooled connections to Supabase (default 100)
+    DB_MAX_KEEPALIVE     idle keep-alive connections kept open (default 20)
+    DB_MAX_CONCURRENCY   queries awaited concurrently per process (default 200)
+    DB_TIMEOUT_SECONDS   per-request HTTP timeout (default 10)
+    DB_RPC_MODE          "rpc" calls Postgres functions; "local" runs their
+                         in-process stand-ins for tests (default rpc)
+    DB_BACKEND           "supabase" or "sqlite" (default supabase)
+    SQLITE_PATH          database file for the sqlite backend (default streamops.db)
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+import httpx
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
+
+from sqlite_backend import SqliteClient, open_sqlite
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
+
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "100"))
+DB_MAX_KEEPALIVE = int(os.getenv("DB_MAX_KEEPALIVE", "20"))
+DB_MAX_CONCURRENCY = int(os.getenv("DB_MAX_CONCURRENCY", "200"))
+DB_TIMEOUT_SECONDS = float(os.getenv("DB_TIMEOUT_SECONDS", "10"))
+DB_RPC_MODE = os.getenv("DB_RPC_MODE", "rpc")
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "streamops.db")
+
+_http_client: Optional[httpx.AsyncClient] = None
+_client: Optional[Union[AsyncClient, SqliteClient]] = None
+_client_lock = asyncio.Lock()
+_query_slots = asyncio.Semaphore(DB_MAX_CONCURRENCY)
+_query_listeners: List[Callable[[object, float, object], None]] = []
+_DB_OPERATIONS = {"GET": "select", "POST": "insert", "PATCH": "update", "DELETE": "delete"}
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the process-wide pooled HTTP/2 client."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(DB_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=DB_MAX_CONNECTIONS,
+                max_keepalive_connections=DB_MAX_KEEPALIVE,
+            ),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def get_db() -> Union[AsyncClient, SqliteClient]:
+    """Return the shared database client, creating it on first use."""
+    global _client
+    if _client is not None:
+        return _client
+    async with _client_lock:
+        if _client is None and DB_BACKEND == "sqlite":
+            _client = await open_sqlite(SQLITE_PATH)
+        elif _client is None:
+            options = AsyncClientOptions(
+                httpx_client=get_http_client(),
+                auto_refresh_token=False,
+                persist_session=False,
+            )
+            _client = await acreate_client(SUPABASE_URL, SUPABASE_KEY, options=options)
+    return _client
+
+
+def add_query_listener(listener: Callable[[object, float, object], None]):
+    """Call listener(query, seconds, outcome) after every round trip through
+    execute(); outcome is the response, or the exception the query raised."""
+    _query_listeners.append(listener)
+
+
+def remove_query_listener(listener: Callable[[object, float, object], None]):
+    if listener in _query_listeners:
+        _query_listeners.remove(listener)
+
+
+def describe_query(query) -> Tuple[str, str, List[Tuple[str, str]]]:
+    """(operation, table, [(param, value), ...]) for a postgrest-py or
+    sqlite query builder; the operation is "rpc" for function calls."""
+    request = query.request
+    path = str(getattr(request.path, "path", request.path))
+    method = getattr(request.http_method, "value", request.http_method)
+    name = path.rstrip("/").rsplit("/", 1)[-1]
+    params = [(key, value) for key, value in request.params.multi_items() if key != "select"]
+    if "/rpc/" in path:
+        return "rpc", name, params
+    return _DB_OPERATIONS.get(method, method.lower()), name, params
+
+
+async def execute(query):
+    """Await a PostgREST query builder, bounded by DB_MAX_CONCURRENCY."""
+    async with _query_slots:
+        started = time.perf_counter()
+        outcome = None
+        try:
+            outcome = await query.execute()
+            return outcome
+        except Exception as e:
+            outcome = e
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            for listener in _query_listeners:
+                listener(query, elapsed, outcome)
+
+
+async def call_rpc(db, name: str, params: dict,
+                   local: Optional[Callable[..., Awaitable]] = None):
+    """Call a Postgres function and return its result. In local mode the
+    given stand-in is run against the table API instead, as it is on the
+    sqlite backend, which has no server-side functions."""
+    if local is not None and (DB_RPC_MODE == "local" or DB_BACKEND == "sqlite"):
+        return await local(db, params)
+    result = await execute(db.rpc(name, params))
+    return result.data
+
+
+async def close_db():
+    global _client, _http_client
+    if isinstance(_client, SqliteClient):
+        await _client.close()
+    _client = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
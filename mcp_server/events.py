@@ -0,0 +1,110 @@
+"""
+In-process pub/sub behind the /mcp/stream server-sent events endpoint.
+
+Handlers publish ticket state changes and activity events to their
+organization's channel. Each channel keeps the last STREAM_BUFFER_SIZE
+events in a ring buffer so a reconnecting client can send Last-Event-ID
+and get what it missed. If that id has already left the buffer, or it was
+issued before this process started, the client gets a "reset" event and
+should refetch.
+
+A subscriber is one bounded asyncio.Queue, so idle connections cost a few
+hundred bytes and no polling. A subscriber that falls STREAM_QUEUE_SIZE
+events behind is disconnected. Its client reconnects and resumes from the
+buffer instead of holding up the publisher.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Dict, Optional, Set
+
+STREAM_BUFFER_SIZE = int(os.getenv("STREAM_BUFFER_SIZE", "500"))
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "100"))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Event ids are "<epoch>-<seq>"; the epoch changes on every restart.
+EPOCH = uuid.uuid4().hex[:8]
+_CLOSED = object()
+
+
+class _Channel:
+    def __init__(self):
+        self.buffer: deque = deque(maxlen=STREAM_BUFFER_SIZE)
+        self.subscribers: Set[asyncio.Queue] = set()
+
+
+class EventBus:
+    def __init__(self):
+        self._channels: Dict[Optional[str], _Channel] = {}
+        self._seq = 0
+
+    def _channel(self, org_id: Optional[str]) -> _Channel:
+        channel = self._channels.get(org_id)
+        if channel is None:
+            channel = self._channels[org_id] = _Channel()
+        return channel
+
+    def publish(self, org_id: Optional[str], event_type: str, data: dict):
+        self._seq += 1
+        event = (self._seq, event_type, json.dumps(data, default=str))
+        channel = self._channel(str(org_id) if org_id else None)
+        channel.buffer.append(event)
+        for queue in list(channel.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                channel.subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(_CLOSED)
+
+    def subscriber_count(self) -> int:
+        return sum(len(channel.subscribers) for channel in self._channels.values())
+
+    def _backlog(self, channel: _Channel, last_event_id: Optional[str]):
+        """Events after last_event_id, or None if the gap cannot be filled."""
+        if not last_event_id:
+            return []
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != EPOCH or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq >= self._seq:
+            return []
+        if not channel.buffer or channel.buffer[0][0] > seq + 1:
+            return None
+        return [event for event in channel.buffer if event[0] > seq]
+
+    async def subscribe(self, org_id: Optional[str], last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """Yield SSE frames for one client until it disconnects."""
+        channel = self._channel(str(org_id) if org_id else None)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        channel.subscribers.add(queue)
+        try:
+            backlog = self._backlog(channel, last_event_id)
+            if backlog is None:
+                yield _frame(f"{EPOCH}-{self._seq}", "reset", "{}")
+            else:
+                for seq, event_type, payload in backlog:
+                    yield _frame(f"{EPOCH}-{seq}", event_type, payload)
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield f": ping {int(time.time())}\n\n"
+                    continue
+                if event is _CLOSED:
+                    return
+                seq, event_type, payload = event
+                yield _frame(f"{EPOCH}-{seq}", event_type, payload)
+        finally:
+            channel.subscribers.discard(queue)
+
+
+def _frame(event_id: str, event_type: str, payload: str) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+
+bus = EventBus()
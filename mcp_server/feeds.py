@@ -0,0 +1,96 @@
+"""
+Mixed home feed built from several independently ordered sources.
+
+Every source yields rows newest-first by (created_at, id) from its own
+index. A page is produced by fetching at most `limit` rows after each
+source's cursor and lazily k-way merging them, so the work per page depends
+on the page size and number of sources, not on the size of the backlog.
+
+The composite cursor records, per source, the key of the last row that
+made it onto a page (or that the source is exhausted). New source types,
+e.g. knowledge videos or activity events, only need a FeedSource entry.
+"""
+import asyncio
+import heapq
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db import execute
+from pagination import encode_cursor, keyset_filter
+
+EXHAUSTED = "done"
+
+
+@dataclass
+class FeedSource:
+    kind: str
+    table: str
+    serialize: Callable[[dict], dict]
+    filters: Optional[Callable] = None
+
+    def query(self, db, org_id: Optional[str], after: Optional[list], limit: int):
+        query = db.table(self.table).select("*")
+        if self.filters:
+            query = self.filters(query)
+        if org_id:
+            query = query.eq("organization_id", org_id)
+        if after:
+            query = query.or_(keyset_filter([
+                ("created_at", after[0], True),
+                ("id", after[1], True),
+            ]))
+        return query.order("created_at", desc=True).order("id", desc=True).limit(limit)
+
+
+def _sort_key(row: dict) -> Tuple[str, str]:
+    return (str(row["created_at"]), str(row["id"]))
+
+
+def _stream(kind: str, rows: List[dict]):
+    for row in rows:
+        yield _sort_key(row), kind, row
+
+
+async def _fetch(db, source: FeedSource, org_id, after, limit) -> List[dict]:
+    if after == EXHAUSTED:
+        return []
+    result = await execute(source.query(db, org_id, after, limit))
+    return result.data
+
+
+async def merged_page(
+    db,
+    sources: List[FeedSource],
+    org_id: Optional[str],
+    cursor: Optional[dict],
+    limit: int,
+) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of the merged feed and the cursor for the next one."""
+    cursor = cursor or {}
+    batches = await asyncio.gather(*[
+        _fetch(db, source, org_id, cursor.get(source.kind), limit) for source in sources
+    ])
+
+    streams = [_stream(source.kind, rows) for source, rows in zip(sources, batches)]
+    merged = heapq.merge(*streams, key=lambda entry: entry[0], reverse=True)
+    page = list(islice(merged, limit))
+
+    next_cursor: Dict[str, object] = {}
+    consumed = {source.kind: 0 for source in sources}
+    for key, kind, _ in page:
+        next_cursor[kind] = list(key)
+        consumed[kind] += 1
+    has_more = False
+    for source, rows in zip(sources, batches):
+        kind = source.kind
+        if kind not in next_cursor:
+            next_cursor[kind] = cursor.get(kind)
+        if consumed[kind] < len(rows) or len(rows) == limit:
+            has_more = True
+        else:
+            next_cursor[kind] = EXHAUSTED
+
+    by_kind = {source.kind: source for source in sources}
+    items = [by_kind[kind].serialize(row) for _, kind, row in page]
+    return items, encode_cursor(next_cursor) if has_more else None
@@ -0,0 +1,297 @@
+"""
+Durable background jobs for work that does not need to finish inside the
+request, such as activity events and new-organization seeding.
+
+enqueue() commits the job to a local SQLite file (JOBS_PATH) before it
+returns, so a handler can respond as soon as its primary write is done and
+a crash afterwards loses nothing. JOB_WORKERS worker tasks claim due jobs
+under a lease. A job whose process died mid-run becomes claimable again
+when its lease expires, which makes delivery at-least-once: handlers must
+tolerate a repeat.
+
+Kinds registered with batch=True are claimed up to JOB_BATCH_SIZE at a
+time, and the handler gets every payload in one call (one multi-row insert
+instead of one round trip per event). A failed job, or a failed batch, is
+retried with exponential backoff and jitter. A batch handler that wrote
+only part of its batch raises PartialFailure naming the payloads that
+failed; only those are retried and the rest complete. After
+JOB_MAX_ATTEMPTS a job is marked dead and kept for inspection. If the queue file itself cannot be
+written, enqueue() runs the handler inline instead.
+
+Environment:
+    JOBS_PATH               queue database file (default jobs.db)
+    JOB_WORKERS             concurrent workers (default 4)
+    JOB_BATCH_SIZE          payloads per call for batch kinds (default 100)
+    JOB_MAX_ATTEMPTS        attempts before a job is dead (default 8)
+    JOB_RETRY_BASE_SECONDS  first retry delay, doubled per attempt (default 1)
+    JOB_RETRY_MAX_SECONDS   longest retry delay (default 300)
+    JOB_LEASE_SECONDS       how long a claimed job is hidden from other workers (default 300)
+    JOB_POLL_SECONDS        idle workers re-check for due retries this often (default 1)
+"""
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+JOBS_PATH = os.getenv("JOBS_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "100"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "8"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "1"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "300"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_SHUTDOWN_SECONDS = 5
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY,
+        kind TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        state TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        run_at REAL NOT NULL,
+        locked_until REAL NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        last_error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs(state, run_at, id);
+"""
+
+Handler = Callable[[Any], Awaitable[None]]
+
+_handlers: Dict[str, Tuple[Handler, bool]] = {}
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs")
+_conn: Optional[sqlite3.Connection] = None
+_wake: Optional[asyncio.Event] = None
+_workers: List[asyncio.Task] = []
+_stopping = False
+
+
+class PartialFailure(Exception):
+    """Raised by a batch handler when only some payloads failed; errors maps
+    the payload's index in the batch to its exception."""
+
+    def __init__(self, errors: Dict[int, Exception]):
+        super().__init__(f"{len(errors)} payloads failed")
+        self.errors = errors
+
+
+def register(kind: str, handler: Handler, batch: bool = False):
+    """handler(payload), or handler([payload, ...]) when batch is set."""
+    _handlers[kind] = (handler, batch)
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        conn = sqlite3.connect(JOBS_PATH, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.executescript(_SCHEMA)
+        _conn = conn
+    return _conn
+
+
+async def _call(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+
+
+def _insert(kind: str, payload: str, run_at: float) -> int:
+    cursor = _db().execute(
+        "INSERT INTO jobs (kind, payload, run_at, created_at) VALUES (?, ?, ?, ?)",
+        (kind, payload, run_at, time.time()),
+    )
+    return cursor.lastrowid
+
+
+def _claim() -> Tuple[Optional[str], List[Tuple[int, Any]], float]:
+    """(kind, [(id, payload), ...], 0) for the next due jobs, or
+    (None, [], seconds until the next one is due)."""
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        due = "state = 'pending' AND run_at <= ? AND locked_until <= ?"
+        first = conn.execute(f"SELECT kind FROM jobs WHERE {due} ORDER BY run_at, id LIMIT 1", (now, now)).fetchone()
+        if first is None:
+            (next_due,) = conn.execute(
+                "SELECT MIN(MAX(run_at, locked_until)) FROM jobs WHERE state = 'pending'"
+            ).fetchone()
+            conn.execute("COMMIT")
+            return None, [], JOB_POLL_SECONDS if next_due is None else min(max(next_due - now, 0), JOB_POLL_SECONDS)
+        kind = first[0]
+        limit = JOB_BATCH_SIZE if _handlers.get(kind, (None, False))[1] else 1
+        rows = conn.execute(
+            f"SELECT id, payload FROM jobs WHERE {due} AND kind = ? ORDER BY run_at, id LIMIT ?",
+            (now, now, kind, limit),
+        ).fetchall()
+        conn.executemany("UPDATE jobs SET locked_until = ? WHERE id = ?",
+                         [(now + JOB_LEASE_SECONDS, job_id) for job_id, _ in rows])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return kind, [(job_id, json.loads(payload)) for job_id, payload in rows], 0
+
+
+def _complete(ids: List[int]):
+    _db().executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+
+
+def retry_delay(attempts: int) -> float:
+    """Backoff before the next try, after `attempts` failures."""
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _fail(ids: List[int], error: str, retry: bool = True):
+    conn = _db()
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for job_id in ids:
+            (attempts,) = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            attempts += 1
+            if retry and attempts < JOB_MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE jobs SET attempts = ?, run_at = ?, locked_until = 0, last_error = ? WHERE id = ?",
+                    (attempts, now + retry_delay(attempts), error, job_id),
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET state = 'dead', attempts = ?, locked_until = 0, last_error = ? WHERE id = ?",
+                    (attempts, error, job_id),
+                )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+async def _run_handler(kind: str, payloads: List[Any]):
+    handler, batch = _handlers[kind]
+    if batch:
+        await handler(payloads)
+    else:
+        for payload in payloads:
+            await handler(payload)
+
+
+async def enqueue(kind: str, payload: Any, delay: float = 0) -> Optional[int]:
+    """Durably queue a job; returns its id, or None if it ran inline."""
+    if kind not in _handlers:
+        raise ValueError(f"No job handler for {kind}")
+    try:
+        job_id = await _call(_insert, kind, json.dumps(payload, default=str), time.time() + delay)
+    except Exception as e:
+        print(f"Job enqueue error ({kind}), running inline: {e}")
+        await _run_handler(kind, [payload])
+        return None
+    if _wake is not None:
+        _wake.set()
+    return job_id
+
+
+async def _work():
+    while not _stopping:
+        try:
+            kind, jobs, wait = await _call(_claim)
+        except Exception as e:
+            print(f"Job claim error: {e}")
+            kind, jobs, wait = None, [], JOB_POLL_SECONDS
+        if kind is None:
+            _wake.clear()
+            try:
+                await asyncio.wait_for(_wake.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        ids = [job_id for job_id, _ in jobs]
+        if kind not in _handlers:
+            await _call(_fail, ids, f"No job handler for {kind}", False)
+            continue
+        try:
+            await _run_handler(kind, [payload for _, payload in jobs])
+        except PartialFailure as e:
+            print(f"Job error ({kind}, {len(e.errors)} of {len(ids)} jobs): {next(iter(e.errors.values()))}")
+            for index, error in e.errors.items():
+                await _call(_fail, [ids[index]], f"{type(error).__name__}: {error}")
+            await _call(_complete, [job_id for index, job_id in enumerate(ids) if index not in e.errors])
+            continue
+        except Exception as e:
+            print(f"Job error ({kind}, {len(ids)} jobs): {e}")
+            await _call(_fail, ids, f"{type(e).__name__}: {e}")
+            continue
+        await _call(_complete, ids)
+
+
+def start_jobs():
+    global _wake, _stopping
+    if _workers:
+        return
+    _stopping = False
+    _wake = asyncio.Event()
+    _wake.set()
+    _workers.extend(asyncio.create_task(_work()) for _ in range(max(JOB_WORKERS, 1)))
+
+
+async def stop_jobs():
+    """Let running jobs finish (briefly); unfinished ones rerun after their lease."""
+    global _stopping
+    _stopping = True
+    if _wake is not None:
+        _wake.set()
+    if _workers:
+        _, pending = await asyncio.wait(_workers, timeout=JOB_SHUTDOWN_SECONDS)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    _workers.clear()
+
+
+def _summary() -> dict:
+    conn = _db()
+    now = time.time()
+    counts = conn.execute(
+        "SELECT kind, state, COUNT(*), MIN(created_at) FROM jobs GROUP BY kind, state ORDER BY kind, state"
+    ).fetchall()
+    dead = conn.execute(
+        "SELECT id, kind, attempts, last_error, created_at FROM jobs WHERE state = 'dead' ORDER BY id DESC LIMIT 20"
+    ).fetchall()
+    return {
+        "queues": [
+            {"kind": kind, "state": state, "count": count, "oldestAgeSeconds": round(now - oldest, 1)}
+            for kind, state, count, oldest in counts
+        ],
+        "dead": [
+            {"id": job_id, "kind": kind, "attempts": attempts, "lastError": error,
+             "ageSeconds": round(now - created, 1)}
+            for job_id, kind, attempts, error, created in dead
+        ],
+    }
+
+
+async def summary() -> dict:
+    """Job counts by kind and state, plus the most recent dead jobs."""
+    return await _call(_summary)
+
+
+def _retry_dead() -> int:
+    cursor = _db().execute(
+        "UPDATE jobs SET state = 'pending', attempts = 0, run_at = ?, last_error = NULL WHERE state = 'dead'",
+        (time.time(),),
+    )
+    return cursor.rowcount
+
+
+async def retry_dead() -> int:
+    """Requeue every dead job; returns how many."""
+    count = await _call(_retry_dead)
+    if _wake is not None:
+        _wake.set()
+    return count
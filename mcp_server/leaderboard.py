@@ -0,0 +1,322 @@
+"""
+In-memory leaderboard ranks.
+
+Agents are kept per organization (and in one list across all orgs, which
+is what callers without an org see) in an indexable skip list ordered by
+tickets resolved. Top-N, an agent's exact rank and the agents around them
+are O(log n + k) reads, and each stats change from assign/resolve is an
+O(log n) remove + insert instead of an ORDER BY over agent_stats.
+
+The index is rebuilt from agent_stats at startup and every
+LEADERBOARD_REBUILD_SECONDS, which also picks up writes made by other
+processes. Ties share a rank (1, 2, 2, 4).
+
+Day/week/month leaderboards are summed from the agent_stats_daily buckets
+that resolve_ticket_tx maintains (windowed_leaderboard in setup_db.py) and
+cached per (org, window) for LEADERBOARD_WINDOW_TTL_SECONDS. Windows start
+at the beginning of the current UTC day, ISO week or month.
+"""
+import asyncio
+import os
+import random
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from cache import TTLCache
+from db import call_rpc, execute, get_db
+
+LEADERBOARD_REBUILD_SECONDS = float(os.getenv("LEADERBOARD_REBUILD_SECONDS", "300"))
+REBUILD_PAGE_SIZE = 1000
+ALL_ORGS = None
+LEADERBOARD_WINDOW_TTL_SECONDS = float(os.getenv("LEADERBOARD_WINDOW_TTL_SECONDS", "30"))
+WINDOWS = ("all", "day", "week", "month")
+WINDOW_ROWS = 100
+
+
+class _Node:
+    __slots__ = ("key", "value", "next", "width")
+
+    def __init__(self, key, value, level: int):
+        self.key = key
+        self.value = value
+        self.next: List[Optional["_Node"]] = [None] * level
+        self.width = [1] * level
+
+
+class IndexableSkipList:
+    """Sorted list with O(log n) insert, remove, rank and positional access.
+
+    Each forward link records how many bottom-level nodes it skips, so the
+    position of a key is the sum of the widths walked to reach it.
+    """
+
+    MAX_LEVEL = 24
+
+    def __init__(self):
+        self._tail = _Node(None, None, 0)
+        self._head = _Node(None, None, self.MAX_LEVEL)
+        self._head.next = [self._tail] * self.MAX_LEVEL
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _search(self, key) -> Tuple[List[_Node], List[int]]:
+        chain = [self._head] * self.MAX_LEVEL
+        steps = [0] * self.MAX_LEVEL
+        node = self._head
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not self._tail and node.next[level].key < key:
+                steps[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def insert(self, key, value: Any = None):
+        chain, steps_at_level = self._search(key)
+        level = 1
+        while level < self.MAX_LEVEL and random.random() < 0.5:
+            level += 1
+        new = _Node(key, value, level)
+        steps = 0
+        for i in range(level):
+            prev = chain[i]
+            new.next[i] = prev.next[i]
+            prev.next[i] = new
+            new.width[i] = prev.width[i] - steps
+            prev.width[i] = steps + 1
+            steps += steps_at_level[i]
+        for i in range(level, self.MAX_LEVEL):
+            chain[i].width[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain, _ = self._search(key)
+        target = chain[0].next[0]
+        if target is self._tail or target.key != key:
+            raise KeyError(key)
+        for i in range(len(target.next)):
+            prev = chain[i]
+            prev.width[i] += target.width[i] - 1
+            prev.next[i] = target.next[i]
+        for i in range(len(target.next), self.MAX_LEVEL):
+            chain[i].width[i] -= 1
+        self.size -= 1
+
+    def bisect_left(self, key) -> int:
+        """Number of entries with a key strictly less than key."""
+        _, steps = self._search(key)
+        return sum(steps)
+
+    def items(self, start: int = 0, stop: Optional[int] = None) -> Iterator[Tuple[Any, Any]]:
+        """Yield (key, value) for positions start..stop-1."""
+        stop = self.size if stop is None else min(stop, self.size)
+        if start >= stop:
+            return
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        for _ in range(stop - start):
+            yield node.key, node.value
+            node = node.next[0]
+
+
+def _sort_key(row: dict) -> Tuple[int, str]:
+    return (-(row.get("tickets_resolved") or 0), str(row["agent_id"]))
+
+
+class LeaderboardIndex:
+    def __init__(self):
+        self.ready = False
+        self._boards: Dict[Optional[str], IndexableSkipList] = {}
+        self._entries: Dict[str, Tuple[Optional[str], Tuple[int, str], dict]] = {}
+        self._changed_during_rebuild: Optional[Dict[str, dict]] = None
+
+    def _board(self, org_id: Optional[str]) -> IndexableSkipList:
+        board = self._boards.get(org_id)
+        if board is None:
+            board = self._boards[org_id] = IndexableSkipList()
+        return board
+
+    def _discard(self, agent_id: str):
+        entry = self._entries.pop(agent_id, None)
+        if entry is None:
+            return
+        org_id, key, _ = entry
+        self._boards[ALL_ORGS].remove(key)
+        if org_id is not ALL_ORGS:
+            self._boards[org_id].remove(key)
+
+    def update(self, row: Optional[dict]):
+        """Insert or move an agent after its agent_stats row changed."""
+        if not row or not row.get("agent_id"):
+            return
+        agent_id = str(row["agent_id"])
+        if self._changed_during_rebuild is not None:
+            self._changed_during_rebuild[agent_id] = row
+        self._discard(agent_id)
+        org_id = str(row["organization_id"]) if row.get("organization_id") else ALL_ORGS
+        key = _sort_key(row)
+        self._board(ALL_ORGS).insert(key, row)
+        if org_id is not ALL_ORGS:
+            self._board(org_id).insert(key, row)
+        self._entries[agent_id] = (org_id, key, row)
+
+    def get(self, agent_id: str) -> Optional[dict]:
+        entry = self._entries.get(str(agent_id))
+        return entry[2] if entry else None
+
+    def _ranked(self, board: IndexableSkipList, start: int, stop: int) -> List[Tuple[int, dict]]:
+        ranked = []
+        previous_score, rank = None, 0
+        for offset, (key, row) in enumerate(board.items(start, stop)):
+            if key[0] != previous_score:
+                if offset == 0:
+                    rank = board.bisect_left((key[0], "")) + 1
+                else:
+                    rank = start + offset + 1
+                previous_score = key[0]
+            ranked.append((rank, row))
+        return ranked
+
+    def top(self, org_id: Optional[str], limit: int) -> List[Tuple[int, dict]]:
+        board = self._boards.get(org_id)
+        return self._ranked(board, 0, limit) if board else []
+
+    def rank(self, agent_id: str) -> Optional[int]:
+        entry = self._entries.get(str(agent_id))
+        if entry is None:
+            return None
+        org_id, key, _ = entry
+        return self._boards[org_id].bisect_left((key[0], "")) + 1
+
+    def around(self, agent_id: str, radius: int) -> List[Tuple[int, dict]]:
+        """The agent plus up to `radius` neighbours on each side."""
+        entry = self._entries.get(str(agent_id))
+        if entry is None:
+            return []
+        org_id, key, _ = entry
+        board = self._boards[org_id]
+        position = board.bisect_left(key)
+        return self._ranked(board, max(position - radius, 0), position + radius + 1)
+
+    async def rebuild(self):
+        """Reload every agent_stats row, replacing the current index."""
+        db = await get_db()
+        rows, start = [], 0
+        self._changed_during_rebuild = {}
+        try:
+            while True:
+                result = await execute(db.table("agent_stats")
+                    .select("*")
+                    .order("agent_id")
+                    .range(start, start + REBUILD_PAGE_SIZE - 1))
+                rows.extend(result.data)
+                if len(result.data) < REBUILD_PAGE_SIZE:
+                    break
+                start += REBUILD_PAGE_SIZE
+            fresh = LeaderboardIndex()
+            for row in rows + list(self._changed_during_rebuild.values()):
+                fresh.update(row)
+        finally:
+            self._changed_during_rebuild = None
+        self._boards, self._entries = fresh._boards, fresh._entries
+        self.ready = True
+        return len(rows)
+
+
+leaderboard = LeaderboardIndex()
+_window_cache = TTLCache(1000, LEADERBOARD_WINDOW_TTL_SECONDS)
+_rebuild_task: Optional[asyncio.Task] = None
+
+
+async def _rebuild_forever():
+    while True:
+        try:
+            await leaderboard.rebuild()
+        except Exception as e:
+            print(f"Leaderboard rebuild error: {e}")
+        await asyncio.sleep(LEADERBOARD_REBUILD_SECONDS)
+
+
+def start_leaderboard():
+    global _rebuild_task
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(_rebuild_forever())
+
+
+async def stop_leaderboard():
+    global _rebuild_task
+    if _rebuild_task is not None:
+        _rebuild_task.cancel()
+        _rebuild_task = None
+
+
+def window_start(window: str, today: Optional[date] = None) -> date:
+    today = today or datetime.utcnow().date()
+    if window == "day":
+        return today
+    if window == "week":
+        return today - timedelta(days=today.weekday())
+    if window == "month":
+        return today.replace(day=1)
+    raise ValueError(f"Unknown leaderboard window {window}")
+
+
+async def local_windowed_leaderboard(db, params: dict):
+    query = db.table("agent_stats_daily").select("*").gte("day", params["p_since"])
+    if params["p_org_id"]:
+        query = query.eq("organization_id", params["p_org_id"])
+    buckets = await execute(query)
+    totals = defaultdict(lambda: {"tickets_resolved": 0, "coins": 0})
+    for bucket in buckets.data:
+        total = totals[bucket["agent_id"]]
+        total["tickets_resolved"] += bucket.get("tickets_resolved") or 0
+        total["coins"] += bucket.get("coins") or 0
+    rows = []
+    for agent_id, total in totals.items():
+        stats = leaderboard.get(agent_id) or {}
+        rows.append({
+            "agent_id": agent_id,
+            "agent_name": stats.get("agent_name") or agent_id,
+            "streak": stats.get("streak") or 0,
+            **total,
+        })
+    rows.sort(key=_sort_key)
+    return rows[:params["p_limit"]]
+
+
+def _ranked_rows(rows: List[dict]) -> List[Tuple[int, dict]]:
+    ranked, previous, rank = [], None, 0
+    for position, row in enumerate(rows):
+        if row.get("tickets_resolved") != previous:
+            rank, previous = position + 1, row.get("tickets_resolved")
+        ranked.append((rank, row))
+    return ranked
+
+
+async def windowed_top(db, org_id: Optional[str], window: str, limit: int) -> List[Tuple[int, dict]]:
+    """Top agents by tickets resolved since the start of the window. The
+    first WINDOW_ROWS are cached so any page size up to that is a hit."""
+    key = (org_id, window)
+    ranked = _window_cache.get(key)
+    if ranked is None:
+        rows = await call_rpc(db, "windowed_leaderboard", {
+            "p_org_id": org_id,
+            "p_since": window_start(window).isoformat(),
+            "p_limit": WINDOW_ROWS,
+        }, local_windowed_leaderboard)
+        ranked = _ranked_rows(rows or [])
+        _window_cache.set(key, ranked)
+    return ranked[:limit]
+
+
+def invalidate_windows(org_id: Optional[str]):
+    """Drop cached windows that a stats change in org_id affects."""
+    for window in WINDOWS:
+        _window_cache.pop((org_id, window))
+        _window_cache.pop((ALL_ORGS, window))
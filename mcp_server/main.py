@@ -1,55 +1,124 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
+from postgrest.exceptions import APIError
 from typing import Optional, List
-from datetime import datetime, timedelta
-from supabase import create_client, Client
-import os
+from datetime import datetime
+from db import get_db, execute, close_db
+from auth import verify_token, revoke_token, start_key_refresh, stop_key_refresh
+from principal import Principal, load_principal, invalidate_principal, invalidate_org_principals
+from pagination import NEXT_CURSOR_HEADER, encode_cursor, decode_cursor, keyset_filter
+from feeds import FeedSource, merged_page
+from transitions import assign_ticket_tx, resolve_ticket_tx, bulk_assign_tickets_tx, bulk_resolve_tickets_tx
+import counters
+from search import SEARCH_KINDS, matches, search_content
+from events import bus
+import org_config
+import metrics
+import tracing
+import profiler
+import slow_queries
+import jobs
+import sla_scheduler
+import sla
+import ticket_import
+from leaderboard import (
+    WINDOWS, WINDOW_ROWS, leaderboard, windowed_top, invalidate_windows,
+    start_leaderboard, stop_leaderboard,
+)
 
 app = FastAPI(title="StreamOps MCP Server")
 
+ADMIN_ROLES = ["Admin", "Manager"]
+FEED_PAGE_SIZE = 25
+FEED_MAX_PAGE_SIZE = 100
+LEADERBOARD_SIZE = 20
+BULK_ACTIONS = ["assign", "resolve", "escalate", "comment"]
+BULK_MAX_TICKETS = 5000
+BULK_CHUNK_SIZE = 200
+UNIQUE_VIOLATION = "23505"
+FOREIGN_KEY_VIOLATION = "23503"
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
-
-def get_supabase() -> Client:
-    return create_client(SUPABASE_URL, SUPABASE_KEY)
-
-async def get_current_user(authorization: Optional[str] = Header(None)):
+app.add_middleware(metrics.MetricsMiddleware)
+if tracing.TRACE_FILE:
+    app.add_middleware(tracing.TracingMiddleware)
+app.add_middleware(profiler.ProfilerMiddleware)
+metrics.gauge("mcp_stream_subscribers", "Open /mcp/stream connections.", bus.subscriber_count)
+metrics.gauge("mcp_sla_pending_deadlines", "Tickets with an SLA deadline the scheduler is waiting on.", sla_scheduler.pending_count)
+
+@app.on_event("startup")
+async def open_data_layer():
+    try:
+        await get_db()
+    except Exception as e:
+        print(f"Data layer init error: {e}")
+    start_key_refresh()
+    counters.start_counters()
+    start_leaderboard()
+    jobs.start_jobs()
+    sla_scheduler.start_sla_scheduler(warn_sla_breach, escalate_sla_breach)
+
+@app.on_event("shutdown")
+async def close_data_layer():
+    await sla_scheduler.stop_sla_scheduler()
+    await jobs.stop_jobs()
+    await stop_key_refresh()
+    await counters.stop_counters()
+    await stop_leaderboard()
+    await close_db()
+
+def get_bearer_token(authorization: Optional[str] = Header(None)) -> Optional[str]:
     if not authorization or not authorization.startswith("Bearer "):
         return None
-    token = authorization.replace("Bearer ", "")
-    try:
-        supabase = get_supabase()
-        user = supabase.auth.get_user(token)
-        return user.user if user else None
-    except Exception:
+    return authorization.replace("Bearer ", "")
+
+async def get_current_user(token: Optional[str] = Depends(get_bearer_token)):
+    if not token:
         return None
+    return await verify_token(token)
 
-def get_user_organization_id(user_id: str) -> Optional[str]:
-    """Get the organization_id for a user from their profile"""
-    if not user_id:
+async def get_principal(user = Depends(get_current_user)) -> Optional[Principal]:
+    """Caller's profile context, loaded once per request"""
+    if not user:
         return None
-    try:
-        supabase = get_supabase()
-        result = supabase.table("profiles").select("organization_id").eq("user_id", user_id).execute()
-        if result.data and result.data[0].get("organization_id"):
-            return result.data[0]["organization_id"]
-    except Exception as e:
-        print(f"Get org_id error: {e}")
-    return None
+    return await load_principal(user)
+
+def require_org(principal: Optional[Principal], roles=ADMIN_ROLES, detail: str = "Admin or Manager role required") -> str:
+    """Return the caller's org_id, enforcing authentication, membership and role"""
+    if not principal:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    if not principal.org_id:
+        raise HTTPException(status_code=404, detail="No organization found")
+    if roles and principal.role not in roles:
+        raise HTTPException(status_code=403, detail=detail)
+    return principal.org_id
+
+def require_operator(authorization: Optional[str] = Header(None)):
+    """Process-wide diagnostics span every org, so they take the operator's
+    METRICS_TOKEN rather than an org role; they are off when it is unset"""
+    if not metrics.METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Operator endpoints are disabled; set METRICS_TOKEN")
+    if authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid operator token")
 
 class ActivityCreate(BaseModel):
     type: str
     content: str
 
+class BulkTicketAction(BaseModel):
+    action: str
+    ticketIds: List[str]
+    comment: Optional[ActivityCreate] = None
+
 class PostCreate(BaseModel):
     title: Optional[str] = None
     content: str
@@ -91,6 +160,15 @@ class SlaPolicyCreate(BaseModel):
     responseTimeMinutes: int
     resolutionTimeMinutes: int
     isDefault: bool = False
+    businessHours: Optional[dict] = None
+
+class SlaPolicyUpdate(BaseModel):
+    name: Optional[str] = None
+    priority: Optional[str] = None
+    responseTimeMinutes: Optional[int] = None
+    resolutionTimeMinutes: Optional[int] = None
+    isDefault: Optional[bool] = None
+    businessHours: Optional[dict] = None
 
 class CategoryCreate(BaseModel):
     name: str
@@ -127,6 +205,25 @@ class CategoryUpdate(BaseModel):
     isActive: Optional[bool] = None
     bonusPoints: Optional[int] = None
 
+def db_to_agent_stats(stats: Optional[dict], rank: Optional[int] = None) -> dict:
+    if not stats:
+        return {
+            "streak": 0,
+            "coins": 0,
+            "ticketsResolved": 0,
+            "ticketsAssigned": 0,
+            "avgResponseTime": "0m",
+            "rank": 0
+        }
+    return {
+        "streak": stats.get("streak", 0),
+        "coins": stats.get("coins", 0),
+        "ticketsResolved": stats.get("tickets_resolved", 0),
+        "ticketsAssigned": stats.get("tickets_assigned", 0),
+        "avgResponseTime": "0m",
+        "rank": rank or 0
+    }
+
 def db_to_ticket(row: dict) -> dict:
     return {
         "id": str(row["id"]),
@@ -148,8 +245,8 @@ def db_to_ticket(row: dict) -> dict:
         "resolvedAt": row.get("resolved_at"),
         "hasBounty": row.get("has_bounty", False),
         "bountyAmount": row.get("bounty_amount", 0),
-        "viewCount": row.get("view_count", 0),
-        "activityCount": row.get("activity_count", 0)
+        "viewCount": counters.current("tickets", "view_count", row),
+        "activityCount": counters.current("tickets", "activity_count", row)
     }
 
 def db_to_activity(row: dict) -> dict:
@@ -199,7 +296,8 @@ def db_to_sla_policy(row: dict) -> dict:
         "priority": row["priority"],
         "responseTimeMinutes": row["response_time_minutes"],
         "resolutionTimeMinutes": row["resolution_time_minutes"],
-        "isDefault": row.get("is_default", False)
+        "isDefault": row.get("is_default", False),
+        "businessHours": row.get("business_hours")
     }
 
 def db_to_category(row: dict) -> dict:
@@ -213,6 +311,17 @@ def db_to_category(row: dict) -> dict:
         "bonusPoints": row.get("bonus_points", 0)
     }
 
+def db_to_priority_config(row: dict) -> dict:
+    return {
+        "id": str(row["id"]),
+        "name": row.get("name", ""),
+        "level": row.get("level", 0),
+        "color": row.get("color", "#gray"),
+        "basePoints": row.get("base_points", 25),
+        "responseTimeMinutes": row.get("response_time_minutes", 60),
+        "resolutionTimeMinutes": row.get("resolution_time_minutes", 480),
+    }
+
 def db_to_post(row: dict) -> dict:
     return {
         "id": str(row["id"]),
@@ -222,8 +331,8 @@ def db_to_post(row: dict) -> dict:
         "title": row.get("title"),
         "content": row["content"],
         "imageUrl": row.get("image_url"),
-        "likesCount": row.get("likes_count", 0),
-        "commentsCount": row.get("comments_count", 0),
+        "likesCount": counters.current("posts", "likes_count", row),
+        "commentsCount": counters.current("posts", "comments_count", row),
         "createdAt": row["created_at"],
         "updatedAt": row["updated_at"],
         "type": "post"
@@ -241,15 +350,24 @@ def db_to_comment(row: dict) -> dict:
     }
 
 @app.post("/mcp/tickets")
-async def create_ticket(ticket: TicketCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else "anonymous"
-    user_email = user.email if user else "Anonymous User"
-    org_id = get_user_organization_id(user_id) if user else None
+async def create_ticket(ticket: TicketCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else "anonymous"
+    user_email = principal.email if principal else "Anonymous User"
+    org_id = principal.org_id if principal else None
     
     now = datetime.utcnow()
-    sla_hours = {"critical": 2, "high": 4, "medium": 8, "low": 24}
-    sla_deadline = now + timedelta(hours=sla_hours.get(ticket.priority, 8))
+    policy = None
+    if org_id:
+        try:
+            policy = (await org_config.get_org_config(db, org_id)).sla_policy(ticket.priority)
+        except Exception as e:
+            print(f"Get org config error: {e}")
+    try:
+        sla_deadline = sla.deadline(policy, ticket.priority, now)
+    except ValueError as e:
+        print(f"SLA deadline error: {e}")
+        sla_deadline = sla.deadline(None, ticket.priority, now)
     
     new_ticket = {
         "title": ticket.title,
@@ -268,19 +386,25 @@ async def create_ticket(ticket: TicketCreate, user = Depends(get_current_user)):
     if org_id:
         new_ticket["organization_id"] = org_id
     
-    result = supabase.table("tickets").insert(new_ticket).execute()
+    result = await execute(db.table("tickets").insert(new_ticket))
     if result.data:
+        sla_scheduler.track(str(result.data[0]["id"]), result.data[0].get("sla_deadline"))
         return db_to_ticket(result.data[0])
     raise HTTPException(status_code=500, detail="Failed to create ticket")
 
 @app.get("/mcp/tickets/feed")
-async def get_feed(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_feed(
+    response: Response,
+    limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    principal = Depends(get_principal)
+):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
+    after = decode_cursor(cursor)
     
     try:
-        query = supabase.table("tickets")\
+        query = db.table("tickets")\
             .select("*")\
             .eq("status", "open")\
             .is_("assignee_id", "null")
@@ -288,12 +412,30 @@ async def get_feed(user = Depends(get_current_user)):
         if org_id:
             query = query.eq("organization_id", org_id)
         
-        result = query.execute()
+        if after:
+            query = query.or_(keyset_filter([
+                ("priority_rank", after["r"], False),
+                ("sla_deadline", after["d"], False),
+                ("id", after["i"], False),
+            ]))
         
-        tickets = [db_to_ticket(row) for row in result.data]
-        priority_order = {"critical": 0, "high": 1, "medium": 2, "low": 3}
-        tickets.sort(key=lambda x: (priority_order.get(x["priority"], 4), x["slaDeadline"]))
-        return tickets
+        # Served in index order (see idx_tickets_feed in setup_db.py)
+        query = query.order("priority_rank")\
+            .order("sla_deadline")\
+            .order("id")\
+            .limit(limit + 1)
+        
+        result = await execute(query)
+        
+        rows = result.data[:limit]
+        if len(result.data) > limit:
+            last = rows[-1]
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor({
+                "r": last["priority_rank"],
+                "d": last["sla_deadline"],
+                "i": str(last["id"]),
+            })
+        return [db_to_ticket(row) for row in rows]
     except Exception as e:
         print(f"Feed error: {e}")
         return []
@@ -305,13 +447,13 @@ async def get_queue(
     search: Optional[str] = None,
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc",
-    user = Depends(get_current_user)
+    principal = Depends(get_principal)
 ):
-    supabase = get_supabase()
-    user_id = user.id if user else "default"
-    org_id = get_user_organization_id(user_id) if user else None
+    db = await get_db()
+    user_id = principal.user_id if principal else "default"
+    org_id = principal.org_id if principal else None
     
-    query = supabase.table("tickets")\
+    query = db.table("tickets")\
         .select("*")\
         .eq("assignee_id", user_id)\
         .in_("status", ["assigned", "in_progress"])
@@ -326,23 +468,23 @@ async def get_queue(
         query = query.eq("category", category)
     
     if search:
-        query = query.or_(f"title.ilike.%{search}%,description.ilike.%{search}%")
+        query = matches(query, search)
     
     if sort_by in ["created_at", "priority", "sla_deadline", "title"]:
         query = query.order(sort_by, desc=(sort_order == "desc"))
     else:
         query = query.order("created_at", desc=True)
     
-    result = query.execute()
+    result = await execute(query)
     return [db_to_ticket(row) for row in result.data]
 
 @app.get("/mcp/tickets/resolved")
-async def get_resolved(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else "default"
-    org_id = get_user_organization_id(user_id) if user else None
+async def get_resolved(principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else "default"
+    org_id = principal.org_id if principal else None
     
-    query = supabase.table("tickets")\
+    query = db.table("tickets")\
         .select("*")\
         .eq("assignee_id", user_id)\
         .eq("status", "resolved")\
@@ -351,211 +493,184 @@ async def get_resolved(user = Depends(get_current_user)):
     if org_id:
         query = query.eq("organization_id", org_id)
     
-    result = query.execute()
+    result = await execute(query)
     return [db_to_ticket(row) for row in result.data]
 
 @app.get("/mcp/tickets/escalated")
-async def get_escalated(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_escalated(principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
     
-    query = supabase.table("tickets")\
+    query = db.table("tickets")\
         .select("*")\
         .eq("status", "escalated")
     
     if org_id:
         query = query.eq("organization_id", org_id)
     
-    result = query.execute()
+    result = await execute(query)
     return [db_to_ticket(row) for row in result.data]
 
 @app.post("/mcp/tickets/{ticket_id}/assign")
-async def assign_ticket(ticket_id: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    
-    ticket_result = supabase.table("tickets").select("*").eq("id", ticket_id).execute()
-    if not ticket_result.data:
-        raise HTTPException(status_code=404, detail="Ticket not found")
-    
-    user_id = user.id if user else "default"
-    user_name = user.email if user else "Agent Mike"
-    
-    update_result = supabase.table("tickets")\
-        .update({
-            "assignee_id": user_id,
-            "assignee_name": user_name,
-            "status": "assigned",
-            "updated_at": datetime.utcnow().isoformat()
-        })\
-        .eq("id", ticket_id)\
-        .execute()
-    
-    org_id = get_user_organization_id(user_id) if user else None
-    
-    stats_result = supabase.table("agent_stats").select("*").eq("agent_id", user_id).execute()
-    if stats_result.data:
-        current_stats = stats_result.data[0]
-        update_stats = {
-            "tickets_assigned": current_stats["tickets_assigned"] + 1,
-            "updated_at": datetime.utcnow().isoformat()
-        }
-        if org_id and not current_stats.get("organization_id"):
-            update_stats["organization_id"] = org_id
-        supabase.table("agent_stats")\
-            .update(update_stats)\
-            .eq("agent_id", user_id)\
-            .execute()
-    else:
-        new_stats = {
-            "agent_id": user_id,
-            "agent_name": user_name,
-            "tickets_assigned": 1,
-            "tickets_resolved": 0,
-            "streak": 0,
-            "coins": 0
-        }
-        if org_id:
-            new_stats["organization_id"] = org_id
-        supabase.table("agent_stats").insert(new_stats).execute()
+async def assign_ticket(ticket_id: str, principal = Depends(get_principal)):
+    db = await get_db()
     
-    if update_result.data:
-        return db_to_ticket(update_result.data[0])
-    raise HTTPException(status_code=500, detail="Failed to assign ticket")
-
-@app.post("/mcp/tickets/{ticket_id}/resolve")
-async def resolve_ticket(ticket_id: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
+    user_id = principal.user_id if principal else "default"
+    user_name = principal.email if principal else "Agent Mike"
+    org_id = principal.org_id if principal else None
     
-    ticket_result = supabase.table("tickets").select("*").eq("id", ticket_id).execute()
-    if not ticket_result.data:
+    try:
+        outcome = await assign_ticket_tx(db, ticket_id, user_id, user_name, org_id)
+    except Exception as e:
+        print(f"Assign ticket error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to assign ticket")
+    if not outcome:
         raise HTTPException(status_code=404, detail="Ticket not found")
+    if outcome.get("conflict"):
+        current = outcome["ticket"]
+        raise HTTPException(status_code=409, detail={
+            "message": "Ticket already claimed",
+            "status": current.get("status"),
+            "assigneeId": current.get("assignee_id"),
+            "assigneeName": current.get("assignee_name")
+        })
     
-    ticket = ticket_result.data[0]
-    user_id = user.id if user else "default"
-    user_name = user.email if user else "Agent Mike"
-    now = datetime.utcnow().isoformat()
-    
-    update_data = {
-        "status": "resolved",
-        "resolved_at": now,
-        "updated_at": now
+    leaderboard.update(outcome.get("stats"))
+    ticket = db_to_ticket(outcome["ticket"])
+    bus.publish(outcome["ticket"].get("organization_id") or org_id, "ticket.assigned", ticket)
+    return {
+        **ticket,
+        "agentStats": db_to_agent_stats(outcome.get("stats"), leaderboard.rank(user_id))
     }
-    if not ticket.get("assignee_id"):
-        update_data["assignee_id"] = user_id
-        update_data["assignee_name"] = user_name
-    
-    update_result = supabase.table("tickets")\
-        .update(update_data)\
-        .eq("id", ticket_id)\
-        .execute()
+
+@app.post("/mcp/tickets/{ticket_id}/resolve")
+async def resolve_ticket(ticket_id: str, principal = Depends(get_principal)):
+    db = await get_db()
     
-    bounty_coins = ticket.get("bounty_amount", 0) if ticket.get("has_bounty") else 0
-    org_id = get_user_organization_id(user_id) if user else None
+    user_id = principal.user_id if principal else "default"
+    user_name = principal.email if principal else "Agent Mike"
+    user_avatar = principal.avatar_url if principal else None
+    org_id = principal.org_id if principal else None
     
-    base_points = 25
-    ticket_priority = ticket.get("priority", "medium")
+    priority_points = None
     if org_id:
         try:
-            priority_result = supabase.table("priority_configs")\
-                .select("base_points")\
-                .eq("organization_id", org_id)\
-                .ilike("name", ticket_priority)\
-                .execute()
-            if priority_result.data:
-                base_points = priority_result.data[0].get("base_points", 25)
+            priority_points = (await org_config.get_org_config(db, org_id)).priority_points()
         except Exception as e:
-            print(f"Get priority config error: {e}")
-    
-    stats_result = supabase.table("agent_stats").select("*").eq("agent_id", user_id).execute()
-    if stats_result.data:
-        current_stats = stats_result.data[0]
-        update_stats = {
-            "tickets_resolved": current_stats["tickets_resolved"] + 1,
-            "streak": current_stats["streak"] + 1,
-            "coins": current_stats["coins"] + base_points + bounty_coins,
-            "updated_at": now
-        }
-        if org_id and not current_stats.get("organization_id"):
-            update_stats["organization_id"] = org_id
-        supabase.table("agent_stats")\
-            .update(update_stats)\
-            .eq("agent_id", user_id)\
-            .execute()
-    else:
-        new_stats = {
-            "agent_id": user_id,
-            "agent_name": user_name,
-            "tickets_assigned": 0,
-            "tickets_resolved": 1,
-            "streak": 1,
-            "coins": base_points + bounty_coins
-        }
-        if org_id:
-            new_stats["organization_id"] = org_id
-        supabase.table("agent_stats").insert(new_stats).execute()
+            print(f"Get org config error: {e}")
     
-    if update_result.data:
-        total_points = base_points + bounty_coins
-        profile = None
-        try:
-            profile_result = supabase.table("profiles").select("avatar_url").eq("user_id", user_id).execute()
-            if profile_result.data:
-                profile = profile_result.data[0]
-        except:
-            pass
-        user_avatar = profile.get("avatar_url") if profile else None
-        create_activity_event(
-            supabase,
-            event_type="ticket_resolved",
-            user_id=user_id,
-            user_name=user_name.split('@')[0] if '@' in user_name else user_name,
-            user_avatar=user_avatar,
-            org_id=org_id,
-            message=f"resolved a ticket and earned {total_points} points",
-            metadata={"points": total_points, "ticketId": ticket_id, "ticketTitle": ticket.get("title", "")}
-        )
-        return db_to_ticket(update_result.data[0])
-    raise HTTPException(status_code=500, detail="Failed to resolve ticket")
+    try:
+        outcome = await resolve_ticket_tx(db, ticket_id, user_id, user_name, user_avatar, org_id, priority_points)
+    except Exception as e:
+        print(f"Resolve ticket error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to resolve ticket")
+    if not outcome:
+        raise HTTPException(status_code=404, detail="Ticket not found")
+    if outcome.get("conflict"):
+        current = outcome["ticket"]
+        raise HTTPException(status_code=409, detail={
+            "message": "Ticket already resolved",
+            "status": current.get("status"),
+            "assigneeId": current.get("assignee_id"),
+            "assigneeName": current.get("assignee_name")
+        })
+    
+    leaderboard.update(outcome.get("stats"))
+    invalidate_windows(org_id)
+    sla_scheduler.untrack(ticket_id)
+    ticket = db_to_ticket(outcome["ticket"])
+    bus.publish(outcome["ticket"].get("organization_id") or org_id, "ticket.resolved", ticket)
+    if outcome.get("event"):
+        bus.publish(org_id, "activity", db_to_activity_event(outcome["event"]))
+    return {
+        **ticket,
+        "agentStats": db_to_agent_stats(outcome.get("stats"), leaderboard.rank(user_id)),
+        "pointsEarned": outcome.get("points", 0)
+    }
 
 @app.post("/mcp/tickets/{ticket_id}/escalate")
 async def escalate_ticket(ticket_id: str):
-    supabase = get_supabase()
+    db = await get_db()
     
-    ticket_result = supabase.table("tickets").select("*").eq("id", ticket_id).execute()
+    ticket_result = await execute(db.table("tickets").select("*").eq("id", ticket_id))
     if not ticket_result.data:
         raise HTTPException(status_code=404, detail="Ticket not found")
     
-    update_result = supabase.table("tickets")\
+    ticket = await escalate(db, ticket_id)
+    if ticket:
+        return ticket
+    raise HTTPException(status_code=409, detail={
+        "message": "Ticket is not open for escalation",
+        "status": ticket_result.data[0].get("status")
+    })
+
+async def escalate_tickets(db, ticket_ids: List[str], org_id: Optional[str] = None,
+                           breached_at: Optional[str] = None) -> List[dict]:
+    """Escalate the listed tickets that are still active (open, assigned or
+    in progress) in one UPDATE, and publish ticket.escalated for each.
+    With breached_at, only tickets whose SLA deadline is at or before that
+    time. Returns the escalated rows."""
+    query = (db.table("tickets")
         .update({
             "status": "escalated",
             "updated_at": datetime.utcnow().isoformat()
-        })\
-        .eq("id", ticket_id)\
-        .execute()
-    
-    if update_result.data:
-        return db_to_ticket(update_result.data[0])
-    raise HTTPException(status_code=500, detail="Failed to escalate ticket")
+        })
+        .in_("id", ticket_ids)
+        .in_("status", sla_scheduler.SLA_ACTIVE_STATUSES))
+    if org_id:
+        query = query.eq("organization_id", org_id)
+    if breached_at:
+        query = query.lte("sla_deadline", breached_at)
+    rows = (await execute(query)).data
+    for row in rows:
+        sla_scheduler.untrack(str(row["id"]))
+        bus.publish(row.get("organization_id"), "ticket.escalated", db_to_ticket(row))
+    return rows
+
+async def escalate(db, ticket_id: str, breached_at: Optional[str] = None) -> Optional[dict]:
+    """Escalate one ticket (see escalate_tickets); None if it was not active
+    or, with breached_at, not breached."""
+    rows = await escalate_tickets(db, [ticket_id], breached_at=breached_at)
+    return db_to_ticket(rows[0]) if rows else None
+
+async def escalate_sla_breach(ticket_id: str) -> Optional[str]:
+    """Scheduler breach action. Returns the ticket's current deadline if it
+    was not escalated because it is still active with a later deadline."""
+    db = await get_db()
+    if await escalate(db, ticket_id, breached_at=datetime.utcnow().isoformat()):
+        return None
+    result = await execute(db.table("tickets").select("status, sla_deadline").eq("id", ticket_id))
+    if result.data and result.data[0]["status"] in sla_scheduler.SLA_ACTIVE_STATUSES:
+        return result.data[0].get("sla_deadline")
+    return None
+
+async def warn_sla_breach(ticket_id: str):
+    db = await get_db()
+    result = await execute(db.table("tickets")
+        .select("*")
+        .eq("id", ticket_id)
+        .in_("status", sla_scheduler.SLA_ACTIVE_STATUSES))
+    if result.data:
+        bus.publish(result.data[0].get("organization_id"), "ticket.sla_warning", db_to_ticket(result.data[0]))
 
 @app.get("/mcp/tickets/{ticket_id}/activities")
 async def get_activities(ticket_id: str):
-    supabase = get_supabase()
-    result = supabase.table("activities")\
-        .select("*")\
-        .eq("ticket_id", ticket_id)\
-        .order("created_at")\
-        .execute()
+    db = await get_db()
+    result = await execute(db.table("activities")
+        .select("*")
+        .eq("ticket_id", ticket_id)
+        .order("created_at"))
     
     return [db_to_activity(row) for row in result.data]
 
+@app.post("/mcp/tickets/{ticket_id}/view")
+async def view_ticket(ticket_id: str):
+    await counters.incr("tickets", "view_count", ticket_id)
+    return {"viewed": True}
+
 @app.post("/mcp/tickets/{ticket_id}/activities")
 async def add_activity(ticket_id: str, activity: ActivityCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    
-    ticket_result = supabase.table("tickets").select("*").eq("id", ticket_id).execute()
-    if not ticket_result.data:
-        raise HTTPException(status_code=404, detail="Ticket not found")
+    db = await get_db()
     
     user_id = user.id if user else "default"
     user_name = user.email if user else "Agent Mike"
@@ -568,117 +683,332 @@ async def add_activity(ticket_id: str, activity: ActivityCreate, user = Depends(
         "content": activity.content,
     }
     
-    result = supabase.table("activities").insert(new_activity).execute()
-    
-    ticket = ticket_result.data[0]
-    supabase.table("tickets")\
-        .update({"activity_count": ticket.get("activity_count", 0) + 1})\
-        .eq("id", ticket_id)\
-        .execute()
+    try:
+        result = await execute(db.table("activities").insert(new_activity))
+    except APIError as e:
+        if e.code == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(status_code=404, detail="Ticket not found")
+        raise
     
     if result.data:
+        await counters.incr("tickets", "activity_count", ticket_id)
         return db_to_activity(result.data[0])
     raise HTTPException(status_code=500, detail="Failed to add activity")
 
+def is_uuid(value: str) -> bool:
+    import uuid
+    try:
+        uuid.UUID(value)
+        return True
+    except ValueError:
+        return False
+
+async def bulk_comment(db, ticket_ids: List[str], org_id: str, user_id: str, user_name: str,
+                       comment: ActivityCreate) -> List[dict]:
+    """Add the same activity to every listed ticket in the org with one insert."""
+    found = await execute(db.table("tickets").select("id").in_("id", ticket_ids).eq("organization_id", org_id))
+    if not found.data:
+        return []
+    await execute(db.table("activities").insert([
+        {
+            "ticket_id": row["id"],
+            "user_id": user_id,
+            "user_name": user_name,
+            "type": comment.type,
+            "content": comment.content,
+        }
+        for row in found.data
+    ]))
+    await counters.incr_many("tickets", "activity_count", [row["id"] for row in found.data])
+    return found.data
+
+@app.post("/mcp/tickets/bulk")
+async def bulk_ticket_action(data: BulkTicketAction, principal = Depends(get_principal)):
+    """Apply one action to up to BULK_MAX_TICKETS tickets in the caller's org,
+    one set-based write per BULK_CHUNK_SIZE tickets. Every id gets a result:
+    ok, conflict (assign: already claimed), skipped (already resolved, or not
+    open for escalation), not_found, or error when its chunk failed."""
+    db = await get_db()
+    org_id = require_org(principal, roles=None)
+    if data.action not in BULK_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"action must be one of: {', '.join(BULK_ACTIONS)}")
+    if data.action == "comment" and not data.comment:
+        raise HTTPException(status_code=400, detail="comment is required for the comment action")
+    ticket_ids = list(dict.fromkeys(data.ticketIds))
+    if len(ticket_ids) > BULK_MAX_TICKETS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_TICKETS} tickets per request")
+    
+    user_id, user_name, user_avatar = principal.user_id, principal.email, principal.avatar_url
+    priority_points = None
+    if data.action == "resolve":
+        try:
+            priority_points = (await org_config.get_org_config(db, org_id)).priority_points()
+        except Exception as e:
+            print(f"Get org config error: {e}")
+    
+    results = {ticket_id: {"id": ticket_id, "status": "not_found"} for ticket_id in ticket_ids}
+    valid = [ticket_id for ticket_id in ticket_ids if is_uuid(ticket_id)]
+    stats, points, events, done = None, 0, [], []
+    for start in range(0, len(valid), BULK_CHUNK_SIZE):
+        chunk = valid[start:start + BULK_CHUNK_SIZE]
+        try:
+            if data.action == "assign":
+                outcome = await bulk_assign_tickets_tx(db, chunk, user_id, user_name, org_id)
+                rows, stats = outcome["tickets"], outcome.get("stats") or stats
+            elif data.action == "resolve":
+                outcome = await bulk_resolve_tickets_tx(db, chunk, user_id, user_name, user_avatar,
+                                                        org_id, priority_points)
+                rows, stats = outcome["tickets"], outcome.get("stats") or stats
+                points += outcome.get("points") or 0
+                if outcome.get("event"):
+                    events.append(outcome["event"])
+            elif data.action == "escalate":
+                rows = await escalate_tickets(db, chunk, org_id)
+            else:
+                rows = await bulk_comment(db, chunk, org_id, user_id, user_name, data.comment)
+        except Exception as e:
+            print(f"Bulk {data.action} error ({len(chunk)} tickets): {e}")
+            for ticket_id in chunk:
+                results[ticket_id] = {"id": ticket_id, "status": "error", "error": f"Failed to {data.action} ticket"}
+            continue
+        
+        for row in rows:
+            result = {"id": str(row["id"]), "status": "ok"}
+            if row.get("status"):
+                result["ticketStatus"] = row["status"]
+            if row.get("points") is not None:
+                result["points"] = row["points"]
+            results[str(row["id"])] = result
+            done.append(str(row["id"]))
+        missing = [ticket_id for ticket_id in chunk if results[ticket_id]["status"] == "not_found"]
+        if missing and data.action != "comment":
+            try:
+                current = await execute(db.table("tickets")
+                    .select("id, status, assignee_id, assignee_name")
+                    .in_("id", missing)
+                    .eq("organization_id", org_id))
+            except Exception as e:
+                print(f"Bulk {data.action} status error: {e}")
+                continue
+            for row in current.data:
+                result = {"id": str(row["id"]), "status": "conflict" if data.action == "assign" else "skipped",
+                          "ticketStatus": row["status"]}
+                if data.action == "assign":
+                    result["assigneeId"] = row.get("assignee_id")
+                    result["assigneeName"] = row.get("assignee_name")
+                results[str(row["id"])] = result
+    
+    if data.action == "resolve":
+        for ticket_id in done:
+            sla_scheduler.untrack(ticket_id)
+    if stats:
+        leaderboard.update(stats)
+    if data.action == "resolve" and done:
+        invalidate_windows(org_id)
+    for event in events:
+        bus.publish(org_id, "activity", db_to_activity_event(event))
+    if done:
+        bus.publish(org_id, "tickets.bulk", {"action": data.action, "ticketIds": done, "userId": user_id})
+    
+    response = {
+        "action": data.action,
+        "requested": len(ticket_ids),
+        "succeeded": len(done),
+        "results": [results[ticket_id] for ticket_id in ticket_ids],
+    }
+    if data.action == "resolve":
+        response["points"] = points
+    if stats:
+        response["agentStats"] = db_to_agent_stats(stats, leaderboard.rank(user_id))
+    return response
+
+@app.post("/mcp/tickets/import")
+async def import_tickets(
+    request: Request,
+    format: str = Query("ndjson"),
+    importId: Optional[str] = None,
+    principal = Depends(get_principal)
+):
+    """Stream an NDJSON or CSV export into the caller's org (see
+    ticket_import.py). Re-sending the same body with the returned importId
+    resumes after the last checkpointed row."""
+    import uuid
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can import tickets")
+    import_id = importId or str(uuid.uuid4())
+    importer = ticket_import.TicketImport(
+        db, org_id, import_id, format, TicketCreate, principal.user_id, principal.email,
+        source=request.headers.get("x-import-source"),
+        on_progress=lambda checkpoint: bus.publish(org_id, "tickets.import", ticket_import.progress(checkpoint)),
+    )
+    try:
+        checkpoint = await importer.open()
+    except ValueError as e:
+        raise HTTPException(status_code=409 if importId else 400, detail=str(e))
+    if checkpoint["state"] == "done":
+        return ticket_import.progress(checkpoint)
+    try:
+        return ticket_import.progress(await importer.run(request.stream()))
+    except Exception as e:
+        print(f"Import tickets error: {e}")
+        raise HTTPException(status_code=500, detail={
+            "message": "Import interrupted; resend with this importId to resume",
+            "importId": import_id,
+            "rowsDone": importer.checkpoint.get("rows_done"),
+        })
+
+@app.get("/mcp/tickets/import/{import_id}")
+async def get_ticket_import(import_id: str, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal)
+    result = await execute(db.table("ticket_imports")
+        .select("*")
+        .eq("id", import_id)
+        .eq("organization_id", org_id))
+    if not result.data:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return ticket_import.progress(result.data[0])
+
 @app.get("/mcp/agent/stats")
 async def get_agent_stats(user = Depends(get_current_user)):
-    supabase = get_supabase()
+    db = await get_db()
     user_id = user.id if user else "default"
     
-    result = supabase.table("agent_stats").select("*").eq("agent_id", user_id).execute()
-    
-    if result.data:
-        stats = result.data[0]
-        return {
-            "streak": stats.get("streak", 0),
-            "coins": stats.get("coins", 0),
-            "ticketsResolved": stats.get("tickets_resolved", 0),
-            "ticketsAssigned": stats.get("tickets_assigned", 0),
-            "avgResponseTime": "0m",
-            "rank": 1
-        }
-    
+    if leaderboard.ready:
+        return db_to_agent_stats(leaderboard.get(user_id), leaderboard.rank(user_id))
+    
+    result = await execute(db.table("agent_stats").select("*").eq("agent_id", user_id))
+    if not result.data:
+        return db_to_agent_stats(None)
+    stats = result.data[0]
+    
+    # Index not loaded yet: rank = 1 + agents in the same org with more
+    # tickets resolved (ties share a rank, as in the index).
+    query = (db.table("agent_stats")
+        .select("agent_id", count="exact")
+        .gt("tickets_resolved", stats.get("tickets_resolved") or 0))
+    if stats.get("organization_id"):
+        query = query.eq("organization_id", stats["organization_id"])
+    ahead = await execute(query.limit(1))
+    return db_to_agent_stats(stats, (ahead.count or 0) + 1)
+
+def db_to_leader(row: dict, rank: int) -> dict:
     return {
-        "streak": 0,
-        "coins": 0,
-        "ticketsResolved": 0,
-        "ticketsAssigned": 0,
-        "avgResponseTime": "0m",
-        "rank": 0
+        "id": row["agent_id"],
+        "username": row["agent_name"].split("@")[0] if "@" in row["agent_name"] else row["agent_name"],
+        "displayName": row["agent_name"],
+        "avatar": None,
+        "ticketsResolved": row.get("tickets_resolved", 0),
+        "streak": row.get("streak", 0),
+        "coins": row.get("coins", 0),
+        "rank": rank
     }
 
 @app.get("/mcp/leaderboard")
-async def get_leaderboard(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_leaderboard(
+    limit: int = Query(LEADERBOARD_SIZE, ge=1, le=WINDOW_ROWS),
+    window: str = Query("all", pattern=f"^({'|'.join(WINDOWS)})$"),
+    principal = Depends(get_principal)
+):
+    org_id = principal.org_id if principal else None
+    
+    if window != "all":
+        db = await get_db()
+        return [db_to_leader(row, rank) for rank, row in await windowed_top(db, org_id, window, limit)]
+    
+    if leaderboard.ready:
+        return [db_to_leader(row, rank) for rank, row in leaderboard.top(org_id, limit)]
     
-    query = supabase.table("agent_stats")\
+    db = await get_db()
+    query = db.table("agent_stats")\
         .select("*")\
         .order("tickets_resolved", desc=True)\
-        .limit(20)
+        .limit(limit)
     
     if org_id:
         query = query.eq("organization_id", org_id)
     
-    result = query.execute()
-    
-    leaderboard = []
-    for i, row in enumerate(result.data):
-        leaderboard.append({
-            "id": row["agent_id"],
-            "username": row["agent_name"].split("@")[0] if "@" in row["agent_name"] else row["agent_name"],
-            "displayName": row["agent_name"],
-            "avatar": None,
-            "ticketsResolved": row.get("tickets_resolved", 0),
-            "streak": row.get("streak", 0),
-            "coins": row.get("coins", 0),
-            "rank": i + 1
-        })
+    result = await execute(query)
     
-    return leaderboard
+    return [db_to_leader(row, i + 1) for i, row in enumerate(result.data)]
+
+@app.get("/mcp/leaderboard/around-me")
+async def get_leaderboard_around_me(
+    radius: int = Query(5, ge=0, le=50),
+    user = Depends(get_current_user)
+):
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if not leaderboard.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is loading")
+    
+    return [db_to_leader(row, rank) for rank, row in leaderboard.around(user.id, radius)]
+
+def db_to_feed_ticket(row: dict) -> dict:
+    ticket = db_to_ticket(row)
+    ticket["type"] = "ticket"
+    return ticket
+
+MIXED_FEED_SOURCES = {
+    "ticket": FeedSource(
+        kind="ticket",
+        table="tickets",
+        serialize=db_to_feed_ticket,
+        filters=lambda query: query.eq("status", "open").is_("assignee_id", "null"),
+    ),
+    "post": FeedSource(kind="post", table="posts", serialize=db_to_post),
+}
 
 @app.get("/mcp/feed/mixed")
-async def get_mixed_feed(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_mixed_feed(
+    response: Response,
+    limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    types: str = "ticket,post",
+    principal = Depends(get_principal)
+):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
+    after = decode_cursor(cursor)
+    sources = [MIXED_FEED_SOURCES[t] for t in types.split(",") if t in MIXED_FEED_SOURCES]
     
     try:
-        tickets_query = supabase.table("tickets")\
-            .select("*")\
-            .eq("status", "open")\
-            .is_("assignee_id", "null")
-        
-        if org_id:
-            tickets_query = tickets_query.eq("organization_id", org_id)
-        
-        tickets_result = tickets_query.execute()
-        
-        posts_query = supabase.table("posts")\
-            .select("*")\
-            .order("created_at", desc=True)\
-            .limit(50)
-        
-        if org_id:
-            posts_query = posts_query.eq("organization_id", org_id)
-        
-        posts_result = posts_query.execute()
-        
-        tickets = [db_to_ticket(row) for row in tickets_result.data]
-        for t in tickets:
-            t["type"] = "ticket"
-        
-        posts = [db_to_post(row) for row in posts_result.data]
-        
-        mixed = tickets + posts
-        mixed.sort(key=lambda x: x.get("createdAt", ""), reverse=True)
-        
-        return mixed
+        items, next_cursor = await merged_page(db, sources, org_id, after, limit)
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return items
     except Exception as e:
         print(f"Mixed feed error: {e}")
         return []
 
+SEARCH_SERIALIZERS = {
+    "ticket": db_to_ticket,
+    "activity": db_to_activity,
+    "post": db_to_post,
+}
+
+@app.get("/mcp/search")
+async def search(
+    q: str,
+    types: str = ",".join(SEARCH_KINDS),
+    limit: int = Query(20, ge=1, le=FEED_MAX_PAGE_SIZE),
+    principal = Depends(get_principal)
+):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
+    kinds = [t for t in types.split(",") if t in SEARCH_SERIALIZERS]
+    
+    try:
+        results = await search_content(db, q, org_id, kinds, limit)
+    except Exception as e:
+        print(f"Search error: {e}")
+        raise HTTPException(status_code=500, detail="Search failed")
+    
+    return [
+        {"type": row["kind"], "score": row["rank"], "item": SEARCH_SERIALIZERS[row["kind"]](row["item"])}
+        for row in results
+    ]
+
 class CreateMemberData(BaseModel):
     email: str
     displayName: str
@@ -687,36 +1017,29 @@ class CreateMemberData(BaseModel):
     avatarUrl: Optional[str] = None
 
 @app.get("/mcp/profiles")
-async def get_all_profiles(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_all_profiles(principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
     
     try:
-        query = supabase.table("profiles")\
+        query = db.table("profiles")\
             .select("*")\
             .order("display_name")
         
         if org_id:
             query = query.eq("organization_id", org_id)
         
-        result = query.execute()
+        result = await execute(query)
         return [db_to_profile(row) for row in result.data]
     except Exception as e:
         print(f"Profiles error: {e}")
         return []
 
 @app.post("/mcp/profiles")
-async def create_member(data: CreateMemberData, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    current_user_id = user.id if user else None
-    org_id = get_user_organization_id(current_user_id) if current_user_id else None
-    
-    try:
-        profile = supabase.table("profiles").select("organization_name").eq("user_id", current_user_id).execute()
-        org_name = profile.data[0].get("organization_name") if profile.data else None
-    except:
-        org_name = None
+async def create_member(data: CreateMemberData, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
+    org_name = principal.org_name if principal else None
     
     try:
         import uuid
@@ -733,7 +1056,7 @@ async def create_member(data: CreateMemberData, user = Depends(get_current_user)
         if org_id:
             new_profile["organization_id"] = org_id
             new_profile["organization_name"] = org_name
-        result = supabase.table("profiles").insert(new_profile).execute()
+        result = await execute(db.table("profiles").insert(new_profile))
         if result.data:
             return db_to_profile(result.data[0])
         raise HTTPException(status_code=400, detail="Failed to create member")
@@ -743,9 +1066,9 @@ async def create_member(data: CreateMemberData, user = Depends(get_current_user)
 
 @app.get("/mcp/profiles/{user_id}")
 async def get_profile(user_id: str):
-    supabase = get_supabase()
+    db = await get_db()
     try:
-        result = supabase.table("profiles").select("*").eq("user_id", user_id).execute()
+        result = await execute(db.table("profiles").select("*").eq("user_id", user_id))
         if result.data:
             return db_to_profile(result.data[0])
     except Exception as e:
@@ -754,10 +1077,10 @@ async def get_profile(user_id: str):
 
 @app.get("/mcp/profiles/me")
 async def get_my_profile(user = Depends(get_current_user)):
-    supabase = get_supabase()
+    db = await get_db()
     user_id = user.id if user else "default"
     
-    result = supabase.table("profiles").select("*").eq("user_id", user_id).execute()
+    result = await execute(db.table("profiles").select("*").eq("user_id", user_id))
     
     if result.data:
         return db_to_profile(result.data[0])
@@ -768,7 +1091,8 @@ async def get_my_profile(user = Depends(get_current_user)):
             "email": user.email,
             "display_name": user.email.split("@")[0] if user.email else "User",
         }
-        insert_result = supabase.table("profiles").insert(new_profile).execute()
+        insert_result = await execute(db.table("profiles").insert(new_profile))
+        invalidate_principal(user_id)
         if insert_result.data:
             return db_to_profile(insert_result.data[0])
     
@@ -784,7 +1108,7 @@ async def get_my_profile(user = Depends(get_current_user)):
 
 @app.put("/mcp/profiles/me")
 async def update_my_profile(profile: ProfileUpdate, user = Depends(get_current_user)):
-    supabase = get_supabase()
+    db = await get_db()
     user_id = user.id if user else "default"
     
     update_data = {}
@@ -799,10 +1123,10 @@ async def update_my_profile(profile: ProfileUpdate, user = Depends(get_current_u
     
     if update_data:
         update_data["updated_at"] = datetime.utcnow().isoformat()
-        result = supabase.table("profiles")\
-            .update(update_data)\
-            .eq("user_id", user_id)\
-            .execute()
+        result = await execute(db.table("profiles")
+            .update(update_data)
+            .eq("user_id", user_id))
+        invalidate_principal(user_id)
         
         if result.data:
             return db_to_profile(result.data[0])
@@ -810,29 +1134,28 @@ async def update_my_profile(profile: ProfileUpdate, user = Depends(get_current_u
     raise HTTPException(status_code=400, detail="No updates provided")
 
 @app.get("/mcp/posts")
-async def get_posts(user_id: Optional[str] = None, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    current_user_id = user.id if user else None
-    org_id = get_user_organization_id(current_user_id) if current_user_id else None
+async def get_posts(user_id: Optional[str] = None, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
     
     try:
-        query = supabase.table("posts").select("*")
+        query = db.table("posts").select("*")
         if user_id:
             query = query.eq("user_id", user_id)
         if org_id:
             query = query.eq("organization_id", org_id)
-        result = query.order("created_at", desc=True).limit(50).execute()
+        result = await execute(query.order("created_at", desc=True).limit(50))
         return [db_to_post(row) for row in result.data]
     except Exception as e:
         print(f"Posts error: {e}")
         return []
 
 @app.post("/mcp/posts")
-async def create_post(post: PostCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else "anonymous"
-    user_name = user.email if user else "Anonymous"
-    org_id = get_user_organization_id(user_id) if user else None
+async def create_post(post: PostCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else "anonymous"
+    user_name = principal.email if principal else "Anonymous"
+    org_id = principal.org_id if principal else None
     
     new_post = {
         "user_id": user_id,
@@ -844,19 +1167,11 @@ async def create_post(post: PostCreate, user = Depends(get_current_user)):
     if org_id:
         new_post["organization_id"] = org_id
     
-    result = supabase.table("posts").insert(new_post).execute()
+    result = await execute(db.table("posts").insert(new_post))
     if result.data:
-        profile = None
-        try:
-            profile_result = supabase.table("profiles").select("avatar_url").eq("user_id", user_id).execute()
-            if profile_result.data:
-                profile = profile_result.data[0]
-        except:
-            pass
-        user_avatar = profile.get("avatar_url") if profile else None
+        user_avatar = principal.avatar_url if principal else None
         display_name = user_name.split('@')[0] if '@' in user_name else user_name
-        create_activity_event(
-            supabase,
+        await create_activity_event(
             event_type="post_created",
             user_id=user_id,
             user_name=display_name,
@@ -870,55 +1185,44 @@ async def create_post(post: PostCreate, user = Depends(get_current_user)):
 
 @app.post("/mcp/posts/{post_id}/like")
 async def like_post(post_id: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
+    db = await get_db()
     user_id = user.id if user else "default"
     
-    existing = supabase.table("post_likes")\
-        .select("*")\
-        .eq("post_id", post_id)\
-        .eq("user_id", user_id)\
-        .execute()
-    
-    if existing.data:
-        supabase.table("post_likes")\
-            .delete()\
-            .eq("post_id", post_id)\
-            .eq("user_id", user_id)\
-            .execute()
-        
-        post = supabase.table("posts").select("likes_count").eq("id", post_id).execute()
-        if post.data:
-            new_count = max(0, post.data[0].get("likes_count", 1) - 1)
-            supabase.table("posts").update({"likes_count": new_count}).eq("id", post_id).execute()
-        
+    removed = await execute(db.table("post_likes")
+        .delete()
+        .eq("post_id", post_id)
+        .eq("user_id", user_id))
+    if removed.data:
+        await counters.incr("posts", "likes_count", post_id, -1)
         return {"liked": False}
-    else:
-        supabase.table("post_likes").insert({
+    
+    try:
+        await execute(db.table("post_likes").insert({
             "post_id": post_id,
             "user_id": user_id
-        }).execute()
-        
-        post = supabase.table("posts").select("likes_count").eq("id", post_id).execute()
-        if post.data:
-            new_count = post.data[0].get("likes_count", 0) + 1
-            supabase.table("posts").update({"likes_count": new_count}).eq("id", post_id).execute()
-        
-        return {"liked": True}
+        }))
+    except APIError as e:
+        if e.code == UNIQUE_VIOLATION:
+            return {"liked": True}
+        if e.code == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(status_code=404, detail="Post not found")
+        raise
+    await counters.incr("posts", "likes_count", post_id)
+    return {"liked": True}
 
 @app.get("/mcp/posts/{post_id}/comments")
 async def get_post_comments(post_id: str):
-    supabase = get_supabase()
-    result = supabase.table("post_comments")\
-        .select("*")\
-        .eq("post_id", post_id)\
-        .order("created_at")\
-        .execute()
+    db = await get_db()
+    result = await execute(db.table("post_comments")
+        .select("*")
+        .eq("post_id", post_id)
+        .order("created_at"))
     
     return [db_to_comment(row) for row in result.data]
 
 @app.post("/mcp/posts/{post_id}/comments")
 async def add_post_comment(post_id: str, comment: CommentCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
+    db = await get_db()
     user_id = user.id if user else "anonymous"
     user_name = user.email if user else "Anonymous"
     
@@ -929,32 +1233,28 @@ async def add_post_comment(post_id: str, comment: CommentCreate, user = Depends(
         "content": comment.content,
     }
     
-    result = supabase.table("post_comments").insert(new_comment).execute()
-    
-    post = supabase.table("posts").select("comments_count").eq("id", post_id).execute()
-    if post.data:
-        new_count = post.data[0].get("comments_count", 0) + 1
-        supabase.table("posts").update({"comments_count": new_count}).eq("id", post_id).execute()
+    try:
+        result = await execute(db.table("post_comments").insert(new_comment))
+    except APIError as e:
+        if e.code == FOREIGN_KEY_VIOLATION:
+            raise HTTPException(status_code=404, detail="Post not found")
+        raise
     
     if result.data:
+        await counters.incr("posts", "comments_count", post_id)
         return db_to_comment(result.data[0])
     raise HTTPException(status_code=500, detail="Failed to add comment")
 
 # Organization endpoints for multi-tenancy
 @app.get("/mcp/organizations/my")
-async def get_my_organization(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
+async def get_my_organization(principal = Depends(get_principal)):
+    db = await get_db()
+    if not principal or not principal.org_id:
         return None
     
     try:
-        profile = supabase.table("profiles").select("organization_id").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            return None
-        
-        org_id = profile.data[0]["organization_id"]
-        org = supabase.table("organizations").select("*").eq("id", org_id).execute()
+        org_id = principal.org_id
+        org = await execute(db.table("organizations").select("*").eq("id", org_id))
         if org.data:
             return db_to_organization(org.data[0])
     except Exception as e:
@@ -962,9 +1262,9 @@ async def get_my_organization(user = Depends(get_current_user)):
     return None
 
 @app.post("/mcp/organizations")
-async def create_organization(data: OrganizationCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
+async def create_organization(data: OrganizationCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else None
     if not user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     
@@ -982,51 +1282,33 @@ async def create_organization(data: OrganizationCreate, user = Depends(get_curre
             "created_at": datetime.utcnow().isoformat(),
             "updated_at": datetime.utcnow().isoformat(),
         }
-        result = supabase.table("organizations").insert(new_org).execute()
+        result = await execute(db.table("organizations").insert(new_org))
         
         if result.data:
             org_id = result.data[0]["id"]
             
-            # Check if profile exists, create if not
-            profile_check = supabase.table("profiles").select("user_id").eq("user_id", user_id).execute()
-            if not profile_check.data:
+            if not principal.has_profile:
                 # Create profile with organization
-                supabase.table("profiles").insert({
+                await execute(db.table("profiles").insert({
                     "user_id": user_id,
-                    "email": user.email,
-                    "display_name": user.email.split("@")[0] if user.email else "User",
+                    "email": principal.email,
+                    "display_name": principal.email.split("@")[0] if principal.email else "User",
                     "organization_id": org_id,
                     "organization_name": data.name,
                     "role": "Admin",
                     "created_at": datetime.utcnow().isoformat(),
                     "updated_at": datetime.utcnow().isoformat()
-                }).execute()
+                }))
             else:
                 # Update existing profile
-                supabase.table("profiles").update({
+                await execute(db.table("profiles").update({
                     "organization_id": org_id,
                     "organization_name": data.name,
                     "role": "Admin",
                     "updated_at": datetime.utcnow().isoformat()
-                }).eq("user_id", user_id).execute()
-            
-            # Create default ITSM configuration
-            default_slas = [
-                {"organization_id": org_id, "name": "Critical", "priority": "critical", "response_time_minutes": 15, "resolution_time_minutes": 120, "is_default": True},
-                {"organization_id": org_id, "name": "High", "priority": "high", "response_time_minutes": 60, "resolution_time_minutes": 480, "is_default": True},
-                {"organization_id": org_id, "name": "Medium", "priority": "medium", "response_time_minutes": 240, "resolution_time_minutes": 1440, "is_default": True},
-                {"organization_id": org_id, "name": "Low", "priority": "low", "response_time_minutes": 480, "resolution_time_minutes": 2880, "is_default": True},
-            ]
-            supabase.table("sla_policies").insert(default_slas).execute()
-            
-            default_categories = [
-                {"organization_id": org_id, "name": "Hardware", "icon": "cpu", "is_active": True},
-                {"organization_id": org_id, "name": "Software", "icon": "monitor", "is_active": True},
-                {"organization_id": org_id, "name": "Network", "icon": "wifi", "is_active": True},
-                {"organization_id": org_id, "name": "Access", "icon": "key", "is_active": True},
-                {"organization_id": org_id, "name": "Other", "icon": "help-circle", "is_active": True},
-            ]
-            supabase.table("ticket_categories").insert(default_categories).execute()
+                }).eq("user_id", user_id))
+            invalidate_principal(user_id)
+            await jobs.enqueue("seed_org_config", {"org_id": org_id})
             
             return db_to_organization(result.data[0])
         raise HTTPException(status_code=400, detail="Failed to create organization")
@@ -1035,21 +1317,11 @@ async def create_organization(data: OrganizationCreate, user = Depends(get_curre
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/mcp/organizations/my")
-async def update_organization(data: OrganizationUpdate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def update_organization(data: OrganizationUpdate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal)
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        if profile.data[0].get("role") not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Admin or Manager role required")
-        
-        org_id = profile.data[0]["organization_id"]
         update_data = {"updated_at": datetime.utcnow().isoformat()}
         if data.name:
             update_data["name"] = data.name
@@ -1058,13 +1330,14 @@ async def update_organization(data: OrganizationUpdate, user = Depends(get_curre
         if data.domain is not None:
             update_data["domain"] = data.domain
         
-        result = supabase.table("organizations").update(update_data).eq("id", org_id).execute()
+        result = await execute(db.table("organizations").update(update_data).eq("id", org_id))
         if result.data:
             if data.name:
-                supabase.table("profiles").update({
+                await execute(db.table("profiles").update({
                     "organization_name": data.name,
                     "updated_at": datetime.utcnow().isoformat()
-                }).eq("organization_id", org_id).execute()
+                }).eq("organization_id", org_id))
+                invalidate_org_principals(org_id)
             return db_to_organization(result.data[0])
     except HTTPException:
         raise
@@ -1073,38 +1346,36 @@ async def update_organization(data: OrganizationUpdate, user = Depends(get_curre
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/mcp/organizations/join")
-async def join_organization(slug: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
+async def join_organization(slug: str, principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else None
     if not user_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     
     try:
-        org = supabase.table("organizations").select("*").eq("slug", slug).execute()
+        org = await execute(db.table("organizations").select("*").eq("slug", slug))
         if not org.data:
             raise HTTPException(status_code=404, detail="Organization not found")
         
         org_data = org.data[0]
         
         # Check if there are any existing members in this organization
-        existing_members = supabase.table("profiles").select("user_id").eq("organization_id", org_data["id"]).execute()
+        existing_members = await execute(db.table("profiles").select("user_id").eq("organization_id", org_data["id"]))
         is_first_member = len(existing_members.data) == 0
         role = "Admin" if is_first_member else "Agent"
         
-        # Check if profile exists, create if not
-        profile_check = supabase.table("profiles").select("user_id").eq("user_id", user_id).execute()
-        if not profile_check.data:
+        if not principal.has_profile:
             # Create profile with organization
-            supabase.table("profiles").insert({
+            await execute(db.table("profiles").insert({
                 "user_id": user_id,
-                "email": user.email,
-                "display_name": user.email.split("@")[0] if user.email else "User",
+                "email": principal.email,
+                "display_name": principal.email.split("@")[0] if principal.email else "User",
                 "organization_id": org_data["id"],
                 "organization_name": org_data["name"],
                 "role": role,
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat()
-            }).execute()
+            }))
         else:
             # Update existing profile
             update_data = {
@@ -1115,7 +1386,8 @@ async def join_organization(slug: str, user = Depends(get_current_user)):
             # Only set role to Admin if first member
             if is_first_member:
                 update_data["role"] = "Admin"
-            supabase.table("profiles").update(update_data).eq("user_id", user_id).execute()
+            await execute(db.table("profiles").update(update_data).eq("user_id", user_id))
+        invalidate_principal(user_id)
         
         return db_to_organization(org_data)
     except HTTPException:
@@ -1125,42 +1397,41 @@ async def join_organization(slug: str, user = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail=str(e))
 
 # ITSM Configuration endpoints
+@app.get("/mcp/config")
+async def get_org_config_snapshot(principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, roles=None)
+    
+    config = await org_config.get_org_config(db, org_id)
+    return {
+        "version": config.version,
+        "slaPolicies": [db_to_sla_policy(row) for row in config.sla_policies],
+        "categories": [db_to_category(row) for row in config.categories],
+        "priorities": [db_to_priority_config(row) for row in config.priorities],
+    }
+
 @app.get("/mcp/config/sla-policies")
-async def get_sla_policies(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
+async def get_sla_policies(principal = Depends(get_principal)):
+    db = await get_db()
+    if not principal or not principal.org_id:
         return []
     
     try:
-        profile = supabase.table("profiles").select("organization_id").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            return []
-        
-        org_id = profile.data[0]["organization_id"]
-        result = supabase.table("sla_policies").select("*").eq("organization_id", org_id).execute()
-        return [db_to_sla_policy(row) for row in result.data]
+        config = await org_config.get_org_config(db, principal.org_id)
+        return [db_to_sla_policy(row) for row in config.sla_policies]
     except Exception as e:
         print(f"Get SLA policies error: {e}")
         return []
 
 @app.post("/mcp/config/sla-policies")
-async def create_sla_policy(data: SlaPolicyCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def create_sla_policy(data: SlaPolicyCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal)
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        if profile.data[0].get("role") not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Admin or Manager role required")
-        
-        org_id = profile.data[0]["organization_id"]
         import uuid
+        if data.businessHours:
+            sla.calendar(data.businessHours)
         new_policy = {
             "id": str(uuid.uuid4()),
             "organization_id": org_id,
@@ -1169,10 +1440,13 @@ async def create_sla_policy(data: SlaPolicyCreate, user = Depends(get_current_us
             "response_time_minutes": data.responseTimeMinutes,
             "resolution_time_minutes": data.resolutionTimeMinutes,
             "is_default": data.isDefault,
+            "business_hours": data.businessHours,
         }
-        result = supabase.table("sla_policies").insert(new_policy).execute()
+        result = await execute(db.table("sla_policies").insert(new_policy))
+        org_config.invalidate(org_id)
         if result.data:
-            return db_to_sla_policy(result.data[0])
+            run_id = await sla.start_recompute(org_id, [data.priority])
+            return {**db_to_sla_policy(result.data[0]), "recomputeId": run_id}
         raise HTTPException(status_code=400, detail="Failed to create SLA policy")
     except HTTPException:
         raise
@@ -1180,41 +1454,96 @@ async def create_sla_policy(data: SlaPolicyCreate, user = Depends(get_current_us
         print(f"Create SLA policy error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.put("/mcp/config/sla-policies/{policy_id}")
+async def update_sla_policy(policy_id: str, data: SlaPolicyUpdate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can update SLA policies")
+    
+    try:
+        if not await org_config.owns(db, org_id, "sla_policies", policy_id):
+            raise HTTPException(status_code=403, detail="Not authorized to update this SLA policy")
+        before = next(row for row in (await org_config.get_org_config(db, org_id)).sla_policies
+                      if str(row["id"]) == policy_id)
+        
+        update_data = {}
+        if data.name is not None:
+            update_data["name"] = data.name
+        if data.priority is not None:
+            update_data["priority"] = data.priority
+        if data.responseTimeMinutes is not None:
+            update_data["response_time_minutes"] = data.responseTimeMinutes
+        if data.resolutionTimeMinutes is not None:
+            update_data["resolution_time_minutes"] = data.resolutionTimeMinutes
+        if data.isDefault is not None:
+            update_data["is_default"] = data.isDefault
+        if data.businessHours is not None:
+            # {} clears the calendar: the policy counts around the clock.
+            if data.businessHours:
+                sla.calendar(data.businessHours)
+            update_data["business_hours"] = data.businessHours or None
+        
+        result = await execute(db.table("sla_policies").update(update_data).eq("id", policy_id))
+        org_config.invalidate(org_id)
+        if result.data:
+            run_id = await sla.start_recompute(org_id, [before["priority"], result.data[0]["priority"]])
+            return {**db_to_sla_policy(result.data[0]), "recomputeId": run_id}
+        raise HTTPException(status_code=404, detail="SLA policy not found")
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Update SLA policy error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/mcp/config/sla-policies/{policy_id}")
+async def delete_sla_policy(policy_id: str, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can delete SLA policies")
+    
+    try:
+        if not await org_config.owns(db, org_id, "sla_policies", policy_id):
+            raise HTTPException(status_code=403, detail="Not authorized to delete this SLA policy")
+        before = next(row for row in (await org_config.get_org_config(db, org_id)).sla_policies
+                      if str(row["id"]) == policy_id)
+        
+        await execute(db.table("sla_policies").delete().eq("id", policy_id))
+        org_config.invalidate(org_id)
+        run_id = await sla.start_recompute(org_id, [before["priority"]])
+        return {"success": True, "recomputeId": run_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Delete SLA policy error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/mcp/config/sla-policies/recompute")
+async def recompute_sla_deadlines(principal = Depends(get_principal)):
+    org_id = require_org(principal)
+    return {"recomputeId": await sla.start_recompute(org_id)}
+
+@app.get("/mcp/config/sla-policies/recomputes")
+async def get_sla_recomputes(principal = Depends(get_principal)):
+    org_id = require_org(principal)
+    return sla.runs(org_id)
+
 @app.get("/mcp/config/categories")
-async def get_categories(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
+async def get_categories(principal = Depends(get_principal)):
+    db = await get_db()
+    if not principal or not principal.org_id:
         return []
     
     try:
-        profile = supabase.table("profiles").select("organization_id").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            return []
-        
-        org_id = profile.data[0]["organization_id"]
-        result = supabase.table("ticket_categories").select("*").eq("organization_id", org_id).execute()
-        return [db_to_category(row) for row in result.data]
+        config = await org_config.get_org_config(db, principal.org_id)
+        return [db_to_category(row) for row in config.categories]
     except Exception as e:
         print(f"Get categories error: {e}")
         return []
 
 @app.post("/mcp/config/categories")
-async def create_category(data: CategoryCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def create_category(data: CategoryCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal)
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        if profile.data[0].get("role") not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Admin or Manager role required")
-        
-        org_id = profile.data[0]["organization_id"]
         import uuid
         new_category = {
             "id": str(uuid.uuid4()),
@@ -1224,7 +1553,8 @@ async def create_category(data: CategoryCreate, user = Depends(get_current_user)
             "icon": data.icon,
             "is_active": data.isActive,
         }
-        result = supabase.table("ticket_categories").insert(new_category).execute()
+        result = await execute(db.table("ticket_categories").insert(new_category))
+        org_config.invalidate(org_id)
         if result.data:
             return db_to_category(result.data[0])
         raise HTTPException(status_code=400, detail="Failed to create category")
@@ -1235,48 +1565,24 @@ async def create_category(data: CategoryCreate, user = Depends(get_current_user)
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/mcp/config/priorities")
-async def get_priority_configs(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
+async def get_priority_configs(principal = Depends(get_principal)):
+    db = await get_db()
+    if not principal or not principal.org_id:
         return []
     
     try:
-        profile = supabase.table("profiles").select("organization_id").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            return []
-        
-        org_id = profile.data[0]["organization_id"]
-        result = supabase.table("priority_configs").select("*").eq("organization_id", org_id).order("level").execute()
-        priorities = []
-        for row in result.data:
-            priorities.append({
-                "id": str(row["id"]),
-                "name": row.get("name", ""),
-                "level": row.get("level", 0),
-                "color": row.get("color", "#gray"),
-                "basePoints": row.get("base_points", 25),
-                "responseTimeMinutes": row.get("response_time_minutes", 60),
-                "resolutionTimeMinutes": row.get("resolution_time_minutes", 480),
-            })
-        return priorities
+        config = await org_config.get_org_config(db, principal.org_id)
+        return [db_to_priority_config(row) for row in config.priorities]
     except Exception as e:
         print(f"Get priority configs error: {e}")
         return []
 
 @app.post("/mcp/config/priorities")
-async def create_priority_config(data: PriorityConfigCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def create_priority_config(data: PriorityConfigCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, roles=None)
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        org_id = profile.data[0]["organization_id"]
         import uuid
         new_priority = {
             "id": str(uuid.uuid4()),
@@ -1288,18 +1594,10 @@ async def create_priority_config(data: PriorityConfigCreate, user = Depends(get_
             "response_time_minutes": data.responseTimeMinutes,
             "resolution_time_minutes": data.resolutionTimeMinutes,
         }
-        result = supabase.table("priority_configs").insert(new_priority).execute()
+        result = await execute(db.table("priority_configs").insert(new_priority))
+        org_config.invalidate(org_id)
         if result.data:
-            row = result.data[0]
-            return {
-                "id": str(row["id"]),
-                "name": row.get("name", ""),
-                "level": row.get("level", 0),
-                "color": row.get("color", "#gray"),
-                "basePoints": row.get("base_points", 25),
-                "responseTimeMinutes": row.get("response_time_minutes", 60),
-                "resolutionTimeMinutes": row.get("resolution_time_minutes", 480),
-            }
+            return db_to_priority_config(result.data[0])
         raise HTTPException(status_code=400, detail="Failed to create priority")
     except HTTPException:
         raise
@@ -1308,24 +1606,12 @@ async def create_priority_config(data: PriorityConfigCreate, user = Depends(get_
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/mcp/config/priorities/{priority_id}")
-async def update_priority_config(priority_id: str, data: PriorityConfigUpdate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def update_priority_config(priority_id: str, data: PriorityConfigUpdate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can update priorities")
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        role = profile.data[0].get("role", "Agent")
-        if role not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Only Admin or Manager can update priorities")
-        
-        org_id = profile.data[0]["organization_id"]
-        priority = supabase.table("priority_configs").select("organization_id").eq("id", priority_id).execute()
-        if not priority.data or priority.data[0].get("organization_id") != org_id:
+        if not await org_config.owns(db, org_id, "priorities", priority_id):
             raise HTTPException(status_code=403, detail="Not authorized to update this priority")
         
         update_data = {}
@@ -1342,18 +1628,10 @@ async def update_priority_config(priority_id: str, data: PriorityConfigUpdate, u
         if data.resolutionTimeMinutes is not None:
             update_data["resolution_time_minutes"] = data.resolutionTimeMinutes
         
-        result = supabase.table("priority_configs").update(update_data).eq("id", priority_id).execute()
+        result = await execute(db.table("priority_configs").update(update_data).eq("id", priority_id))
+        org_config.invalidate(org_id)
         if result.data:
-            row = result.data[0]
-            return {
-                "id": str(row["id"]),
-                "name": row.get("name", ""),
-                "level": row.get("level", 0),
-                "color": row.get("color", "#gray"),
-                "basePoints": row.get("base_points", 25),
-                "responseTimeMinutes": row.get("response_time_minutes", 60),
-                "resolutionTimeMinutes": row.get("resolution_time_minutes", 480),
-            }
+            return db_to_priority_config(result.data[0])
         raise HTTPException(status_code=404, detail="Priority not found")
     except HTTPException:
         raise
@@ -1362,27 +1640,16 @@ async def update_priority_config(priority_id: str, data: PriorityConfigUpdate, u
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/mcp/config/priorities/{priority_id}")
-async def delete_priority_config(priority_id: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def delete_priority_config(priority_id: str, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can delete priorities")
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        role = profile.data[0].get("role", "Agent")
-        if role not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Only Admin or Manager can delete priorities")
-        
-        org_id = profile.data[0]["organization_id"]
-        priority = supabase.table("priority_configs").select("organization_id").eq("id", priority_id).execute()
-        if not priority.data or priority.data[0].get("organization_id") != org_id:
+        if not await org_config.owns(db, org_id, "priorities", priority_id):
             raise HTTPException(status_code=403, detail="Not authorized to delete this priority")
         
-        supabase.table("priority_configs").delete().eq("id", priority_id).execute()
+        await execute(db.table("priority_configs").delete().eq("id", priority_id))
+        org_config.invalidate(org_id)
         return {"success": True}
     except HTTPException:
         raise
@@ -1391,24 +1658,12 @@ async def delete_priority_config(priority_id: str, user = Depends(get_current_us
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.put("/mcp/config/categories/{category_id}")
-async def update_category(category_id: str, data: CategoryUpdate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def update_category(category_id: str, data: CategoryUpdate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can update categories")
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        role = profile.data[0].get("role", "Agent")
-        if role not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Only Admin or Manager can update categories")
-        
-        org_id = profile.data[0]["organization_id"]
-        category = supabase.table("ticket_categories").select("organization_id").eq("id", category_id).execute()
-        if not category.data or category.data[0].get("organization_id") != org_id:
+        if not await org_config.owns(db, org_id, "categories", category_id):
             raise HTTPException(status_code=403, detail="Not authorized to update this category")
         
         update_data = {}
@@ -1423,7 +1678,8 @@ async def update_category(category_id: str, data: CategoryUpdate, user = Depends
         if data.bonusPoints is not None:
             update_data["bonus_points"] = data.bonusPoints
         
-        result = supabase.table("ticket_categories").update(update_data).eq("id", category_id).execute()
+        result = await execute(db.table("ticket_categories").update(update_data).eq("id", category_id))
+        org_config.invalidate(org_id)
         if result.data:
             return db_to_category(result.data[0])
         raise HTTPException(status_code=404, detail="Category not found")
@@ -1434,27 +1690,16 @@ async def update_category(category_id: str, data: CategoryUpdate, user = Depends
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.delete("/mcp/config/categories/{category_id}")
-async def delete_category(category_id: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def delete_category(category_id: str, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, detail="Only Admin or Manager can delete categories")
     
     try:
-        profile = supabase.table("profiles").select("organization_id, role").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        role = profile.data[0].get("role", "Agent")
-        if role not in ["Admin", "Manager"]:
-            raise HTTPException(status_code=403, detail="Only Admin or Manager can delete categories")
-        
-        org_id = profile.data[0]["organization_id"]
-        category = supabase.table("ticket_categories").select("organization_id").eq("id", category_id).execute()
-        if not category.data or category.data[0].get("organization_id") != org_id:
+        if not await org_config.owns(db, org_id, "categories", category_id):
             raise HTTPException(status_code=403, detail="Not authorized to delete this category")
         
-        supabase.table("ticket_categories").delete().eq("id", category_id).execute()
+        await execute(db.table("ticket_categories").delete().eq("id", category_id))
+        org_config.invalidate(org_id)
         return {"success": True}
     except HTTPException:
         raise
@@ -1463,16 +1708,15 @@ async def delete_category(category_id: str, user = Depends(get_current_user)):
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/mcp/knowledge/videos")
-async def get_knowledge_videos(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_knowledge_videos(principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
     
     try:
-        query = supabase.table("knowledge_videos").select("*").order("created_at", desc=True)
+        query = db.table("knowledge_videos").select("*").order("created_at", desc=True)
         if org_id:
             query = query.eq("organization_id", org_id)
-        result = query.execute()
+        result = await execute(query)
         
         videos = []
         for row in result.data:
@@ -1497,20 +1741,14 @@ async def get_knowledge_videos(user = Depends(get_current_user)):
         return []
 
 @app.post("/mcp/knowledge/videos")
-async def create_knowledge_video(data: KnowledgeVideoCreate, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Authentication required")
+async def create_knowledge_video(data: KnowledgeVideoCreate, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = require_org(principal, roles=None)
+    user_id = principal.user_id
     
     try:
-        profile = supabase.table("profiles").select("organization_id, display_name, avatar_url").eq("user_id", user_id).execute()
-        if not profile.data or not profile.data[0].get("organization_id"):
-            raise HTTPException(status_code=404, detail="No organization found")
-        
-        org_id = profile.data[0]["organization_id"]
-        author_name = profile.data[0].get("display_name", "Unknown")
-        author_avatar = profile.data[0].get("avatar_url")
+        author_name = principal.display_name or "Unknown"
+        author_avatar = principal.avatar_url
         
         import uuid
         new_video = {
@@ -1528,7 +1766,7 @@ async def create_knowledge_video(data: KnowledgeVideoCreate, user = Depends(get_
             "duration": "0:00",
             "coins_earned": 0,
         }
-        result = supabase.table("knowledge_videos").insert(new_video).execute()
+        result = await execute(db.table("knowledge_videos").insert(new_video))
         if result.data:
             row = result.data[0]
             return {
@@ -1548,10 +1786,10 @@ async def create_knowledge_video(data: KnowledgeVideoCreate, user = Depends(get_
 
 @app.get("/mcp/organizations")
 async def get_all_organizations(user = Depends(get_current_user)):
-    supabase = get_supabase()
+    db = await get_db()
     
     try:
-        result = supabase.table("organizations").select("id, name, slug, logo_url, domain, created_at").order("name").execute()
+        result = await execute(db.table("organizations").select("id, name, slug, logo_url, domain, created_at").order("name"))
         orgs = []
         for row in result.data:
             orgs.append({
@@ -1571,16 +1809,15 @@ class UpdateMemberRole(BaseModel):
     role: str
 
 @app.get("/mcp/organizations/members")
-async def get_organization_members(user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_organization_members(principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
     
     if not org_id:
         return []
     
     try:
-        result = supabase.table("profiles").select("user_id, display_name, avatar_url, role, organization_id, organization_name").eq("organization_id", org_id).execute()
+        result = await execute(db.table("profiles").select("user_id, display_name, avatar_url, role, organization_id, organization_name").eq("organization_id", org_id))
         members = []
         for row in result.data:
             members.append({
@@ -1596,20 +1833,19 @@ async def get_organization_members(user = Depends(get_current_user)):
         return []
 
 @app.put("/mcp/organizations/members/{member_id}/role")
-async def update_member_role(member_id: str, data: UpdateMemberRole, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def update_member_role(member_id: str, data: UpdateMemberRole, principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else None
+    org_id = principal.org_id if principal else None
     
     if not user_id or not org_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     
     try:
-        profile = supabase.table("profiles").select("role, organization_id").eq("user_id", user_id).execute()
-        if not profile.data or profile.data[0].get("role") not in ["Admin", "Manager"]:
+        if principal.role not in ADMIN_ROLES:
             raise HTTPException(status_code=403, detail="Admin or Manager role required")
         
-        target = supabase.table("profiles").select("organization_id").eq("user_id", member_id).execute()
+        target = await execute(db.table("profiles").select("organization_id").eq("user_id", member_id))
         if not target.data or target.data[0].get("organization_id") != org_id:
             raise HTTPException(status_code=404, detail="Member not found in your organization")
         
@@ -1617,7 +1853,8 @@ async def update_member_role(member_id: str, data: UpdateMemberRole, user = Depe
         if data.role not in valid_roles:
             raise HTTPException(status_code=400, detail=f"Invalid role. Must be one of: {', '.join(valid_roles)}")
         
-        supabase.table("profiles").update({"role": data.role}).eq("user_id", member_id).execute()
+        await execute(db.table("profiles").update({"role": data.role}).eq("user_id", member_id))
+        invalidate_principal(member_id)
         return {"success": True, "message": f"Role updated to {data.role}"}
     except HTTPException:
         raise
@@ -1626,31 +1863,31 @@ async def update_member_role(member_id: str, data: UpdateMemberRole, user = Depe
         raise HTTPException(status_code=500, detail="Failed to update role")
 
 @app.delete("/mcp/organizations/members/{member_id}")
-async def remove_member_from_org(member_id: str, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def remove_member_from_org(member_id: str, principal = Depends(get_principal)):
+    db = await get_db()
+    user_id = principal.user_id if principal else None
+    org_id = principal.org_id if principal else None
     
     if not user_id or not org_id:
         raise HTTPException(status_code=401, detail="Authentication required")
     
     try:
-        profile = supabase.table("profiles").select("role").eq("user_id", user_id).execute()
-        if not profile.data or profile.data[0].get("role") not in ["Admin"]:
+        if principal.role not in ["Admin"]:
             raise HTTPException(status_code=403, detail="Admin role required to remove members")
         
         if member_id == user_id:
             raise HTTPException(status_code=400, detail="Cannot remove yourself from the organization")
         
-        target = supabase.table("profiles").select("organization_id").eq("user_id", member_id).execute()
+        target = await execute(db.table("profiles").select("organization_id").eq("user_id", member_id))
         if not target.data or target.data[0].get("organization_id") != org_id:
             raise HTTPException(status_code=404, detail="Member not found in your organization")
         
-        supabase.table("profiles").update({
+        await execute(db.table("profiles").update({
             "organization_id": None,
             "organization_name": None,
             "role": "Agent"
-        }).eq("user_id", member_id).execute()
+        }).eq("user_id", member_id))
+        invalidate_principal(member_id)
         return {"success": True, "message": "Member removed from organization"}
     except HTTPException:
         raise
@@ -1658,52 +1895,197 @@ async def remove_member_from_org(member_id: str, user = Depends(get_current_user
         print(f"Remove member error: {e}")
         raise HTTPException(status_code=500, detail="Failed to remove member")
 
+def db_to_activity_event(row: dict) -> dict:
+    return {
+        "id": str(row["id"]),
+        "type": row.get("event_type", "points_earned"),
+        "userId": row.get("user_id"),
+        "userName": row.get("user_name", "Agent"),
+        "userAvatar": row.get("user_avatar"),
+        "organizationId": row.get("organization_id"),
+        "message": row.get("message", ""),
+        "metadata": row.get("metadata", {}),
+        "createdAt": str(row.get("created_at", ""))
+    }
+
 @app.get("/mcp/activity/events")
-async def get_activity_events(limit: int = 50, user = Depends(get_current_user)):
-    supabase = get_supabase()
-    user_id = user.id if user else None
-    org_id = get_user_organization_id(user_id) if user_id else None
+async def get_activity_events(limit: int = 50, principal = Depends(get_principal)):
+    db = await get_db()
+    org_id = principal.org_id if principal else None
     
     try:
-        query = supabase.table("activity_events").select("*").order("created_at", desc=True).limit(limit)
+        query = db.table("activity_events").select("*").order("created_at", desc=True).limit(limit)
         if org_id:
             query = query.eq("organization_id", org_id)
-        result = query.execute()
+        result = await execute(query)
         
-        events = []
-        for row in result.data:
-            events.append({
-                "id": str(row["id"]),
-                "type": row.get("event_type", "points_earned"),
-                "userId": row.get("user_id"),
-                "userName": row.get("user_name", "Agent"),
-                "userAvatar": row.get("user_avatar"),
-                "organizationId": row.get("organization_id"),
-                "message": row.get("message", ""),
-                "metadata": row.get("metadata", {}),
-                "createdAt": str(row.get("created_at", ""))
-            })
-        return events
+        return [db_to_activity_event(row) for row in result.data]
     except Exception as e:
         print(f"Get activity events error: {e}")
         return []
 
-def create_activity_event(supabase, event_type: str, user_id: str, user_name: str, user_avatar: str, org_id: str, message: str, metadata: dict = None):
+async def create_activity_event(event_type: str, user_id: str, user_name: str, user_avatar: str, org_id: str, message: str, metadata: dict = None):
+    """Queue an activity event; it is written and streamed by insert_activity_events.
+    activity_events.user_id is a UUID, so placeholder ids ("anonymous",
+    "default") are stored as NULL rather than failing the insert."""
     try:
-        event_data = {
+        import uuid
+        await jobs.enqueue("activity_event", {
+            "id": str(uuid.uuid4()),
             "event_type": event_type,
-            "user_id": user_id,
+            "user_id": user_id if user_id and is_uuid(user_id) else None,
             "user_name": user_name,
             "user_avatar": user_avatar,
             "organization_id": org_id,
             "message": message,
             "metadata": metadata or {},
             "created_at": datetime.utcnow().isoformat()
-        }
-        supabase.table("activity_events").insert(event_data).execute()
+        })
     except Exception as e:
         print(f"Create activity event error: {e}")
 
+async def insert_activity_events(events: List[dict]):
+    """Job handler: one insert per batch. If the batch is rejected it falls
+    back to row-by-row inserts: rows that already exist (a retried batch that
+    was partly written) are skipped, and only the rows that still fail are
+    retried, so one bad event cannot take the rest of the batch with it."""
+    db = await get_db()
+    failed = {}
+    try:
+        rows = (await execute(db.table("activity_events").insert(events))).data
+    except APIError:
+        rows = []
+        for index, event in enumerate(events):
+            try:
+                rows.extend((await execute(db.table("activity_events").insert(event))).data)
+            except APIError as e:
+                if e.code != UNIQUE_VIOLATION:
+                    failed[index] = e
+    for row in rows:
+        bus.publish(row.get("organization_id"), "activity", db_to_activity_event(row))
+    if failed:
+        raise jobs.PartialFailure(failed)
+
+DEFAULT_SLA_POLICIES = [
+    {"name": "Critical", "priority": "critical", "response_time_minutes": 15, "resolution_time_minutes": 120, "is_default": True},
+    {"name": "High", "priority": "high", "response_time_minutes": 60, "resolution_time_minutes": 480, "is_default": True},
+    {"name": "Medium", "priority": "medium", "response_time_minutes": 240, "resolution_time_minutes": 1440, "is_default": True},
+    {"name": "Low", "priority": "low", "response_time_minutes": 480, "resolution_time_minutes": 2880, "is_default": True},
+]
+DEFAULT_CATEGORIES = [
+    {"name": "Hardware", "icon": "cpu", "is_active": True},
+    {"name": "Software", "icon": "monitor", "is_active": True},
+    {"name": "Network", "icon": "wifi", "is_active": True},
+    {"name": "Access", "icon": "key", "is_active": True},
+    {"name": "Other", "icon": "help-circle", "is_active": True},
+]
+
+async def seed_org_config(payload: dict):
+    """Job handler: default ITSM configuration for a new organization; skips
+    whatever an earlier attempt already created"""
+    db = await get_db()
+    org_id = payload["org_id"]
+    for table, defaults in (("sla_policies", DEFAULT_SLA_POLICIES), ("ticket_categories", DEFAULT_CATEGORIES)):
+        existing = await execute(db.table(table).select("id").eq("organization_id", org_id).limit(1))
+        if not existing.data:
+            await execute(db.table(table).insert([{"organization_id": org_id, **row} for row in defaults]))
+    org_config.invalidate(org_id)
+
+jobs.register("activity_event", insert_activity_events, batch=True)
+jobs.register("seed_org_config", seed_org_config)
+jobs.register("sla_recompute", sla.recompute)
+
+@app.post("/mcp/auth/logout")
+async def logout(token: Optional[str] = Depends(get_bearer_token), user = Depends(get_current_user)):
+    if not token or not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    revoke_token(token, user)
+    try:
+        db = await get_db()
+        await db.auth.admin.sign_out(token, scope="local")
+    except Exception as e:
+        print(f"Remote sign out error: {e}")
+    return {"success": True}
+
+async def get_stream_principal(
+    access_token: Optional[str] = Query(None),
+    token: Optional[str] = Depends(get_bearer_token)
+):
+    # EventSource cannot send headers, so browsers pass the token in the query.
+    user = await verify_token(token or access_token) if (token or access_token) else None
+    if not user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    return await load_principal(user)
+
+@app.get("/mcp/stream")
+async def stream_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None),
+    principal = Depends(get_stream_principal)
+):
+    resume_from = last_event_id or request.query_params.get("lastEventId")
+    return StreamingResponse(
+        bus.subscribe(principal.org_id, resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/mcp/admin/jobs")
+async def get_jobs(_operator = Depends(require_operator)):
+    """Background job counts by kind and state, and recent dead jobs"""
+    return await jobs.summary()
+
+@app.post("/mcp/admin/jobs/retry-dead")
+async def retry_dead_jobs(_operator = Depends(require_operator)):
+    return {"requeued": await jobs.retry_dead()}
+
+@app.get("/mcp/admin/profile")
+async def profile_server(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    route: Optional[str] = None,
+    format: str = "collapsed",
+    _operator = Depends(require_operator),
+):
+    """Sample the live process; route (e.g. /mcp/tickets/*) limits it to matching requests"""
+    if format not in ("collapsed", "svg"):
+        raise HTTPException(status_code=400, detail="format must be collapsed or svg")
+    try:
+        stacks = await profiler.profile(seconds, interval_ms, route)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if format == "svg":
+        title = f"MCP server profile, {seconds:g}s" + (f", {route}" if route else "")
+        return Response(profiler.render_svg(stacks, title), media_type="image/svg+xml")
+    return PlainTextResponse(profiler.collapsed(stacks))
+
+@app.get("/mcp/admin/slow-queries")
+async def get_slow_queries(
+    group: str = "shape",
+    table: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    _operator = Depends(require_operator),
+):
+    """Recent queries over SLOW_QUERY_MS, grouped by shape or listed newest first"""
+    if group not in ("shape", "none"):
+        raise HTTPException(status_code=400, detail="group must be shape or none")
+    if group == "shape":
+        items = slow_queries.by_shape(table)[:limit]
+    else:
+        items = slow_queries.recent(limit, table)
+    return {**slow_queries.stats(), "items": items}
+
+@app.delete("/mcp/admin/slow-queries")
+async def clear_slow_queries(_operator = Depends(require_operator)):
+    slow_queries.clear()
+    return {"success": True}
+
+@app.get("/mcp/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/mcp/health")
 async def health_check():
     return {"status": "ok", "service": "StreamOps MCP Server"}
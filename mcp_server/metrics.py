@@ -0,0 +1,223 @@
+"""
+Per-request instrumentation for the MCP server, exported in Prometheus
+text format at /mcp/metrics.
+
+MetricsMiddleware times every HTTP request. Through the db query listener it
+also counts the database round trips made while serving the request and how
+long they took, and it records request and response body sizes. Routes are
+labelled by their path template (/mcp/tickets/{ticket_id}/resolve), which
+keeps the number of series bounded.
+
+Each response carries the breakdown in a Server-Timing header, which the
+browser's network panel shows per request:
+
+    Server-Timing: db;dur=4.1;desc="3 queries", app;dur=7.9, total;dur=12.0
+
+An N+1 pattern shows up as a high mcp_http_request_db_calls bucket for its
+route.
+
+Environment:
+    METRICS_TOKEN           when set, /mcp/metrics requires "Bearer <token>"; also the
+                            operator credential for the /mcp/admin diagnostics
+    SERVER_TIMING_ENABLED   "false" drops the Server-Timing header (default true)
+"""
+import contextvars
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Tuple
+
+from db import add_query_listener
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() != "false"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        # labels -> [per-bucket counts (last is +Inf), sum, count]
+        self._series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else _format_number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+REQUESTS = Counter("mcp_http_requests_total", "HTTP requests by route and status.")
+REQUEST_SECONDS = Histogram("mcp_http_request_duration_seconds", "Time to serve a request.", LATENCY_BUCKETS)
+REQUEST_DB_CALLS = Histogram("mcp_http_request_db_calls", "Database round trips per request.", DB_CALL_BUCKETS)
+REQUEST_DB_SECONDS = Histogram("mcp_http_request_db_duration_seconds", "Time per request spent waiting on the database.", LATENCY_BUCKETS)
+REQUEST_BYTES = Histogram("mcp_http_request_size_bytes", "Request body size.", SIZE_BUCKETS)
+RESPONSE_BYTES = Histogram("mcp_http_response_size_bytes", "Response body size.", SIZE_BUCKETS)
+DB_QUERIES = Counter("mcp_db_queries_total", "Database round trips, including background work.")
+DB_QUERY_SECONDS = Histogram("mcp_db_query_duration_seconds", "Duration of a single database round trip.", LATENCY_BUCKETS)
+
+_METRICS = [REQUESTS, REQUEST_SECONDS, REQUEST_DB_CALLS, REQUEST_DB_SECONDS,
+            REQUEST_BYTES, RESPONSE_BYTES, DB_QUERIES, DB_QUERY_SECONDS]
+_gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+
+def gauge(name: str, help_text: str, read: Callable[[], float]):
+    """Export read() as a gauge, sampled on every scrape."""
+    _gauges.append((name, help_text, read))
+
+
+class _RequestStats:
+    __slots__ = ("scope", "db_calls", "db_seconds")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.db_calls = 0
+        self.db_seconds = 0.0
+
+
+_current: contextvars.ContextVar[Optional[_RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def _on_query(query, seconds: float, outcome):
+    DB_QUERIES.inc()
+    DB_QUERY_SECONDS.observe((), seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.db_calls += 1
+        stats.db_seconds += seconds
+
+
+add_query_listener(_on_query)
+
+
+def current_endpoint() -> Optional[str]:
+    """"METHOD /route/template (handler)" for the request being served, if any."""
+    stats = _current.get()
+    if stats is None:
+        return None
+    scope = stats.scope
+    route = getattr(scope.get("route"), "path", None) or scope["path"]
+    handler = getattr(scope.get("endpoint"), "__name__", None)
+    return f"{scope['method']} {route}" + (f" ({handler})" if handler else "")
+
+
+def server_timing(stats: _RequestStats, seconds: float) -> str:
+    db_ms = stats.db_seconds * 1000
+    total_ms = seconds * 1000
+    return (f'db;dur={db_ms:.1f};desc="{stats.db_calls} queries", '
+            f"app;dur={max(total_ms - db_ms, 0):.1f}, total;dur={total_ms:.1f}")
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = _RequestStats(scope)
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+        request_bytes = 0
+        response_bytes = 0
+
+        async def counting_receive():
+            nonlocal request_bytes
+            message = await receive()
+            if message["type"] == "http.request":
+                request_bytes += len(message.get("body", b""))
+            return message
+
+        async def timing_send(message):
+            nonlocal status, response_bytes
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if SERVER_TIMING_ENABLED:
+                    timing = server_timing(stats, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", timing.encode())]}
+            elif message["type"] == "http.response.body":
+                response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, timing_send)
+        finally:
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            labels = (("method", scope["method"]), ("route", route))
+            REQUESTS.inc(labels + (("status", str(status)),))
+            REQUEST_SECONDS.observe(labels, time.perf_counter() - started)
+            REQUEST_DB_CALLS.observe(labels, stats.db_calls)
+            REQUEST_DB_SECONDS.observe(labels, stats.db_seconds)
+            REQUEST_BYTES.observe(labels, request_bytes)
+            RESPONSE_BYTES.observe(labels, response_bytes)
+
+
+def render() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for name, help_text, read in _gauges:
+        try:
+            value = read()
+        except Exception as e:
+            print(f"Metrics gauge error ({name}): {e}")
+            continue
+        lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_format_number(value)}"])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,671 @@
+"""
+Versioned schema migrations.
+
+Migration 1 is the baseline script assembled in setup_db.py; every schema
+change after it is a new Migration appended to MIGRATIONS with an up and,
+where it can be undone, a down script. Applied versions are recorded in
+schema_migrations, and each step runs in one transaction together with its
+bookkeeping row, so a failed step leaves the recorded version unchanged.
+
+    python migrations.py status          applied and pending versions
+    python migrations.py up [--to N]     apply pending migrations
+    python migrations.py down --to N     roll back to version N
+    python migrations.py check           EXPLAIN each endpoint's hot query
+
+DB_BACKEND picks the target. Supabase runs scripts through the exec_sql
+RPC (as setup_db.py always has) and prints them for the SQL editor when
+that fails. A SQLite file is migrated to the latest version whenever the
+server opens it.
+
+`check` runs every ACCESS_PATHS query under EXPLAIN and fails unless the
+plan uses the index that was added for it. On SQLite the plans come from
+the database file itself. For Postgres the EXPLAIN script is printed to run
+in the SQL editor; it sets enable_seqscan off, because a small table is
+always cheaper to scan and would hide whether the index matches the query.
+"""
+import argparse
+import os
+import sys
+from dataclasses import dataclass
+from typing import List, NamedTuple, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from supabase import create_client
+
+from setup_db import COUNTERS_SQL, SUPABASE_KEY, SUPABASE_URL, schema_sql
+
+SCHEMA_MIGRATIONS_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    ALTER TABLE schema_migrations ENABLE ROW LEVEL SECURITY;
+    DROP POLICY IF EXISTS "Allow all on schema_migrations" ON schema_migrations;
+    CREATE POLICY "Allow all on schema_migrations" ON schema_migrations FOR ALL USING (true) WITH CHECK (true);
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    up: str
+    down: Optional[str] = None  # None: cannot be rolled back
+
+
+# One composite index per endpoint access pattern: equality columns first,
+# then the sort key, partial on the status the endpoint reads. They replace
+# the single-column status and assignee indexes, which no hot query could
+# use on its own.
+ACCESS_PATH_INDEXES_UP = """
+    CREATE INDEX IF NOT EXISTS idx_tickets_agent_queue
+        ON tickets(assignee_id, organization_id, status, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_tickets_agent_resolved
+        ON tickets(assignee_id, organization_id, resolved_at DESC)
+        WHERE status = 'resolved';
+    CREATE INDEX IF NOT EXISTS idx_tickets_escalated
+        ON tickets(organization_id, created_at DESC)
+        WHERE status = 'escalated';
+    CREATE INDEX IF NOT EXISTS idx_activities_ticket_created
+        ON activities(ticket_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_agent_stats_org_resolved
+        ON agent_stats(organization_id, tickets_resolved DESC);
+    CREATE INDEX IF NOT EXISTS idx_profiles_org_name
+        ON profiles(organization_id, display_name);
+    CREATE INDEX IF NOT EXISTS idx_knowledge_videos_org_created
+        ON knowledge_videos(organization_id, created_at DESC);
+    CREATE INDEX IF NOT EXISTS idx_sla_policies_org ON sla_policies(organization_id);
+    CREATE INDEX IF NOT EXISTS idx_ticket_categories_org ON ticket_categories(organization_id);
+    CREATE INDEX IF NOT EXISTS idx_priority_configs_org_level ON priority_configs(organization_id, level);
+    DROP INDEX IF EXISTS idx_tickets_status;
+    DROP INDEX IF EXISTS idx_tickets_assignee;
+    DROP INDEX IF EXISTS idx_activities_ticket;
+"""
+
+ACCESS_PATH_INDEXES_DOWN = """
+    CREATE INDEX IF NOT EXISTS idx_tickets_status ON tickets(status);
+    CREATE INDEX IF NOT EXISTS idx_tickets_assignee ON tickets(assignee_id);
+    CREATE INDEX IF NOT EXISTS idx_activities_ticket ON activities(ticket_id);
+    DROP INDEX IF EXISTS idx_tickets_agent_queue;
+    DROP INDEX IF EXISTS idx_tickets_agent_resolved;
+    DROP INDEX IF EXISTS idx_tickets_escalated;
+    DROP INDEX IF EXISTS idx_activities_ticket_created;
+    DROP INDEX IF EXISTS idx_agent_stats_org_resolved;
+    DROP INDEX IF EXISTS idx_profiles_org_name;
+    DROP INDEX IF EXISTS idx_knowledge_videos_org_created;
+    DROP INDEX IF EXISTS idx_sla_policies_org;
+    DROP INDEX IF EXISTS idx_ticket_categories_org;
+    DROP INDEX IF EXISTS idx_priority_configs_org_level;
+"""
+
+# Business-hours calendars on SLA policies, and the bulk deadline write used
+# when a policy change recomputes an org's open tickets (see sla.py).
+SLA_BUSINESS_HOURS_UP = """
+    ALTER TABLE sla_policies ADD COLUMN IF NOT EXISTS business_hours JSONB;
+    CREATE INDEX IF NOT EXISTS idx_tickets_org_priority ON tickets(organization_id, priority, id);
+
+    CREATE OR REPLACE FUNCTION set_sla_deadlines(p_deadlines JSONB) RETURNS INTEGER LANGUAGE plpgsql AS $$
+    DECLARE
+        v_count INTEGER;
+    BEGIN
+        UPDATE tickets AS t SET sla_deadline = d.value::TIMESTAMPTZ
+          FROM jsonb_each_text(p_deadlines) AS d
+         WHERE d.key ~* '^[0-9a-f-]{36}$' AND t.id = d.key::UUID
+           AND t.status IN ('open', 'assigned', 'in_progress');
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        RETURN v_count;
+    END;
+    $$;
+"""
+
+SLA_BUSINESS_HOURS_DOWN = """
+    DROP FUNCTION IF EXISTS set_sla_deadlines(JSONB);
+    DROP INDEX IF EXISTS idx_tickets_org_priority;
+    ALTER TABLE sla_policies DROP COLUMN IF EXISTS business_hours;
+"""
+
+# Set-based counterparts of assign_ticket_tx / resolve_ticket_tx for the
+# bulk ticket endpoint (see transitions.py): one UPDATE for every listed
+# ticket in the org, then one stats increment for all that changed.
+BULK_TICKET_ACTIONS_UP = """
+    CREATE OR REPLACE FUNCTION bulk_assign_tickets(
+        p_ticket_ids UUID[], p_user_id TEXT, p_user_name TEXT, p_org_id UUID
+    ) RETURNS JSONB LANGUAGE plpgsql AS $$
+    DECLARE
+        v_tickets JSONB;
+        v_count INTEGER;
+        v_stats agent_stats;
+    BEGIN
+        WITH claimed AS (
+            UPDATE tickets
+               SET assignee_id = p_user_id, assignee_name = p_user_name,
+                   status = 'assigned', updated_at = NOW()
+             WHERE id = ANY(p_ticket_ids) AND organization_id IS NOT DISTINCT FROM p_org_id
+               AND status = 'open' AND assignee_id IS NULL
+            RETURNING *
+        )
+        SELECT COALESCE(jsonb_agg(to_jsonb(claimed) - 'search_vector'), '[]'::JSONB), COUNT(*)
+          INTO v_tickets, v_count
+          FROM claimed;
+
+        IF v_count > 0 THEN
+            INSERT INTO agent_stats AS s (agent_id, agent_name, tickets_assigned, organization_id)
+            VALUES (p_user_id, p_user_name, v_count, p_org_id)
+            ON CONFLICT (agent_id) DO UPDATE
+               SET tickets_assigned = s.tickets_assigned + v_count,
+                   organization_id = COALESCE(s.organization_id, EXCLUDED.organization_id),
+                   updated_at = NOW()
+            RETURNING * INTO v_stats;
+        END IF;
+
+        RETURN jsonb_build_object('tickets', v_tickets, 'stats', to_jsonb(v_stats));
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION bulk_resolve_tickets(
+        p_ticket_ids UUID[], p_user_id TEXT, p_user_name TEXT, p_user_avatar TEXT, p_org_id UUID,
+        p_priority_points JSONB DEFAULT NULL
+    ) RETURNS JSONB LANGUAGE plpgsql AS $$
+    DECLARE
+        v_tickets JSONB;
+        v_count INTEGER;
+        v_points INTEGER;
+        v_stats agent_stats;
+        v_event activity_events;
+    BEGIN
+        WITH resolved AS (
+            UPDATE tickets
+               SET status = 'resolved', resolved_at = NOW(), updated_at = NOW(),
+                   assignee_name = CASE WHEN assignee_id IS NULL THEN p_user_name ELSE assignee_name END,
+                   assignee_id = COALESCE(assignee_id, p_user_id)
+             WHERE id = ANY(p_ticket_ids) AND organization_id IS NOT DISTINCT FROM p_org_id
+               AND status <> 'resolved'
+            RETURNING *
+        ), scored AS (
+            SELECT r.*, COALESCE((p_priority_points ->> lower(r.priority))::INTEGER, 25)
+                        + CASE WHEN r.has_bounty THEN COALESCE(r.bounty_amount, 0) ELSE 0 END AS points
+              FROM resolved r
+        )
+        SELECT COALESCE(jsonb_agg(to_jsonb(scored) - 'search_vector'), '[]'::JSONB), COUNT(*),
+               COALESCE(SUM(scored.points), 0)
+          INTO v_tickets, v_count, v_points
+          FROM scored;
+
+        IF v_count = 0 THEN
+            RETURN jsonb_build_object('tickets', v_tickets, 'stats', NULL, 'points', 0, 'event', NULL);
+        END IF;
+
+        INSERT INTO agent_stats AS s (agent_id, agent_name, tickets_resolved, streak, coins, organization_id)
+        VALUES (p_user_id, p_user_name, v_count, v_count, v_points, p_org_id)
+        ON CONFLICT (agent_id) DO UPDATE
+           SET tickets_resolved = s.tickets_resolved + v_count,
+               streak = s.streak + v_count,
+               coins = s.coins + v_points,
+               organization_id = COALESCE(s.organization_id, EXCLUDED.organization_id),
+               updated_at = NOW()
+        RETURNING * INTO v_stats;
+
+        INSERT INTO agent_stats_daily AS d (agent_id, organization_id, day, tickets_resolved, coins)
+        VALUES (p_user_id, p_org_id, CURRENT_DATE, v_count, v_points)
+        ON CONFLICT (agent_id, day) DO UPDATE
+           SET tickets_resolved = d.tickets_resolved + v_count,
+               coins = d.coins + v_points,
+               organization_id = COALESCE(EXCLUDED.organization_id, d.organization_id);
+
+        INSERT INTO activity_events (event_type, user_id, user_name, user_avatar, organization_id, message, metadata)
+        VALUES (
+            'tickets_resolved',
+            CASE WHEN p_user_id ~* '^[0-9a-f-]{36}$' THEN p_user_id::UUID END,
+            split_part(p_user_name, '@', 1),
+            p_user_avatar,
+            p_org_id,
+            format('resolved %s tickets and earned %s points', v_count, v_points),
+            jsonb_build_object('points', v_points, 'ticketCount', v_count)
+        )
+        RETURNING * INTO v_event;
+
+        RETURN jsonb_build_object(
+            'tickets', v_tickets, 'stats', to_jsonb(v_stats), 'points', v_points, 'event', to_jsonb(v_event)
+        );
+    END;
+    $$;
+"""
+
+BULK_TICKET_ACTIONS_DOWN = """
+    DROP FUNCTION IF EXISTS bulk_assign_tickets(UUID[], TEXT, TEXT, UUID);
+    DROP FUNCTION IF EXISTS bulk_resolve_tickets(UUID[], TEXT, TEXT, TEXT, UUID, JSONB);
+"""
+
+# Checkpoints for streaming ticket imports (see ticket_import.py).
+TICKET_IMPORTS_UP = """
+    CREATE TABLE IF NOT EXISTS ticket_imports (
+        id TEXT PRIMARY KEY,
+        organization_id UUID NOT NULL REFERENCES organizations(id),
+        format TEXT NOT NULL,
+        source TEXT,
+        state TEXT NOT NULL DEFAULT 'running',
+        columns JSONB,
+        rows_done BIGINT NOT NULL DEFAULT 0,
+        byte_offset BIGINT NOT NULL DEFAULT 0,
+        imported BIGINT NOT NULL DEFAULT 0,
+        duplicates BIGINT NOT NULL DEFAULT 0,
+        failed BIGINT NOT NULL DEFAULT 0,
+        errors JSONB NOT NULL DEFAULT '[]',
+        created_at TIMESTAMPTZ DEFAULT NOW(),
+        updated_at TIMESTAMPTZ DEFAULT NOW()
+    );
+    ALTER TABLE ticket_imports ENABLE ROW LEVEL SECURITY;
+    DROP POLICY IF EXISTS "Allow all on ticket_imports" ON ticket_imports;
+    CREATE POLICY "Allow all on ticket_imports" ON ticket_imports FOR ALL USING (true) WITH CHECK (true);
+"""
+
+TICKET_IMPORTS_DOWN = """
+    DROP TABLE IF EXISTS ticket_imports;
+"""
+
+# resolve_ticket_tx only resolves a ticket that is not resolved yet and
+# reports a conflict otherwise, so a repeated or concurrent resolve earns
+# nothing twice.
+RESOLVE_STATUS_GUARD_UP = """
+    DROP FUNCTION IF EXISTS resolve_ticket_tx(UUID, TEXT, TEXT, TEXT, UUID);
+    CREATE OR REPLACE FUNCTION resolve_ticket_tx(
+        p_ticket_id UUID, p_user_id TEXT, p_user_name TEXT, p_user_avatar TEXT, p_org_id UUID,
+        p_priority_points JSONB DEFAULT NULL
+    ) RETURNS JSONB LANGUAGE plpgsql AS $$
+    DECLARE
+        v_ticket tickets;
+        v_stats agent_stats;
+        v_event activity_events;
+        v_points INTEGER;
+    BEGIN
+        UPDATE tickets
+           SET status = 'resolved', resolved_at = NOW(), updated_at = NOW(),
+               assignee_name = CASE WHEN assignee_id IS NULL THEN p_user_name ELSE assignee_name END,
+               assignee_id = COALESCE(assignee_id, p_user_id)
+         WHERE id = p_ticket_id AND status <> 'resolved'
+        RETURNING * INTO v_ticket;
+        IF NOT FOUND THEN
+            SELECT * INTO v_ticket FROM tickets WHERE id = p_ticket_id;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            RETURN jsonb_build_object('conflict', TRUE, 'ticket', to_jsonb(v_ticket) - 'search_vector');
+        END IF;
+
+        -- Callers pass the org's points table from their config cache; only
+        -- look it up here when they did not.
+        IF p_priority_points IS NOT NULL THEN
+            v_points := (p_priority_points ->> lower(v_ticket.priority))::INTEGER;
+        ELSE
+            SELECT base_points INTO v_points
+              FROM priority_configs
+             WHERE p_org_id IS NOT NULL AND organization_id = p_org_id AND name ILIKE v_ticket.priority
+             LIMIT 1;
+        END IF;
+        v_points := COALESCE(v_points, 25)
+            + CASE WHEN v_ticket.has_bounty THEN COALESCE(v_ticket.bounty_amount, 0) ELSE 0 END;
+
+        INSERT INTO agent_stats AS s (agent_id, agent_name, tickets_resolved, streak, coins, organization_id)
+        VALUES (p_user_id, p_user_name, 1, 1, v_points, p_org_id)
+        ON CONFLICT (agent_id) DO UPDATE
+           SET tickets_resolved = s.tickets_resolved + 1,
+               streak = s.streak + 1,
+               coins = s.coins + v_points,
+               organization_id = COALESCE(s.organization_id, EXCLUDED.organization_id),
+               updated_at = NOW()
+        RETURNING * INTO v_stats;
+
+        INSERT INTO agent_stats_daily AS d (agent_id, organization_id, day, tickets_resolved, coins)
+        VALUES (p_user_id, p_org_id, CURRENT_DATE, 1, v_points)
+        ON CONFLICT (agent_id, day) DO UPDATE
+           SET tickets_resolved = d.tickets_resolved + 1,
+               coins = d.coins + v_points,
+               organization_id = COALESCE(EXCLUDED.organization_id, d.organization_id);
+
+        INSERT INTO activity_events (event_type, user_id, user_name, user_avatar, organization_id, message, metadata)
+        VALUES (
+            'ticket_resolved',
+            CASE WHEN p_user_id ~* '^[0-9a-f-]{36}$' THEN p_user_id::UUID END,
+            split_part(p_user_name, '@', 1),
+            p_user_avatar,
+            p_org_id,
+            format('resolved a ticket and earned %s points', v_points),
+            jsonb_build_object('points', v_points, 'ticketId', v_ticket.id, 'ticketTitle', v_ticket.title)
+        )
+        RETURNING * INTO v_event;
+
+        RETURN jsonb_build_object(
+            'ticket', to_jsonb(v_ticket) - 'search_vector', 'stats', to_jsonb(v_stats),
+            'points', v_points, 'event', to_jsonb(v_event)
+        );
+    END;
+    $$;
+"""
+
+# bulk_resolve_tickets takes points from p_priority_points when the caller
+# has the org's table, else from priority_configs, like resolve_ticket_tx.
+BULK_RESOLVE_POINTS_UP = """
+    CREATE OR REPLACE FUNCTION bulk_resolve_tickets(
+        p_ticket_ids UUID[], p_user_id TEXT, p_user_name TEXT, p_user_avatar TEXT, p_org_id UUID,
+        p_priority_points JSONB DEFAULT NULL
+    ) RETURNS JSONB LANGUAGE plpgsql AS $$
+    DECLARE
+        v_tickets JSONB;
+        v_count INTEGER;
+        v_points INTEGER;
+        v_stats agent_stats;
+        v_event activity_events;
+    BEGIN
+        WITH resolved AS (
+            UPDATE tickets
+               SET status = 'resolved', resolved_at = NOW(), updated_at = NOW(),
+                   assignee_name = CASE WHEN assignee_id IS NULL THEN p_user_name ELSE assignee_name END,
+                   assignee_id = COALESCE(assignee_id, p_user_id)
+             WHERE id = ANY(p_ticket_ids) AND organization_id IS NOT DISTINCT FROM p_org_id
+               AND status <> 'resolved'
+            RETURNING *
+        ), scored AS (
+            SELECT r.*, COALESCE(
+                       CASE WHEN p_priority_points IS NOT NULL
+                            THEN (p_priority_points ->> lower(r.priority))::INTEGER
+                            ELSE (SELECT pc.base_points FROM priority_configs pc
+                                   WHERE p_org_id IS NOT NULL AND pc.organization_id = p_org_id
+                                     AND pc.name ILIKE r.priority
+                                   LIMIT 1)
+                       END, 25)
+                        + CASE WHEN r.has_bounty THEN COALESCE(r.bounty_amount, 0) ELSE 0 END AS points
+              FROM resolved r
+        )
+        SELECT COALESCE(jsonb_agg(to_jsonb(scored) - 'search_vector'), '[]'::JSONB), COUNT(*),
+               COALESCE(SUM(scored.points), 0)
+          INTO v_tickets, v_count, v_points
+          FROM scored;
+
+        IF v_count = 0 THEN
+            RETURN jsonb_build_object('tickets', v_tickets, 'stats', NULL, 'points', 0, 'event', NULL);
+        END IF;
+
+        INSERT INTO agent_stats AS s (agent_id, agent_name, tickets_resolved, streak, coins, organization_id)
+        VALUES (p_user_id, p_user_name, v_count, v_count, v_points, p_org_id)
+        ON CONFLICT (agent_id) DO UPDATE
+           SET tickets_resolved = s.tickets_resolved + v_count,
+               streak = s.streak + v_count,
+               coins = s.coins + v_points,
+               organization_id = COALESCE(s.organization_id, EXCLUDED.organization_id),
+               updated_at = NOW()
+        RETURNING * INTO v_stats;
+
+        INSERT INTO agent_stats_daily AS d (agent_id, organization_id, day, tickets_resolved, coins)
+        VALUES (p_user_id, p_org_id, CURRENT_DATE, v_count, v_points)
+        ON CONFLICT (agent_id, day) DO UPDATE
+           SET tickets_resolved = d.tickets_resolved + v_count,
+               coins = d.coins + v_points,
+               organization_id = COALESCE(EXCLUDED.organization_id, d.organization_id);
+
+        INSERT INTO activity_events (event_type, user_id, user_name, user_avatar, organization_id, message, metadata)
+        VALUES (
+            'tickets_resolved',
+            CASE WHEN p_user_id ~* '^[0-9a-f-]{36}$' THEN p_user_id::UUID END,
+            split_part(p_user_name, '@', 1),
+            p_user_avatar,
+            p_org_id,
+            format('resolved %s tickets and earned %s points', v_count, v_points),
+            jsonb_build_object('points', v_points, 'ticketCount', v_count)
+        )
+        RETURNING * INTO v_event;
+
+        RETURN jsonb_build_object(
+            'tickets', v_tickets, 'stats', to_jsonb(v_stats), 'points', v_points, 'event', to_jsonb(v_event)
+        );
+    END;
+    $$;
+"""
+
+# Down keeps the fixed functions of migrations 6 and 7: the old ones
+# credited repeat resolves and priced bulk resolves differently.
+KEEP_FUNCTIONS_DOWN = """
+"""
+
+# Tickets the SLA scheduler and recompute leave alone: imported tickets
+# that were already past their deadline (see ticket_import.py).
+TICKET_SLA_EXEMPT_UP = """
+    ALTER TABLE tickets ADD COLUMN IF NOT EXISTS sla_exempt BOOLEAN NOT NULL DEFAULT FALSE;
+"""
+
+TICKET_SLA_EXEMPT_DOWN = """
+    ALTER TABLE tickets DROP COLUMN IF EXISTS sla_exempt;
+"""
+
+# reconcile_counters leaves out the deltas the caller still has buffered
+# (p_pending, {"posts.likes_count": {post_id: delta}}), which their next
+# flush applies, and skips rows with a child written in the last
+# p_grace_seconds, whose increments may still sit in another worker's buffer.
+RECONCILE_PENDING_DELTAS_UP = """
+    DROP FUNCTION IF EXISTS reconcile_counters();
+    CREATE OR REPLACE FUNCTION reconcile_counters(
+        p_pending JSONB DEFAULT '{}', p_grace_seconds INTEGER DEFAULT 0
+    ) RETURNS INTEGER LANGUAGE plpgsql AS $$
+    DECLARE
+        v_fixed INTEGER := 0;
+        v_count INTEGER;
+        v_cutoff TIMESTAMPTZ := NOW() - make_interval(secs => p_grace_seconds);
+    BEGIN
+        UPDATE posts t SET likes_count = c.actual
+          FROM (SELECT t2.id, COUNT(l.id)::INTEGER
+                       - COALESCE((p_pending -> 'posts.likes_count' ->> t2.id::TEXT)::INTEGER, 0) AS actual
+                  FROM posts t2 LEFT JOIN post_likes l ON l.post_id = t2.id
+                 GROUP BY t2.id
+                HAVING COALESCE(MAX(l.created_at), '-infinity') < v_cutoff) c
+         WHERE t.id = c.id AND t.likes_count IS DISTINCT FROM c.actual;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_fixed := v_fixed + v_count;
+
+        UPDATE posts t SET comments_count = c.actual
+          FROM (SELECT t2.id, COUNT(pc.id)::INTEGER
+                       - COALESCE((p_pending -> 'posts.comments_count' ->> t2.id::TEXT)::INTEGER, 0) AS actual
+                  FROM posts t2 LEFT JOIN post_comments pc ON pc.post_id = t2.id
+                 GROUP BY t2.id
+                HAVING COALESCE(MAX(pc.created_at), '-infinity') < v_cutoff) c
+         WHERE t.id = c.id AND t.comments_count IS DISTINCT FROM c.actual;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_fixed := v_fixed + v_count;
+
+        UPDATE tickets t SET activity_count = c.actual
+          FROM (SELECT t2.id, COUNT(a.id)::INTEGER
+                       - COALESCE((p_pending -> 'tickets.activity_count' ->> t2.id::TEXT)::INTEGER, 0) AS actual
+                  FROM tickets t2 LEFT JOIN activities a ON a.ticket_id = t2.id
+                 GROUP BY t2.id
+                HAVING COALESCE(MAX(a.created_at), '-infinity') < v_cutoff) c
+         WHERE t.id = c.id AND t.activity_count IS DISTINCT FROM c.actual;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        RETURN v_fixed + v_count;
+    END;
+    $$;
+"""
+
+RECONCILE_PENDING_DELTAS_DOWN = """
+    DROP FUNCTION IF EXISTS reconcile_counters(JSONB, INTEGER);
+""" + COUNTERS_SQL
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", schema_sql()),
+    Migration(2, "access_path_indexes", ACCESS_PATH_INDEXES_UP, ACCESS_PATH_INDEXES_DOWN),
+    Migration(3, "sla_business_hours", SLA_BUSINESS_HOURS_UP, SLA_BUSINESS_HOURS_DOWN),
+    Migration(4, "bulk_ticket_actions", BULK_TICKET_ACTIONS_UP, BULK_TICKET_ACTIONS_DOWN),
+    Migration(5, "ticket_imports", TICKET_IMPORTS_UP, TICKET_IMPORTS_DOWN),
+    Migration(6, "resolve_status_guard", RESOLVE_STATUS_GUARD_UP, KEEP_FUNCTIONS_DOWN),
+    Migration(7, "bulk_resolve_points", BULK_RESOLVE_POINTS_UP, KEEP_FUNCTIONS_DOWN),
+    Migration(8, "ticket_sla_exempt", TICKET_SLA_EXEMPT_UP, TICKET_SLA_EXEMPT_DOWN),
+    Migration(9, "reconcile_pending_deltas", RECONCILE_PENDING_DELTAS_UP, RECONCILE_PENDING_DELTAS_DOWN),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+class AccessPath(NamedTuple):
+    endpoint: str
+    index: str
+    sql: str
+    params: tuple
+
+
+_ORG = "00000000-0000-0000-0000-000000000001"
+_AGENT = "00000000-0000-0000-0000-000000000002"
+_TICKET = "00000000-0000-0000-0000-000000000003"
+
+# The queries behind each endpoint, filtered and ordered the way the app
+# issues them, with ? for the values PostgREST and sqlite bind.
+ACCESS_PATHS = [
+    AccessPath("GET /mcp/tickets/feed", "idx_tickets_feed",
+               "SELECT * FROM tickets WHERE status = ? AND assignee_id IS NULL AND organization_id = ?"
+               " ORDER BY priority_rank, sla_deadline, id LIMIT 26", ("open", _ORG)),
+    AccessPath("GET /mcp/feed/mixed", "idx_tickets_feed_recent",
+               "SELECT * FROM tickets WHERE status = ? AND assignee_id IS NULL AND organization_id = ?"
+               " ORDER BY created_at DESC, id DESC LIMIT 26", ("open", _ORG)),
+    AccessPath("GET /mcp/tickets/queue", "idx_tickets_agent_queue",
+               "SELECT * FROM tickets WHERE assignee_id = ? AND status IN (?, ?) AND organization_id = ?"
+               " ORDER BY created_at DESC", (_AGENT, "assigned", "in_progress", _ORG)),
+    AccessPath("GET /mcp/tickets/resolved", "idx_tickets_agent_resolved",
+               "SELECT * FROM tickets WHERE assignee_id = ? AND status = ? AND organization_id = ?"
+               " ORDER BY resolved_at DESC", (_AGENT, "resolved", _ORG)),
+    AccessPath("GET /mcp/tickets/escalated", "idx_tickets_escalated",
+               "SELECT * FROM tickets WHERE status = ? AND organization_id = ?", ("escalated", _ORG)),
+    AccessPath("GET /mcp/tickets/{ticket_id}/activities", "idx_activities_ticket_created",
+               "SELECT * FROM activities WHERE ticket_id = ? ORDER BY created_at", (_TICKET,)),
+    AccessPath("GET /mcp/activity/events", "idx_activity_events_org_created",
+               "SELECT * FROM activity_events WHERE organization_id = ? ORDER BY created_at DESC LIMIT 50", (_ORG,)),
+    AccessPath("GET /mcp/leaderboard", "idx_agent_stats_org_resolved",
+               "SELECT * FROM agent_stats WHERE organization_id = ? ORDER BY tickets_resolved DESC LIMIT 20", (_ORG,)),
+    AccessPath("GET /mcp/profiles", "idx_profiles_org_name",
+               "SELECT * FROM profiles WHERE organization_id = ? ORDER BY display_name", (_ORG,)),
+    AccessPath("GET /mcp/posts", "idx_posts_org_recent",
+               "SELECT * FROM posts WHERE organization_id = ? ORDER BY created_at DESC LIMIT 50", (_ORG,)),
+    AccessPath("GET /mcp/knowledge/videos", "idx_knowledge_videos_org_created",
+               "SELECT * FROM knowledge_videos WHERE organization_id = ? ORDER BY created_at DESC", (_ORG,)),
+    AccessPath("GET /mcp/config (sla)", "idx_sla_policies_org",
+               "SELECT * FROM sla_policies WHERE organization_id = ?", (_ORG,)),
+    AccessPath("GET /mcp/config (categories)", "idx_ticket_categories_org",
+               "SELECT * FROM ticket_categories WHERE organization_id = ?", (_ORG,)),
+    AccessPath("GET /mcp/config (priorities)", "idx_priority_configs_org_level",
+               "SELECT * FROM priority_configs WHERE organization_id = ? ORDER BY level", (_ORG,)),
+    AccessPath("SLA recompute job", "idx_tickets_org_priority",
+               "SELECT id, priority, created_at, sla_deadline FROM tickets WHERE organization_id = ?"
+               " AND status IN (?, ?, ?) AND sla_exempt = ? AND priority IN (?) AND id > ? ORDER BY id LIMIT 500",
+               (_ORG, "open", "assigned", "in_progress", False, "high", _TICKET)),
+]
+
+
+def plan(applied: List[int], target: Optional[int] = None) -> List[Tuple[str, Migration]]:
+    """The ("up" | "down", migration) steps that bring `applied` to target."""
+    target = LATEST_VERSION if target is None else target
+    if target < 0 or target > LATEST_VERSION:
+        raise ValueError(f"Unknown version {target}; latest is {LATEST_VERSION}")
+    steps = [("up", m) for m in MIGRATIONS if m.version <= target and m.version not in applied]
+    for m in reversed(MIGRATIONS):
+        if m.version > target and m.version in applied:
+            if m.down is None:
+                raise ValueError(f"Migration {m.version} ({m.name}) cannot be rolled back")
+            steps.append(("down", m))
+    return steps
+
+
+def step_sql(direction: str, migration: Migration) -> str:
+    """The migration script plus its schema_migrations bookkeeping."""
+    if direction == "up":
+        return (migration.up + SCHEMA_MIGRATIONS_SQL
+                + f"    INSERT INTO schema_migrations (version, name) VALUES ({migration.version}, '{migration.name}');\n")
+    return migration.down + f"    DELETE FROM schema_migrations WHERE version = {migration.version};\n"
+
+
+def _literal(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def explain_script() -> str:
+    """EXPLAIN statements for every access path, for the Postgres SQL editor."""
+    lines = ["SET enable_seqscan = off;"]
+    for path in ACCESS_PATHS:
+        sql = path.sql
+        for value in path.params:
+            sql = sql.replace("?", _literal(value), 1)
+        lines.append(f"-- {path.endpoint}: expect {path.index}")
+        lines.append(f"EXPLAIN {sql};")
+    lines.append("RESET enable_seqscan;")
+    return "\n".join(lines)
+
+
+def supabase_versions(client) -> List[int]:
+    try:
+        result = client.table("schema_migrations").select("version").execute()
+    except APIError as e:
+        if e.code in ("42P01", "PGRST205"):
+            return []
+        raise
+    return sorted(row["version"] for row in result.data)
+
+
+def migrate_supabase(target: Optional[int] = None) -> bool:
+    client = create_client(SUPABASE_URL, SUPABASE_KEY)
+    for direction, migration in plan(supabase_versions(client), target):
+        sql = step_sql(direction, migration)
+        try:
+            client.postgrest.rpc("exec_sql", {"sql": sql}).execute()
+            print(f"{direction} {migration.version} {migration.name}")
+        except Exception as e:
+            print(f"Error running migration {migration.version} via RPC: {e}")
+            print("Please run the SQL manually in Supabase SQL Editor, then run this again:")
+            print(sql)
+            return False
+    return True
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="StreamOps schema migrations")
+    parser.add_argument("command", choices=["status", "up", "down", "check"])
+    parser.add_argument("--to", type=int, help="target version (default: latest for up)")
+    args = parser.parse_args(argv)
+    if args.command == "down" and args.to is None:
+        parser.error("down requires --to")
+    try:
+        return _run(args)
+    except ValueError as e:
+        print(f"Migration error: {e}")
+        return 1
+
+
+def _run(args) -> int:
+    if os.getenv("DB_BACKEND", "supabase") != "sqlite":
+        if args.command == "check":
+            print(explain_script())
+            return 0
+        if args.command == "status":
+            applied = supabase_versions(create_client(SUPABASE_URL, SUPABASE_KEY))
+            print(f"applied: {applied or 'none'}; latest: {LATEST_VERSION}")
+            return 0
+        return 0 if migrate_supabase(args.to) else 1
+
+    # Imported here: sqlite_backend imports this module for MIGRATIONS.
+    import sqlite3
+    from sqlite_backend import applied_versions, explain_plan, migrate
+    conn = sqlite3.connect(os.getenv("SQLITE_PATH", "streamops.db"), isolation_level=None)
+    try:
+        if args.command == "status":
+            print(f"applied: {applied_versions(conn) or 'none'}; latest: {LATEST_VERSION}")
+            return 0
+        if args.command in ("up", "down"):
+            for step in migrate(conn, args.to):
+                print(step)
+            return 0
+        failures = 0
+        for path in ACCESS_PATHS:
+            detail = explain_plan(conn, path.sql, path.params)
+            ok = any(f"INDEX {path.index} " in f"{line} " for line in detail)
+            failures += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {path.endpoint:<40} {path.index:<34} {' | '.join(detail)}")
+        return 1 if failures else 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
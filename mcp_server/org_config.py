@@ -0,0 +1,111 @@
+"""
+Per-organization ITSM configuration snapshot.
+
+SLA policies, ticket categories and priority configs change rarely but are
+read on every ticket create/resolve and every settings page load. They are
+loaded together (three queries in parallel) into one immutable OrgConfig
+and cached per org.
+
+Every config write calls invalidate(org_id), which bumps the org's version
+and drops the snapshot. A load that started before the bump is not
+cached, so a slow read can never overwrite a newer invalidation. Concurrent
+misses for the same org share one load. ORG_CONFIG_TTL_SECONDS bounds
+staleness when another process made the change.
+"""
+import asyncio
+import os
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from cache import TTLCache
+from db import execute
+
+ORG_CONFIG_CACHE_SIZE = int(os.getenv("ORG_CONFIG_CACHE_SIZE", "1000"))
+ORG_CONFIG_TTL_SECONDS = float(os.getenv("ORG_CONFIG_TTL_SECONDS", "300"))
+DEFAULT_BASE_POINTS = 25
+
+
+@dataclass(frozen=True)
+class OrgConfig:
+    org_id: str
+    version: int
+    sla_policies: List[dict] = field(default_factory=list)
+    categories: List[dict] = field(default_factory=list)
+    priorities: List[dict] = field(default_factory=list)
+
+    def priority(self, name: Optional[str]) -> Optional[dict]:
+        name = (name or "").lower()
+        for row in self.priorities:
+            if (row.get("name") or "").lower() == name:
+                return row
+        return None
+
+    def priority_points(self) -> Dict[str, int]:
+        """Base points by lower-cased priority name."""
+        return {
+            (row.get("name") or "").lower(): row.get("base_points") or DEFAULT_BASE_POINTS
+            for row in self.priorities
+        }
+
+    def sla_policy(self, priority: Optional[str]) -> Optional[dict]:
+        matching = [row for row in self.sla_policies if row.get("priority") == priority]
+        if not matching:
+            return None
+        defaults = [row for row in matching if row.get("is_default")]
+        return (defaults or matching)[0]
+
+    def has(self, kind: str, row_id: str) -> bool:
+        return any(str(row["id"]) == str(row_id) for row in getattr(self, kind))
+
+
+_snapshots = TTLCache(ORG_CONFIG_CACHE_SIZE, ORG_CONFIG_TTL_SECONDS)
+_versions: Dict[str, int] = defaultdict(int)
+_loading: Dict[str, asyncio.Future] = {}
+
+
+async def _load(db, org_id: str) -> OrgConfig:
+    version = _versions[org_id]
+    sla, categories, priorities = await asyncio.gather(
+        execute(db.table("sla_policies").select("*").eq("organization_id", org_id)),
+        execute(db.table("ticket_categories").select("*").eq("organization_id", org_id)),
+        execute(db.table("priority_configs").select("*").eq("organization_id", org_id).order("level")),
+    )
+    config = OrgConfig(org_id, version, sla.data, categories.data, priorities.data)
+    if _versions[org_id] == version:
+        _snapshots.set(org_id, config)
+    return config
+
+
+async def get_org_config(db, org_id: str) -> OrgConfig:
+    """Cached config snapshot for org_id, loading it on a miss."""
+    config = _snapshots.get(org_id)
+    if config is not None:
+        return config
+    pending = _loading.get(org_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    task = asyncio.ensure_future(_load(db, org_id))
+    _loading[org_id] = task
+    try:
+        return await asyncio.shield(task)
+    finally:
+        if _loading.get(org_id) is task:
+            del _loading[org_id]
+
+
+def invalidate(org_id: Optional[str]):
+    """Drop the org's snapshot after any change to its config tables."""
+    if not org_id:
+        return
+    _versions[org_id] += 1
+    _snapshots.pop(org_id)
+    _loading.pop(org_id, None)
+
+
+async def owns(db, org_id: str, kind: str, row_id: str) -> bool:
+    """Whether row_id is one of the org's `kind` rows, reloading once on a miss."""
+    if (await get_org_config(db, org_id)).has(kind, row_id):
+        return True
+    invalidate(org_id)
+    return (await get_org_config(db, org_id)).has(kind, row_id)
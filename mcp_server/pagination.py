@@ -0,0 +1,53 @@
+"""
+Opaque cursors and keyset filters for paginated MCP endpoints.
+
+A cursor is the sort key of the last row a client has seen, serialized as
+URL-safe base64 JSON. The next page is selected with a PostgREST `or`
+filter that matches rows strictly after that key, so each page is served
+from the index instead of an OFFSET scan.
+"""
+import base64
+import json
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return data
+
+
+def quote_value(value: Any) -> str:
+    """Quote a value for use inside a PostgREST logic tree."""
+    text = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{text}"'
+
+
+def keyset_filter(keys: List[Tuple[str, Any, bool]]) -> str:
+    """Build an `or` filter matching rows after the given sort key.
+
+    keys is the ordered list of (column, last_value, descending) that the
+    query sorts by; the final column must be unique (usually id).
+    """
+    clauses = []
+    for i, (column, value, descending) in enumerate(keys):
+        parts = [f"{c}.eq.{quote_value(v)}" for c, v, _ in keys[:i]]
+        parts.append(f"{column}.{'lt' if descending else 'gt'}.{quote_value(value)}")
+        clauses.append(parts[0] if len(parts) == 1 else f"and({','.join(parts)})")
+    return ",".join(clauses)
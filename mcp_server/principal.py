@@ -0,0 +1,66 @@
+"""
+Per-request principal: who the caller is and where they sit in an org.
+
+The profile row behind a principal is loaded at most once per request (via
+the FastAPI dependency) and is shared across requests through a process-wide
+LRU+TTL cache. Endpoints that change a user's organization, role or profile
+call invalidate_principal()/invalidate_org_principals() so the next request
+sees fresh data; other workers pick it up within PRINCIPAL_CACHE_TTL_SECONDS.
+"""
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+from cache import TTLCache
+from db import get_db, execute
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_COLUMNS = "user_id, organization_id, organization_name, role, display_name, avatar_url"
+
+_principals = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+
+
+@dataclass
+class Principal:
+    user_id: str
+    email: Optional[str] = None
+    org_id: Optional[str] = None
+    org_name: Optional[str] = None
+    role: str = "Agent"
+    display_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    has_profile: bool = False
+
+
+async def load_principal(user) -> Principal:
+    cached = _principals.get(user.id)
+    if cached is not None:
+        return cached
+    principal = Principal(user_id=user.id, email=user.email)
+    try:
+        db = await get_db()
+        result = await execute(db.table("profiles").select(PRINCIPAL_COLUMNS).eq("user_id", user.id))
+        if result.data:
+            row = result.data[0]
+            principal.org_id = row.get("organization_id")
+            principal.org_name = row.get("organization_name")
+            principal.role = row.get("role") or "Agent"
+            principal.display_name = row.get("display_name")
+            principal.avatar_url = row.get("avatar_url")
+            principal.has_profile = True
+    except Exception as e:
+        print(f"Load principal error: {e}")
+        return principal
+    _principals.set(user.id, principal)
+    return principal
+
+
+def invalidate_principal(user_id: str):
+    _principals.pop(user_id)
+
+
+def invalidate_org_principals(org_id: str):
+    for principal in _principals.values():
+        if principal.org_id == org_id:
+            _principals.pop(principal.user_id)
@@ -0,0 +1,178 @@
+"""
+On-demand sampling profiler for the live MCP server process.
+
+profile() samples every thread's Python stack at a fixed interval
+(sys._current_frames, no tracing hooks, so overhead stays in proportion to
+the sample rate) and returns the counts as collapsed stacks, one
+"frame;frame;frame count" line per distinct stack. The output works with
+flamegraph.pl and speedscope, or render_svg() draws the flame graph itself.
+
+With a route pattern, only requests whose path matches are profiled, by
+wall clock. Each in-flight matching request is sampled as either "running"
+(its task is on the event loop; the stack is the loop thread's) or
+"awaiting" (suspended; the stack is its coroutine await chain, ending at
+the database call or other I/O it is waiting on). That splits a route's
+time into CPU work such as serializing rows and sorting, versus network
+waits.
+
+Environment:
+    PROFILER_MAX_SECONDS   longest profile one request may ask for (default 60)
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from fnmatch import fnmatchcase
+from typing import Dict, Optional
+from xml.sax.saxutils import escape
+
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+
+_running = threading.Lock()
+_route_pattern: Optional[str] = None
+_requests: Dict[asyncio.Task, dict] = {}
+
+
+def _label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _thread_stack(frame) -> list:
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _await_chain(task: asyncio.Task) -> list:
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None) or getattr(awaitable, "ag_frame", None)
+        if frame is None:
+            stack.append(type(awaitable).__name__)
+            break
+        stack.append(_label(frame.f_code))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None) or getattr(awaitable, "ag_await", None)
+    return stack
+
+
+def _sample(stacks: Counter, loop: Optional[asyncio.AbstractEventLoop], loop_thread: int, interval: float, deadline: float):
+    own = threading.get_ident()
+    while time.monotonic() < deadline:
+        frames = sys._current_frames()
+        if _route_pattern is None:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident != own:
+                    stacks[";".join([names.get(ident, str(ident)), *_thread_stack(frame)])] += 1
+        else:
+            running = asyncio.current_task(loop)
+            for task, scope in list(_requests.items()):
+                route = getattr(scope.get("route"), "path", None) or scope["path"]
+                if task is running and loop_thread in frames:
+                    stack = ["running", *_thread_stack(frames[loop_thread])]
+                else:
+                    stack = ["awaiting", *_await_chain(task)]
+                stacks[";".join([f"{scope['method']} {route}", *stack])] += 1
+        del frames
+        time.sleep(interval)
+
+
+async def profile(seconds: float, interval_ms: float = 10, route: Optional[str] = None) -> Counter:
+    """Sample for `seconds` and return collapsed stack counts.
+
+    Raises RuntimeError if another profile is already running.
+    """
+    global _route_pattern
+    if not _running.acquire(blocking=False):
+        raise RuntimeError("A profile is already running")
+    stacks: Counter = Counter()
+    try:
+        _route_pattern = route
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + min(seconds, PROFILER_MAX_SECONDS)
+        await asyncio.to_thread(_sample, stacks, loop, threading.get_ident(), interval_ms / 1000, deadline)
+    finally:
+        _route_pattern = None
+        _requests.clear()
+        _running.release()
+    return stacks
+
+
+def collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+
+
+def render_svg(stacks: Counter, title: str = "MCP server profile", width: int = 1200) -> str:
+    """A static flame graph; hover a frame for its sample count."""
+    root: dict = {"count": 0, "children": {}}
+    for stack, count in stacks.items():
+        node = root
+        node["count"] += count
+        for frame in stack.split(";"):
+            node = node["children"].setdefault(frame, {"count": 0, "children": {}})
+            node["count"] += count
+
+    def depth(node) -> int:
+        return 1 + max((depth(child) for child in node["children"].values()), default=0)
+
+    row, top = 16, 28
+    levels = depth(root) - 1
+    height = top + levels * row + 8
+    total = root["count"] or 1
+    scale = (width - 20) / total
+    rects = []
+
+    def draw(node, name, x, level):
+        w = node["count"] * scale
+        if w < 0.5:
+            return
+        y = height - 8 - (level + 1) * row
+        hue = zlib.crc32(name.encode()) % 40
+        share = f"{node['count']} samples, {100 * node['count'] / total:.1f}%"
+        text = escape(name[: int(w / 7)]) if w > 30 else ""
+        rects.append(
+            f'<g><title>{escape(name)} ({share})</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row - 1}" fill="hsl({hue},85%,60%)"/>'
+            f'<text x="{x + 3:.1f}" y="{y + 12}">{text}</text></g>'
+        )
+        child_x = x
+        for child_name, child in sorted(node["children"].items()):
+            draw(child, child_name, child_x, level + 1)
+            child_x += child["count"] * scale
+
+    x = 10.0
+    for name, child in sorted(root["children"].items()):
+        draw(child, name, x, 0)
+        x += child["count"] * scale
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" font-family="monospace" font-size="11">'
+        f'<rect width="100%" height="100%" fill="#fff"/>'
+        f'<text x="10" y="18" font-size="14">{escape(title)} ({root["count"]} samples)</text>'
+        + "".join(rects) + "</svg>"
+    )
+
+
+class ProfilerMiddleware:
+    """Registers in-flight requests whose path matches the active route pattern."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        pattern = _route_pattern
+        if pattern is None or scope["type"] != "http" or not fnmatchcase(scope["path"], pattern):
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        _requests[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _requests.pop(task, None)
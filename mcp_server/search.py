@@ -0,0 +1,94 @@
+"""
+Full-text search over tickets, ticket activities and posts.
+
+Each searchable table has a generated, GIN-indexed `search_vector` column
+(SEARCH_SQL in setup_db.py). User input is turned into a prefix tsquery,
+"vpn print" -> "vpn:* & print:*", so search-as-you-type matches partial
+words, and search_content ranks matches across all three tables with
+ts_rank_cd (title words weigh more than body words).
+
+With DB_RPC_MODE=local a small in-process scorer stands in for the RPC.
+"""
+import re
+from typing import Dict, List, Optional
+
+from db import call_rpc, execute
+
+SEARCH_CONFIG = "english"
+SEARCH_KINDS = ("ticket", "activity", "post")
+MAX_SEARCH_TERMS = 8
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+# kind -> (table, weighted text columns)
+_LOCAL_SOURCES = {
+    "ticket": ("tickets", {"title": 2.0, "description": 1.0}),
+    "activity": ("activities", {"content": 1.0}),
+    "post": ("posts", {"title": 2.0, "content": 1.0}),
+}
+
+
+def search_terms(text: Optional[str]) -> List[str]:
+    return [token.lower() for token in _TOKEN.findall(text or "")][:MAX_SEARCH_TERMS]
+
+
+def prefix_tsquery(text: Optional[str]) -> Optional[str]:
+    """Build a tsquery that requires every term, each as a prefix."""
+    terms = search_terms(text)
+    if not terms:
+        return None
+    return " & ".join(f"{term}:*" for term in terms)
+
+
+def matches(query, text: Optional[str], column: str = "search_vector"):
+    """Add a full-text filter on a PostgREST query; no-op for empty text."""
+    tsquery = prefix_tsquery(text)
+    if tsquery is None:
+        return query
+    return query.filter(column, f"fts({SEARCH_CONFIG})", tsquery)
+
+
+async def local_search_content(db, params: dict) -> List[Dict]:
+    terms = [term.rstrip(":*") for term in params["p_query"].split(" & ")]
+    org_id = params["p_org_id"]
+    org_tickets = None
+    if org_id and "activity" in params["p_kinds"]:
+        tickets = await execute(db.table("tickets").select("id").eq("organization_id", org_id))
+        org_tickets = {str(ticket["id"]) for ticket in tickets.data}
+    results = []
+    for kind in params["p_kinds"]:
+        table, weights = _LOCAL_SOURCES[kind]
+        query = db.table(table).select("*")
+        if org_id and kind != "activity":
+            query = query.eq("organization_id", org_id)
+        rows = await execute(query)
+        for row in rows.data:
+            if org_tickets is not None and kind == "activity" and str(row["ticket_id"]) not in org_tickets:
+                continue
+            rank = 0.0
+            for term in terms:
+                term_rank = 0.0
+                for column, weight in weights.items():
+                    words = search_terms(row.get(column))
+                    term_rank += weight * sum(1 for word in words if word.startswith(term))
+                if not term_rank:
+                    break
+                rank += term_rank
+            else:
+                results.append({"kind": kind, "id": row["id"], "rank": rank, "item": row})
+    results.sort(key=lambda result: result["rank"], reverse=True)
+    return results[:params["p_limit"]]
+
+
+async def search_content(db, text: str, org_id: Optional[str], kinds: List[str], limit: int) -> List[Dict]:
+    """Ranked matches as {"kind", "id", "rank", "item"} rows."""
+    tsquery = prefix_tsquery(text)
+    if tsquery is None or not kinds:
+        return []
+    rows = await call_rpc(db, "search_content", {
+        "p_query": tsquery,
+        "p_org_id": org_id,
+        "p_kinds": kinds,
+        "p_limit": limit,
+    }, local_search_content)
+    return rows or []
@@ -1,17 +1,15 @@
 """
-Setup script to create Supabase tables for StreamOps
-Run this once to initialize the database schema.
+Baseline schema for StreamOps (migration 1 in migrations.py).
+Later schema changes are added as migrations there, not to these blocks.
+Run this (or `python migrations.py up`) to bring the database up to date.
 """
-from supabase import create_client
 import os
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 
-def setup_tables():
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    
-    sql = """
+# Base tables, indexes and row level security.
+BASE_SQL = """
     -- Create tickets table
     CREATE TABLE IF NOT EXISTS tickets (
         id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -154,17 +152,416 @@ def setup_tables():
 
     DROP POLICY IF EXISTS "Allow all on post_comments" ON post_comments;
     CREATE POLICY "Allow all on post_comments" ON post_comments FOR ALL USING (true) WITH CHECK (true);
-    """
+"""
+
+# Multi-tenancy: organizations and their ITSM configuration.
+TENANCY_SQL = """
+    CREATE TABLE IF NOT EXISTS organizations (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        name TEXT NOT NULL,
+        slug TEXT UNIQUE NOT NULL,
+        logo_url TEXT,
+        domain TEXT,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    ALTER TABLE profiles ADD COLUMN IF NOT EXISTS organization_id UUID REFERENCES organizations(id);
+    ALTER TABLE profiles ADD COLUMN IF NOT EXISTS organization_name TEXT;
+    ALTER TABLE tickets ADD COLUMN IF NOT EXISTS organization_id UUID REFERENCES organizations(id);
+    ALTER TABLE posts ADD COLUMN IF NOT EXISTS organization_id UUID REFERENCES organizations(id);
+    ALTER TABLE agent_stats ADD COLUMN IF NOT EXISTS organization_id UUID REFERENCES organizations(id);
+
+    CREATE TABLE IF NOT EXISTS sla_policies (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        organization_id UUID NOT NULL REFERENCES organizations(id),
+        name TEXT NOT NULL,
+        priority TEXT NOT NULL,
+        response_time_minutes INTEGER NOT NULL,
+        resolution_time_minutes INTEGER NOT NULL,
+        is_default BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS ticket_categories (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        organization_id UUID NOT NULL REFERENCES organizations(id),
+        name TEXT NOT NULL,
+        description TEXT,
+        icon TEXT,
+        is_active BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+    ALTER TABLE ticket_categories ADD COLUMN IF NOT EXISTS bonus_points INTEGER DEFAULT 0;
+
+    CREATE TABLE IF NOT EXISTS priority_configs (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        organization_id UUID NOT NULL REFERENCES organizations(id),
+        name TEXT NOT NULL,
+        level INTEGER NOT NULL DEFAULT 1,
+        color TEXT DEFAULT '#gray',
+        base_points INTEGER DEFAULT 25,
+        response_time_minutes INTEGER DEFAULT 60,
+        resolution_time_minutes INTEGER DEFAULT 480,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS knowledge_videos (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        organization_id UUID NOT NULL REFERENCES organizations(id),
+        title TEXT NOT NULL,
+        description TEXT,
+        thumbnail_url TEXT,
+        video_url TEXT,
+        category TEXT DEFAULT 'other',
+        author_id UUID,
+        author_name TEXT,
+        author_avatar TEXT,
+        views INTEGER DEFAULT 0,
+        likes INTEGER DEFAULT 0,
+        duration TEXT DEFAULT '0:00',
+        coins_earned INTEGER DEFAULT 0,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+
+    CREATE TABLE IF NOT EXISTS activity_events (
+        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+        event_type TEXT NOT NULL,
+        user_id UUID,
+        user_name TEXT,
+        user_avatar TEXT,
+        organization_id UUID REFERENCES organizations(id),
+        message TEXT NOT NULL,
+        metadata JSONB DEFAULT '{}',
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+    CREATE INDEX IF NOT EXISTS idx_activity_events_org_created
+        ON activity_events(organization_id, created_at DESC);
+
+    ALTER TABLE organizations ENABLE ROW LEVEL SECURITY;
+    ALTER TABLE sla_policies ENABLE ROW LEVEL SECURITY;
+    ALTER TABLE ticket_categories ENABLE ROW LEVEL SECURITY;
+    ALTER TABLE priority_configs ENABLE ROW LEVEL SECURITY;
+    ALTER TABLE knowledge_videos ENABLE ROW LEVEL SECURITY;
+    ALTER TABLE activity_events ENABLE ROW LEVEL SECURITY;
+
+    DROP POLICY IF EXISTS "Allow all on organizations" ON organizations;
+    CREATE POLICY "Allow all on organizations" ON organizations FOR ALL USING (true) WITH CHECK (true);
+
+    DROP POLICY IF EXISTS "Allow all on sla_policies" ON sla_policies;
+    CREATE POLICY "Allow all on sla_policies" ON sla_policies FOR ALL USING (true) WITH CHECK (true);
+
+    DROP POLICY IF EXISTS "Allow all on ticket_categories" ON ticket_categories;
+    CREATE POLICY "Allow all on ticket_categories" ON ticket_categories FOR ALL USING (true) WITH CHECK (true);
+
+    DROP POLICY IF EXISTS "Allow all on priority_configs" ON priority_configs;
+    CREATE POLICY "Allow all on priority_configs" ON priority_configs FOR ALL USING (true) WITH CHECK (true);
+
+    DROP POLICY IF EXISTS "Allow all on knowledge_videos" ON knowledge_videos;
+    CREATE POLICY "Allow all on knowledge_videos" ON knowledge_videos FOR ALL USING (true) WITH CHECK (true);
+
+    DROP POLICY IF EXISTS "Allow all on activity_events" ON activity_events;
+    CREATE POLICY "Allow all on activity_events" ON activity_events FOR ALL USING (true) WITH CHECK (true);
+"""
+
+# Keyset pagination for /mcp/tickets/feed: priority is ranked in a stored
+# column so (priority_rank, sla_deadline, id) can be read straight off a
+# partial index over open, unassigned tickets.
+FEED_SQL = """
+    ALTER TABLE tickets ADD COLUMN IF NOT EXISTS organization_id UUID;
+    ALTER TABLE tickets ADD COLUMN IF NOT EXISTS priority_rank SMALLINT GENERATED ALWAYS AS (
+        CASE priority
+            WHEN 'critical' THEN 0
+            WHEN 'high' THEN 1
+            WHEN 'medium' THEN 2
+            WHEN 'low' THEN 3
+            ELSE 4
+        END
+    ) STORED;
+    CREATE INDEX IF NOT EXISTS idx_tickets_feed
+        ON tickets(organization_id, priority_rank, sla_deadline, id)
+        WHERE status = 'open' AND assignee_id IS NULL;
+"""
+
+# Mixed feed: every source is read newest-first by (created_at, id).
+MIXED_FEED_SQL = """
+    ALTER TABLE posts ADD COLUMN IF NOT EXISTS organization_id UUID;
+    CREATE INDEX IF NOT EXISTS idx_tickets_feed_recent
+        ON tickets(organization_id, created_at DESC, id DESC)
+        WHERE status = 'open' AND assignee_id IS NULL;
+    CREATE INDEX IF NOT EXISTS idx_posts_org_recent
+        ON posts(organization_id, created_at DESC, id DESC);
+"""
+
+# Full-text search (see search.py): generated, GIN-indexed tsvectors so
+# prefix tsqueries never fall back to a sequential ilike scan.
+SEARCH_SQL = """
+    ALTER TABLE posts ADD COLUMN IF NOT EXISTS title TEXT;
+    ALTER TABLE tickets ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+            setweight(to_tsvector('english', COALESCE(description, '')), 'B')
+        ) STORED;
+    ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', COALESCE(title, '')), 'A') ||
+            setweight(to_tsvector('english', COALESCE(content, '')), 'B')
+        ) STORED;
+    ALTER TABLE activities ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+        GENERATED ALWAYS AS (to_tsvector('english', COALESCE(content, ''))) STORED;
+    CREATE INDEX IF NOT EXISTS idx_tickets_search ON tickets USING GIN (search_vector);
+    CREATE INDEX IF NOT EXISTS idx_posts_search ON posts USING GIN (search_vector);
+    CREATE INDEX IF NOT EXISTS idx_activities_search ON activities USING GIN (search_vector);
+
+    CREATE OR REPLACE FUNCTION search_content(p_query TEXT, p_org_id UUID, p_kinds TEXT[], p_limit INTEGER)
+    RETURNS TABLE (kind TEXT, id UUID, rank REAL, item JSONB)
+    LANGUAGE sql STABLE AS $$
+        WITH q AS (SELECT to_tsquery('english', p_query) AS query)
+        SELECT * FROM (
+            (SELECT 'ticket', t.id, ts_rank_cd(t.search_vector, q.query), to_jsonb(t) - 'search_vector'
+               FROM tickets t, q
+              WHERE 'ticket' = ANY(p_kinds) AND t.search_vector @@ q.query
+                AND (p_org_id IS NULL OR t.organization_id = p_org_id)
+              ORDER BY 3 DESC LIMIT p_limit)
+            UNION ALL
+            (SELECT 'activity', a.id, ts_rank_cd(a.search_vector, q.query), to_jsonb(a) - 'search_vector'
+               FROM activities a JOIN tickets t ON t.id = a.ticket_id, q
+              WHERE 'activity' = ANY(p_kinds) AND a.search_vector @@ q.query
+                AND (p_org_id IS NULL OR t.organization_id = p_org_id)
+              ORDER BY 3 DESC LIMIT p_limit)
+            UNION ALL
+            (SELECT 'post', p.id, ts_rank_cd(p.search_vector, q.query), to_jsonb(p) - 'search_vector'
+               FROM posts p, q
+              WHERE 'post' = ANY(p_kinds) AND p.search_vector @@ q.query
+                AND (p_org_id IS NULL OR p.organization_id = p_org_id)
+              ORDER BY 3 DESC LIMIT p_limit)
+        ) AS matches
+        ORDER BY 3 DESC
+        LIMIT p_limit;
+    $$;
+"""
+
+# Per-agent daily buckets behind the windowed leaderboards. Any window is a
+# SUM over at most ~31 buckets per agent instead of a scan of resolved tickets.
+WINDOWED_STATS_SQL = """
+    CREATE TABLE IF NOT EXISTS agent_stats_daily (
+        agent_id TEXT NOT NULL,
+        organization_id UUID,
+        day DATE NOT NULL,
+        tickets_resolved INTEGER NOT NULL DEFAULT 0,
+        coins INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (agent_id, day)
+    );
+    CREATE INDEX IF NOT EXISTS idx_agent_stats_daily_org_day
+        ON agent_stats_daily(organization_id, day);
+    ALTER TABLE agent_stats_daily ENABLE ROW LEVEL SECURITY;
+    DROP POLICY IF EXISTS "Allow all on agent_stats_daily" ON agent_stats_daily;
+    CREATE POLICY "Allow all on agent_stats_daily" ON agent_stats_daily FOR ALL USING (true) WITH CHECK (true);
+
+    -- Backfill ticket counts from history; coins were never recorded per ticket.
+    INSERT INTO agent_stats_daily (agent_id, organization_id, day, tickets_resolved)
+    SELECT assignee_id, MAX(organization_id::TEXT)::UUID, resolved_at::DATE, COUNT(*)
+      FROM tickets
+     WHERE status = 'resolved' AND assignee_id IS NOT NULL AND resolved_at IS NOT NULL
+     GROUP BY assignee_id, resolved_at::DATE
+    ON CONFLICT (agent_id, day) DO NOTHING;
+
+    CREATE OR REPLACE FUNCTION windowed_leaderboard(p_org_id UUID, p_since DATE, p_limit INTEGER)
+    RETURNS TABLE (agent_id TEXT, agent_name TEXT, tickets_resolved BIGINT, coins BIGINT, streak INTEGER)
+    LANGUAGE sql STABLE AS $$
+        SELECT d.agent_id, COALESCE(s.agent_name, d.agent_id), SUM(d.tickets_resolved), SUM(d.coins),
+               COALESCE(s.streak, 0)
+          FROM agent_stats_daily d
+          LEFT JOIN agent_stats s ON s.agent_id = d.agent_id
+         WHERE d.day >= p_since AND (p_org_id IS NULL OR d.organization_id = p_org_id)
+         GROUP BY d.agent_id, s.agent_name, s.streak
+         ORDER BY SUM(d.tickets_resolved) DESC, d.agent_id
+         LIMIT p_limit;
+    $$;
+"""
+
+# Assign/resolve run as one server-side transaction each (see
+# transitions.py): counters are bumped with ON CONFLICT increments instead of
+# read-modify-write from the app, so concurrent swipes never lose updates.
+# Assign is a compare-and-set claim: it only takes open, unassigned tickets
+# and otherwise reports the current owner.
+TRANSITIONS_SQL = """
+    ALTER TABLE agent_stats ADD COLUMN IF NOT EXISTS organization_id UUID;
+
+    CREATE OR REPLACE FUNCTION assign_ticket_tx(
+        p_ticket_id UUID, p_user_id TEXT, p_user_name TEXT, p_org_id UUID
+    ) RETURNS JSONB LANGUAGE plpgsql AS $$
+    DECLARE
+        v_ticket tickets;
+        v_stats agent_stats;
+    BEGIN
+        UPDATE tickets
+           SET assignee_id = p_user_id, assignee_name = p_user_name,
+               status = 'assigned', updated_at = NOW()
+         WHERE id = p_ticket_id AND status = 'open' AND assignee_id IS NULL
+        RETURNING * INTO v_ticket;
+        IF NOT FOUND THEN
+            SELECT * INTO v_ticket FROM tickets WHERE id = p_ticket_id;
+            IF NOT FOUND THEN
+                RETURN NULL;
+            END IF;
+            RETURN jsonb_build_object('conflict', TRUE, 'ticket', to_jsonb(v_ticket) - 'search_vector');
+        END IF;
+
+        INSERT INTO agent_stats AS s (agent_id, agent_name, tickets_assigned, organization_id)
+        VALUES (p_user_id, p_user_name, 1, p_org_id)
+        ON CONFLICT (agent_id) DO UPDATE
+           SET tickets_assigned = s.tickets_assigned + 1,
+               organization_id = COALESCE(s.organization_id, EXCLUDED.organization_id),
+               updated_at = NOW()
+        RETURNING * INTO v_stats;
+
+        RETURN jsonb_build_object('ticket', to_jsonb(v_ticket) - 'search_vector', 'stats', to_jsonb(v_stats));
+    END;
+    $$;
+
+    DROP FUNCTION IF EXISTS resolve_ticket_tx(UUID, TEXT, TEXT, TEXT, UUID);
+    CREATE OR REPLACE FUNCTION resolve_ticket_tx(
+        p_ticket_id UUID, p_user_id TEXT, p_user_name TEXT, p_user_avatar TEXT, p_org_id UUID,
+        p_priority_points JSONB DEFAULT NULL
+    ) RETURNS JSONB LANGUAGE plpgsql AS $$
+    DECLARE
+        v_ticket tickets;
+        v_stats agent_stats;
+        v_event activity_events;
+        v_points INTEGER;
+    BEGIN
+        UPDATE tickets
+           SET status = 'resolved', resolved_at = NOW(), updated_at = NOW(),
+               assignee_name = CASE WHEN assignee_id IS NULL THEN p_user_name ELSE assignee_name END,
+               assignee_id = COALESCE(assignee_id, p_user_id)
+         WHERE id = p_ticket_id
+        RETURNING * INTO v_ticket;
+        IF NOT FOUND THEN
+            RETURN NULL;
+        END IF;
+
+        -- Callers pass the org's points table from their config cache; only
+        -- look it up here when they did not.
+        IF p_priority_points IS NOT NULL THEN
+            v_points := (p_priority_points ->> lower(v_ticket.priority))::INTEGER;
+        ELSE
+            SELECT base_points INTO v_points
+              FROM priority_configs
+             WHERE p_org_id IS NOT NULL AND organization_id = p_org_id AND name ILIKE v_ticket.priority
+             LIMIT 1;
+        END IF;
+        v_points := COALESCE(v_points, 25)
+            + CASE WHEN v_ticket.has_bounty THEN COALESCE(v_ticket.bounty_amount, 0) ELSE 0 END;
+
+        INSERT INTO agent_stats AS s (agent_id, agent_name, tickets_resolved, streak, coins, organization_id)
+        VALUES (p_user_id, p_user_name, 1, 1, v_points, p_org_id)
+        ON CONFLICT (agent_id) DO UPDATE
+           SET tickets_resolved = s.tickets_resolved + 1,
+               streak = s.streak + 1,
+               coins = s.coins + v_points,
+               organization_id = COALESCE(s.organization_id, EXCLUDED.organization_id),
+               updated_at = NOW()
+        RETURNING * INTO v_stats;
+
+        INSERT INTO agent_stats_daily AS d (agent_id, organization_id, day, tickets_resolved, coins)
+        VALUES (p_user_id, p_org_id, CURRENT_DATE, 1, v_points)
+        ON CONFLICT (agent_id, day) DO UPDATE
+           SET tickets_resolved = d.tickets_resolved + 1,
+               coins = d.coins + v_points,
+               organization_id = COALESCE(EXCLUDED.organization_id, d.organization_id);
+
+        INSERT INTO activity_events (event_type, user_id, user_name, user_avatar, organization_id, message, metadata)
+        VALUES (
+            'ticket_resolved',
+            CASE WHEN p_user_id ~* '^[0-9a-f-]{36}$' THEN p_user_id::UUID END,
+            split_part(p_user_name, '@', 1),
+            p_user_avatar,
+            p_org_id,
+            format('resolved a ticket and earned %s points', v_points),
+            jsonb_build_object('points', v_points, 'ticketId', v_ticket.id, 'ticketTitle', v_ticket.title)
+        )
+        RETURNING * INTO v_event;
+
+        RETURN jsonb_build_object(
+            'ticket', to_jsonb(v_ticket) - 'search_vector', 'stats', to_jsonb(v_stats),
+            'points', v_points, 'event', to_jsonb(v_event)
+        );
+    END;
+    $$;
+"""
+
+# Counter columns are only ever moved by apply_counter_deltas (one bulk
+# increment per column, see counters.py) and repaired by reconcile_counters.
+COUNTERS_SQL = """
+    CREATE OR REPLACE FUNCTION apply_counter_deltas(
+        p_table TEXT, p_column TEXT, p_deltas JSONB
+    ) RETURNS INTEGER LANGUAGE plpgsql AS $$
+    DECLARE
+        v_count INTEGER;
+    BEGIN
+        IF (p_table, p_column) NOT IN (
+            ('posts', 'likes_count'), ('posts', 'comments_count'),
+            ('tickets', 'activity_count'), ('tickets', 'view_count')
+        ) THEN
+            RAISE EXCEPTION 'Unknown counter %.%', p_table, p_column;
+        END IF;
+        EXECUTE format(
+            'UPDATE %1$I AS t SET %2$I = GREATEST(COALESCE(t.%2$I, 0) + d.value::INTEGER, 0)
+               FROM jsonb_each_text($1) AS d
+              WHERE d.key ~* ''^[0-9a-f-]{36}$'' AND t.id = d.key::UUID',
+            p_table, p_column
+        ) USING p_deltas;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        RETURN v_count;
+    END;
+    $$;
+
+    CREATE OR REPLACE FUNCTION reconcile_counters() RETURNS INTEGER LANGUAGE plpgsql AS $$
+    DECLARE
+        v_fixed INTEGER := 0;
+        v_count INTEGER;
+    BEGIN
+        UPDATE posts p SET likes_count = c.actual
+          FROM (SELECT p2.id, COUNT(l.id)::INTEGER AS actual
+                  FROM posts p2 LEFT JOIN post_likes l ON l.post_id = p2.id
+                 GROUP BY p2.id) c
+         WHERE p.id = c.id AND p.likes_count IS DISTINCT FROM c.actual;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_fixed := v_fixed + v_count;
+
+        UPDATE posts p SET comments_count = c.actual
+          FROM (SELECT p2.id, COUNT(pc.id)::INTEGER AS actual
+                  FROM posts p2 LEFT JOIN post_comments pc ON pc.post_id = p2.id
+                 GROUP BY p2.id) c
+         WHERE p.id = c.id AND p.comments_count IS DISTINCT FROM c.actual;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        v_fixed := v_fixed + v_count;
+
+        UPDATE tickets t SET activity_count = c.actual
+          FROM (SELECT t2.id, COUNT(a.id)::INTEGER AS actual
+                  FROM tickets t2 LEFT JOIN activities a ON a.ticket_id = t2.id
+                 GROUP BY t2.id) c
+         WHERE t.id = c.id AND t.activity_count IS DISTINCT FROM c.actual;
+        GET DIAGNOSTICS v_count = ROW_COUNT;
+        RETURN v_fixed + v_count;
+    END;
+    $$;
+"""
+
+def schema_sql() -> str:
+    """The full schema, in the order it is applied."""
+    return (BASE_SQL + TENANCY_SQL + FEED_SQL + MIXED_FEED_SQL + SEARCH_SQL
+            + WINDOWED_STATS_SQL + TRANSITIONS_SQL + COUNTERS_SQL)
+
+def setup_tables():
+    # migrations imports this module for the baseline.
+    from migrations import migrate_supabase
     
-    try:
-        result = supabase.postgrest.rpc('exec_sql', {'sql': sql}).execute()
+    if migrate_supabase():
         print("Tables created successfully!")
         return True
-    except Exception as e:
-        print(f"Error creating tables via RPC: {e}")
-        print("Please run the SQL manually in Supabase SQL Editor:")
-        print(sql)
-        return False
+    return False
 
 if __name__ == "__main__":
     setup_tables()
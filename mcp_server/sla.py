@@ -0,0 +1,259 @@
+"""
+SLA deadlines from org policies.
+
+A ticket's deadline is its creation time plus the resolution_time_minutes of
+the org's SLA policy for its priority (the default one if there are
+several), or DEFAULT_RESOLUTION_HOURS without a policy. A policy with
+business_hours counts only minutes inside those hours:
+
+    {"timezone": "America/New_York",
+     "hours": {"mon": ["09:00", "17:00"], "tue": [["09:00", "12:00"], ["13:00", "17:00"]], ...},
+     "holidays": ["2026-12-25"]}
+
+Days missing from "hours" are closed. Hours are local wall-clock times, so
+they follow daylight saving.
+
+When a policy changes, start_recompute() queues a durable job that walks
+the org's active, non-exempt tickets of the affected priorities in keyset
+chunks of SLA_RECOMPUTE_CHUNK. It writes each chunk's changed deadlines with one bulk
+UPDATE (set_sla_deadlines) and hands them to the SLA scheduler. Progress is
+kept per run (runs()) and published on the event bus as "sla.recompute"
+after every chunk.
+
+Environment:
+    SLA_RECOMPUTE_CHUNK     tickets read and updated per chunk (default 500)
+"""
+import asyncio
+import json
+import os
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import jobs
+import org_config
+import sla_scheduler
+from db import call_rpc, execute, get_db
+from events import bus
+
+SLA_RECOMPUTE_CHUNK = int(os.getenv("SLA_RECOMPUTE_CHUNK", "500"))
+SLA_RECOMPUTE_HISTORY = 20
+DEFAULT_RESOLUTION_HOURS = {"critical": 2, "high": 4, "medium": 8, "low": 24}
+MAX_CALENDAR_DAYS = 3660
+
+_DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+_MINUTE = timedelta(minutes=1)
+
+
+def _minute_of_day(value: str) -> int:
+    hours, _, minutes = str(value).partition(":")
+    minute = int(hours) * 60 + int(minutes or 0)
+    if not 0 <= minute <= 24 * 60:
+        raise ValueError(f"Invalid time of day: {value}")
+    return minute
+
+
+class BusinessHours:
+    """Weekly opening hours in one timezone, minus holidays."""
+
+    def __init__(self, zone: ZoneInfo, week: List[List[Tuple[int, int]]], holidays: List[date]):
+        self.zone = zone
+        self.week = week
+        self.holidays = sorted(holidays)
+        self.weekly_minutes = sum(end - start for day in week for start, end in day)
+
+    @classmethod
+    def parse(cls, spec: dict) -> "BusinessHours":
+        """Raises ValueError for an unknown timezone, a malformed interval or
+        a week without any open hours."""
+        if not isinstance(spec, dict):
+            raise ValueError("businessHours must be an object")
+        try:
+            zone = ZoneInfo(spec.get("timezone") or "UTC")
+        except (ZoneInfoNotFoundError, ValueError):
+            raise ValueError(f"Unknown timezone: {spec.get('timezone')}")
+        hours = spec.get("hours") or {}
+        unknown = set(hours) - set(_DAYS)
+        if unknown:
+            raise ValueError(f"Unknown day(s) in businessHours: {', '.join(sorted(unknown))}")
+        week = []
+        for day in _DAYS:
+            intervals = hours.get(day) or []
+            if intervals and not isinstance(intervals[0], (list, tuple)):
+                intervals = [intervals]
+            parsed = []
+            for interval in intervals:
+                if len(interval) != 2:
+                    raise ValueError(f"Business hours for {day} must be [start, end] pairs")
+                start, end = _minute_of_day(interval[0]), _minute_of_day(interval[1])
+                if end <= start:
+                    raise ValueError(f"Business hours for {day} end before they start")
+                parsed.append((start, end))
+            week.append(sorted(parsed))
+        holidays = [date.fromisoformat(day) for day in spec.get("holidays") or []]
+        calendar = cls(zone, week, holidays)
+        if calendar.weekly_minutes == 0:
+            raise ValueError("businessHours has no open hours")
+        return calendar
+
+    def _at(self, day: date, minute: int) -> datetime:
+        # Wall-clock arithmetic: "24:00" is the next midnight, DST shifts the offset.
+        return (datetime.combine(day, time(), tzinfo=self.zone) + timedelta(minutes=minute)).astimezone(timezone.utc)
+
+    def _has_holiday(self, first: date, last: date) -> bool:
+        index = bisect_left(self.holidays, first)
+        return index < len(self.holidays) and self.holidays[index] <= last
+
+    def add(self, start: datetime, minutes: float) -> datetime:
+        """The UTC instant `minutes` business minutes after start (aware)."""
+        local = start.astimezone(self.zone)
+        remaining = timedelta(minutes=minutes)
+        # Whole weeks without holidays consume exactly weekly_minutes each.
+        weeks = max(int(minutes // self.weekly_minutes) - 1, 0)
+        if weeks and not self._has_holiday(local.date(), local.date() + timedelta(days=7 * weeks)):
+            local += timedelta(days=7 * weeks)
+            remaining -= weeks * self.weekly_minutes * _MINUTE
+        start = local.astimezone(timezone.utc)
+        day = local.date()
+        for _ in range(MAX_CALENDAR_DAYS):
+            if not self._has_holiday(day, day):
+                for open_minute, close_minute in self.week[day.weekday()]:
+                    closes = self._at(day, close_minute)
+                    if closes <= start:
+                        continue
+                    begin = max(self._at(day, open_minute), start)
+                    if remaining <= closes - begin:
+                        return begin + remaining
+                    remaining -= closes - begin
+            day += timedelta(days=1)
+        raise ValueError("Deadline is more than ten years of business hours away")
+
+
+@lru_cache(maxsize=256)
+def _calendar(spec_json: str) -> BusinessHours:
+    return BusinessHours.parse(json.loads(spec_json))
+
+
+def calendar(spec: dict) -> BusinessHours:
+    """Parsed business hours, cached by content."""
+    return _calendar(json.dumps(spec, sort_keys=True))
+
+
+def _utc(value) -> datetime:
+    return datetime.fromtimestamp(sla_scheduler.timestamp(value), timezone.utc)
+
+
+def deadline(policy: Optional[dict], priority: Optional[str], created_at) -> datetime:
+    """Resolution deadline for a ticket, as naive UTC like the stored timestamps."""
+    start = _utc(created_at)
+    if policy and policy.get("resolution_time_minutes"):
+        minutes = policy["resolution_time_minutes"]
+        if policy.get("business_hours"):
+            return calendar(policy["business_hours"]).add(start, minutes).replace(tzinfo=None)
+    else:
+        minutes = DEFAULT_RESOLUTION_HOURS.get(priority, 8) * 60
+    return (start + timedelta(minutes=minutes)).replace(tzinfo=None)
+
+
+_runs: "OrderedDict[str, dict]" = OrderedDict()
+
+
+def _progress(run: dict) -> dict:
+    return {key: value for key, value in run.items() if key != "organizationId"}
+
+
+def runs(org_id: str) -> List[dict]:
+    """The org's recent recompute runs in this process, newest first."""
+    return [_progress(run) for run in reversed(_runs.values()) if run["organizationId"] == org_id]
+
+
+async def start_recompute(org_id: str, priorities: Optional[List[str]] = None) -> str:
+    """Queue a recompute of the org's active tickets (of `priorities`, or
+    all); returns the run id."""
+    run_id = str(uuid.uuid4())
+    _runs[run_id] = {
+        "id": run_id,
+        "organizationId": org_id,
+        "priorities": sorted(set(priorities)) if priorities else None,
+        "state": "queued",
+        "processed": 0,
+        "updated": 0,
+        "chunks": 0,
+        "queuedAt": datetime.utcnow().isoformat(),
+        "finishedAt": None,
+        "error": None,
+    }
+    while len(_runs) > SLA_RECOMPUTE_HISTORY:
+        _runs.popitem(last=False)
+    await jobs.enqueue("sla_recompute", {"run_id": run_id, "org_id": org_id, "priorities": priorities})
+    return run_id
+
+
+async def local_set_sla_deadlines(db, params: dict):
+    updated = 0
+    for ticket_id, value in params["p_deadlines"].items():
+        result = await execute(db.table("tickets")
+            .update({"sla_deadline": value})
+            .eq("id", ticket_id)
+            .in_("status", sla_scheduler.SLA_ACTIVE_STATUSES))
+        updated += len(result.data)
+    return updated
+
+
+async def recompute(payload: dict):
+    """Job handler: rewrite the deadlines of active tickets under the org's
+    current policies. Safe to rerun; deadlines within a second of the new
+    value (create_ticket's clock vs the row's created_at) are not written."""
+    org_id, priorities = payload["org_id"], payload.get("priorities")
+    run = _runs.get(payload.get("run_id"))
+    if run is None:
+        run = _runs[payload["run_id"]] = {"id": payload["run_id"], "organizationId": org_id, "priorities": priorities}
+    run.update(state="running", processed=0, updated=0, chunks=0, finishedAt=None, error=None)
+    db = await get_db()
+    try:
+        org_config.invalidate(org_id)
+        config = await org_config.get_org_config(db, org_id)
+        policies: Dict[str, Optional[dict]] = {}
+        last_id = None
+        while True:
+            query = (db.table("tickets")
+                .select("id, priority, created_at, sla_deadline")
+                .eq("organization_id", org_id)
+                .in_("status", sla_scheduler.SLA_ACTIVE_STATUSES)
+                .eq("sla_exempt", False))
+            if priorities:
+                query = query.in_("priority", priorities)
+            if last_id is not None:
+                query = query.gt("id", last_id)
+            rows = (await execute(query.order("id").limit(SLA_RECOMPUTE_CHUNK))).data
+            changed = {}
+            for row in rows:
+                priority = row.get("priority")
+                if priority not in policies:
+                    policies[priority] = config.sla_policy(priority)
+                new = deadline(policies[priority], priority, row["created_at"])
+                current = row.get("sla_deadline")
+                if current is None or abs(sla_scheduler.timestamp(current) - sla_scheduler.timestamp(new)) >= 1:
+                    changed[str(row["id"])] = new.isoformat()
+            if changed:
+                run["updated"] += await call_rpc(db, "set_sla_deadlines", {"p_deadlines": changed},
+                                                 local_set_sla_deadlines) or 0
+                for ticket_id, value in changed.items():
+                    sla_scheduler.track(ticket_id, value)
+            run["processed"] += len(rows)
+            run["chunks"] += 1
+            bus.publish(org_id, "sla.recompute", _progress(run))
+            if len(rows) < SLA_RECOMPUTE_CHUNK:
+                break
+            last_id = rows[-1]["id"]
+            await asyncio.sleep(0)
+    except Exception as e:
+        run.update(state="failed", error=str(e), finishedAt=datetime.utcnow().isoformat())
+        bus.publish(org_id, "sla.recompute", _progress(run))
+        raise
+    run.update(state="done", finishedAt=datetime.utcnow().isoformat())
+    bus.publish(org_id, "sla.recompute", _progress(run))
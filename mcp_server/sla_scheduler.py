@@ -0,0 +1,234 @@
+"""
+SLA deadline scheduler.
+
+Every active ticket (open, assigned or in progress) with an sla_deadline
+sits in an in-memory min-heap keyed on the time its next action is due. A
+warning fires SLA_WARNING_SECONDS before the deadline, and the breach fires
+at the deadline. The app supplies both actions at start: the breach goes
+through the same escalate() as the escalate endpoint, so a breach looks
+exactly like a manual escalation to clients.
+
+The heap is loaded from the database at startup (keyset pages of
+SLA_LOAD_PAGE_SIZE), skipping sla_exempt tickets, and then maintained
+incrementally: track() when a ticket is created or its deadline changes,
+untrack() when it is resolved or escalated. Both are O(log n) or O(1).
+Superseded heap entries are not searched for; they are skipped when they
+surface and compacted away once they outnumber the live ones. Compaction
+waits while a batch is being fired: an in-flight ticket has no heap entry
+until its handler finishes, and rebuilding from _deadlines would queue it a
+second time. Only the current deadline per ticket is stored, so a million
+pending deadlines cost one heap entry and one dict entry each.
+
+The breach handler re-checks status and deadline in the UPDATE itself.
+Running this in several worker processes escalates a ticket once, and a
+deadline moved by another process is not breached early.
+
+Environment:
+    SLA_SCHEDULER_ENABLED   "false" disables automatic warnings and escalation (default true)
+    SLA_WARNING_SECONDS     lead time for the warning; 0 disables warnings (default 900)
+    SLA_LOAD_PAGE_SIZE      tickets per page when loading at startup (default 1000)
+    SLA_FIRE_BATCH          due tickets handled concurrently (default 50)
+    SLA_RETRY_SECONDS       delay before retrying a failed warning/escalation (default 30)
+"""
+import asyncio
+import heapq
+import os
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from db import execute, get_db
+
+SLA_SCHEDULER_ENABLED = os.getenv("SLA_SCHEDULER_ENABLED", "true").lower() != "false"
+SLA_WARNING_SECONDS = float(os.getenv("SLA_WARNING_SECONDS", "900"))
+SLA_LOAD_PAGE_SIZE = int(os.getenv("SLA_LOAD_PAGE_SIZE", "1000"))
+SLA_FIRE_BATCH = int(os.getenv("SLA_FIRE_BATCH", "50"))
+SLA_RETRY_SECONDS = float(os.getenv("SLA_RETRY_SECONDS", "30"))
+SLA_ACTIVE_STATUSES = ["open", "assigned", "in_progress"]
+MAX_SLEEP_SECONDS = 60
+_COMPACT_MIN_STALE = 1024
+
+Deadline = Union[datetime, str]
+
+_deadlines: Dict[str, float] = {}
+_warned: Set[str] = set()
+_not_before: Dict[str, float] = {}
+_heap: List[Tuple[float, str]] = []
+_firing = False
+_wake: Optional[asyncio.Event] = None
+_tasks: List[asyncio.Task] = []
+_on_warning: Optional[Callable[[str], Awaitable[None]]] = None
+_on_breach: Optional[Callable[[str], Awaitable[Optional[Deadline]]]] = None
+
+
+def timestamp(deadline: Deadline) -> float:
+    """Epoch seconds for a deadline; naive values are UTC, as the app writes them."""
+    if isinstance(deadline, str):
+        deadline = datetime.fromisoformat(deadline.replace("Z", "+00:00"))
+    if deadline.tzinfo is None:
+        deadline = deadline.replace(tzinfo=timezone.utc)
+    return deadline.timestamp()
+
+
+def _next_fire(ticket_id: str) -> Optional[float]:
+    deadline = _deadlines.get(ticket_id)
+    if deadline is None:
+        return None
+    fire_at = deadline
+    if SLA_WARNING_SECONDS > 0 and ticket_id not in _warned:
+        fire_at = deadline - SLA_WARNING_SECONDS
+    return max(fire_at, _not_before.get(ticket_id, fire_at))
+
+
+def _push(ticket_id: str):
+    fire_at = _next_fire(ticket_id)
+    heapq.heappush(_heap, (fire_at, ticket_id))
+    if _wake is not None and _heap[0][1] == ticket_id:
+        _wake.set()
+    if not _firing:
+        _compact()
+
+
+def _compact():
+    global _heap
+    if len(_heap) - len(_deadlines) <= max(len(_deadlines), _COMPACT_MIN_STALE):
+        return
+    _heap = [(_next_fire(ticket_id), ticket_id) for ticket_id in _deadlines]
+    heapq.heapify(_heap)
+
+
+def track(ticket_id: str, deadline: Optional[Deadline]):
+    """Schedule (or reschedule) a ticket's SLA actions."""
+    if deadline is None:
+        untrack(ticket_id)
+        return
+    ticket_id = str(ticket_id)
+    at = timestamp(deadline)
+    if _deadlines.get(ticket_id) == at:
+        return
+    _deadlines[ticket_id] = at
+    _warned.discard(ticket_id)
+    _not_before.pop(ticket_id, None)
+    _push(ticket_id)
+
+
+def untrack(ticket_id: str):
+    """Forget a ticket that no longer has a running SLA."""
+    ticket_id = str(ticket_id)
+    _deadlines.pop(ticket_id, None)
+    _warned.discard(ticket_id)
+    _not_before.pop(ticket_id, None)
+
+
+def pending_count() -> int:
+    return len(_deadlines)
+
+
+def _pop_due(now: float) -> List[str]:
+    due = []
+    while _heap and _heap[0][0] <= now and len(due) < SLA_FIRE_BATCH:
+        fire_at, ticket_id = heapq.heappop(_heap)
+        if _next_fire(ticket_id) == fire_at:
+            due.append(ticket_id)
+    return due
+
+
+async def _fire(ticket_id: str):
+    deadline = _deadlines.get(ticket_id)
+    if deadline is None:
+        return
+    try:
+        if SLA_WARNING_SECONDS > 0 and ticket_id not in _warned:
+            await _on_warning(ticket_id)
+            if _deadlines.get(ticket_id) == deadline:
+                _warned.add(ticket_id)
+                _push(ticket_id)
+            return
+        current = await _on_breach(ticket_id)
+        if _deadlines.get(ticket_id) == deadline:
+            untrack(ticket_id)
+            if current is not None:
+                # Not breached after all: another process moved the deadline.
+                track(ticket_id, current)
+    except Exception as e:
+        print(f"SLA scheduler error ({ticket_id}): {e}")
+        if _deadlines.get(ticket_id) == deadline:
+            _not_before[ticket_id] = time.time() + SLA_RETRY_SECONDS
+            _push(ticket_id)
+
+
+async def _run():
+    global _firing
+    while True:
+        due = _pop_due(time.time())
+        if due:
+            _firing = True
+            try:
+                await asyncio.gather(*(_fire(ticket_id) for ticket_id in due))
+            finally:
+                _firing = False
+            _compact()
+            continue
+        timeout = MAX_SLEEP_SECONDS
+        if _heap:
+            timeout = min(max(_heap[0][0] - time.time(), 0), MAX_SLEEP_SECONDS)
+        _wake.clear()
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def load():
+    """Track every active, non-exempt ticket with a deadline, one keyset
+    page at a time."""
+    db = await get_db()
+    last_id = None
+    loaded = 0
+    while True:
+        query = (db.table("tickets")
+            .select("id, sla_deadline")
+            .in_("status", SLA_ACTIVE_STATUSES)
+            .eq("sla_exempt", False))
+        if last_id is not None:
+            query = query.gt("id", last_id)
+        rows = (await execute(query.order("id").limit(SLA_LOAD_PAGE_SIZE))).data
+        for row in rows:
+            if row.get("sla_deadline"):
+                track(row["id"], row["sla_deadline"])
+                loaded += 1
+        if len(rows) < SLA_LOAD_PAGE_SIZE:
+            break
+        last_id = rows[-1]["id"]
+    print(f"SLA scheduler tracking {loaded} deadlines")
+
+
+async def _load_and_run():
+    while True:
+        try:
+            await load()
+            break
+        except Exception as e:
+            print(f"SLA scheduler load error: {e}")
+            await asyncio.sleep(SLA_RETRY_SECONDS)
+    await _run()
+
+
+def start_sla_scheduler(on_warning: Callable[[str], Awaitable[None]],
+                        on_breach: Callable[[str], Awaitable[Optional[Deadline]]]):
+    """on_warning(ticket_id) announces an upcoming breach. on_breach(ticket_id)
+    escalates, returning None, or returns the ticket's current deadline when
+    it turned out not to be breached."""
+    global _on_warning, _on_breach, _wake
+    if _tasks or not SLA_SCHEDULER_ENABLED:
+        return
+    _on_warning, _on_breach = on_warning, on_breach
+    _wake = asyncio.Event()
+    _tasks.append(asyncio.create_task(_load_and_run()))
+
+
+async def stop_sla_scheduler():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
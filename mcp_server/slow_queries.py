@@ -0,0 +1,142 @@
+"""
+Slow-query log for the data layer.
+
+Every db.execute() that takes at least SLOW_QUERY_MS is recorded in a
+bounded in-memory ring buffer. Each entry holds the table, the operation,
+the full PostgREST filter/order/limit chain, the row count (or the error),
+the endpoint that issued it and the elapsed time. Once the buffer is full,
+the oldest entries are dropped.
+
+Entries are aggregated by shape: the same chain with its values replaced by
+"?", so every get_queue search folds into one row whatever the term:
+
+    select tickets ?assignee_id=eq.?&status=in.?&organization_id=eq.?&search_vector=fts(english).?&order=created_at.desc
+
+Environment:
+    SLOW_QUERY_MS           threshold in milliseconds (default 200)
+    SLOW_QUERY_LOG_SIZE     entries kept (default 500)
+    SLOW_QUERY_LOG_VALUES   "true" also stores filter values and error text (default false)
+
+The log covers every org in the process, so it is read through the
+operator-only /mcp/admin/slow-queries, and values are off unless asked for.
+Stdout only ever gets the shape.
+"""
+import os
+import re
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from db import add_query_listener, describe_query
+from metrics import current_endpoint
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "500"))
+SLOW_QUERY_LOG_VALUES = os.getenv("SLOW_QUERY_LOG_VALUES", "false").lower() == "true"
+
+# An operator and its value inside a filter: eq.open, in.(a,b), ilike.*vpn*
+_FILTER_VALUE = re.compile(
+    r"\b(eq|neq|gt|gte|lt|lte|like|ilike|is|in|cs|cd|fts|plfts|phfts|wfts)(\(\w+\))?\.(\([^)]*\)|[^,()]*)"
+)
+_UNVALUED_PARAMS = {"order"}
+
+_entries: Deque[dict] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+_recorded = 0
+
+
+def _shape_value(key: str, value: str) -> str:
+    if key in _UNVALUED_PARAMS:
+        return value
+    if key in ("limit", "offset"):
+        return "?"
+    return _FILTER_VALUE.sub(lambda match: f"{match.group(1)}{match.group(2) or ''}.?", value)
+
+
+def query_shape(operation: str, table: str, params: List[Tuple[str, str]]) -> str:
+    chain = "&".join(f"{key}={_shape_value(key, value)}" for key, value in params)
+    return f"{operation} {table}" + (f" ?{chain}" if chain else "")
+
+
+def _on_query(query, seconds: float, outcome):
+    global _recorded
+    elapsed_ms = seconds * 1000
+    if elapsed_ms < SLOW_QUERY_MS:
+        return
+    try:
+        operation, table, params = describe_query(query)
+    except Exception:
+        operation, table, params = "query", type(query).__name__, []
+    shape = query_shape(operation, table, params)
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "elapsedMs": round(elapsed_ms, 1),
+        "operation": operation,
+        "table": table,
+        "shape": shape,
+        "query": "&".join(f"{key}={value}" for key, value in params) if SLOW_QUERY_LOG_VALUES else None,
+        "endpoint": current_endpoint(),
+        "rows": None,
+        "error": None,
+    }
+    if isinstance(outcome, Exception):
+        entry["error"] = f"{type(outcome).__name__}: {outcome}" if SLOW_QUERY_LOG_VALUES else type(outcome).__name__
+    else:
+        data = getattr(outcome, "data", None)
+        entry["rows"] = len(data) if isinstance(data, list) else (0 if data is None else 1)
+    _entries.append(entry)
+    _recorded += 1
+    print(f"Slow query ({entry['elapsedMs']} ms, {entry['rows']} rows) from {entry['endpoint'] or 'background'}: {shape}")
+
+
+add_query_listener(_on_query)
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def recent(limit: int = 100, table: Optional[str] = None) -> List[dict]:
+    """Newest entries first."""
+    entries = [entry for entry in reversed(_entries) if table is None or entry["table"] == table]
+    return entries[:limit]
+
+
+def by_shape(table: Optional[str] = None) -> List[dict]:
+    """Entries in the buffer grouped by query shape, slowest total time first."""
+    groups: Dict[str, List[dict]] = {}
+    for entry in _entries:
+        if table is None or entry["table"] == table:
+            groups.setdefault(entry["shape"], []).append(entry)
+    summary = []
+    for shape, entries in groups.items():
+        elapsed = sorted(entry["elapsedMs"] for entry in entries)
+        rows = [entry["rows"] for entry in entries if entry["rows"] is not None]
+        summary.append({
+            "shape": shape,
+            "table": entries[0]["table"],
+            "count": len(entries),
+            "errors": sum(1 for entry in entries if entry["error"]),
+            "totalMs": round(sum(elapsed), 1),
+            "p50Ms": _percentile(elapsed, 0.5),
+            "p95Ms": _percentile(elapsed, 0.95),
+            "maxMs": elapsed[-1],
+            "avgRows": round(sum(rows) / len(rows), 1) if rows else None,
+            "endpoints": sorted({entry["endpoint"] for entry in entries if entry["endpoint"]}),
+            "lastSeen": entries[-1]["at"],
+            "example": entries[-1]["query"],
+        })
+    summary.sort(key=lambda group: group["totalMs"], reverse=True)
+    return summary
+
+
+def stats() -> dict:
+    return {
+        "thresholdMs": SLOW_QUERY_MS,
+        "capacity": SLOW_QUERY_LOG_SIZE,
+        "buffered": len(_entries),
+        "recorded": _recorded,
+    }
+
+
+def clear():
+    _entries.clear()
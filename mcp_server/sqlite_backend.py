@@ -0,0 +1,555 @@
+"""
+Embedded SQLite storage backend (DB_BACKEND=sqlite).
+
+SqliteClient answers the part of the supabase-py query builder the MCP
+server uses: table(...).select / insert / update / delete with eq, neq,
+gt, gte, lt, lte, in_, is_, ilike, or_, filter, order, limit and range, and
+select(..., count="exact").
+The endpoints run unchanged against a local file, for offline benchmarks
+and small single-tenant installs. There are no Postgres functions here, so
+call_rpc runs their in-process stand-ins instead.
+
+The schema comes from the migrations in migrations.py. Any that are pending
+are translated and applied when the database is opened:
+  - UUID and TIMESTAMPTZ columns become TEXT with SQLite defaults.
+  - Composite and partial indexes are kept.
+  - Generated columns become VIRTUAL.
+  - Each tsvector search column becomes an FTS5 table, kept in sync by
+    triggers.
+  - DROP TABLE, DROP INDEX and DROP COLUMN are applied, so rolling a
+    migration back changes the schema as it does on Postgres.
+Row level security, policies and plpgsql functions are skipped.
+
+Every statement runs on one connection owned by a single worker thread.
+That keeps disk I/O off the event loop and serializes writes.
+"""
+import asyncio
+import json
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+from postgrest.exceptions import APIError
+
+from migrations import SCHEMA_MIGRATIONS_SQL, plan
+
+_UUID_DEFAULT = (
+    "(lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2)"
+    " || '-' || substr('89ab', 1 + (abs(random()) % 4), 1) || substr(hex(randomblob(2)), 2)"
+    " || '-' || hex(randomblob(6))))"
+)
+_NOW_DEFAULT = "(strftime('%Y-%m-%dT%H:%M:%f', 'now'))"
+
+# Postgres -> SQLite rewrites applied to column definitions.
+_REWRITES = [
+    (re.compile(r"\bgen_random_uuid\(\)", re.I), _UUID_DEFAULT),
+    (re.compile(r"\bNOW\(\)", re.I), _NOW_DEFAULT),
+    (re.compile(r"\bTIMESTAMP WITH TIME ZONE\b|\bTIMESTAMPTZ\b", re.I), "TEXT"),
+    (re.compile(r"\bUUID\b", re.I), "TEXT"),
+]
+
+_FUNCTION = re.compile(r"CREATE OR REPLACE FUNCTION.*?\$\$.*?\$\$;", re.I | re.S)
+_COMMENT = re.compile(r"--[^\n]*")
+_CREATE_TABLE = re.compile(r"^CREATE TABLE IF NOT EXISTS \w+", re.I)
+_ADD_COLUMN = re.compile(r"^ALTER TABLE (\w+) ADD COLUMN IF NOT EXISTS (\w+) (.*)$", re.I)
+_GENERATED = re.compile(r"^(\w+) GENERATED ALWAYS AS \((.*)\) STORED$", re.I)
+_CREATE_INDEX = re.compile(r"^CREATE INDEX IF NOT EXISTS ", re.I)
+_DROP_INDEX = re.compile(r"^DROP INDEX IF EXISTS \w+$", re.I)
+_DROP_TABLE = re.compile(r"^DROP TABLE IF EXISTS (\w+)$", re.I)
+_DROP_COLUMN = re.compile(r"^ALTER TABLE (\w+) DROP COLUMN IF EXISTS (\w+)$", re.I)
+_SEARCH_SOURCE = re.compile(r"COALESCE\((\w+), ''\)", re.I)
+
+_FTS_OPERATOR = re.compile(r"^(fts|plfts|wfts)(\(\w+\))?$")
+_TSQUERY_TERM = re.compile(r"(\w+)(:\*)?")
+_LOGIC_GROUP = re.compile(r"^(not\.)?(and|or)\((.*)\)$", re.S)
+
+_HTTP_METHODS = {"select": "GET", "insert": "POST", "update": "PATCH", "delete": "DELETE"}
+_COMPARISONS = {"eq": "=", "neq": "<>", "gt": ">", "gte": ">=", "lt": "<", "lte": "<="}
+_ERROR_CODES = [
+    ("UNIQUE constraint failed", "23505"),
+    ("FOREIGN KEY constraint failed", "23503"),
+    ("NOT NULL constraint failed", "23502"),
+    ("no such column", "42703"),
+    ("no such table", "42P01"),
+]
+
+
+def _api_error(message: str, code: Optional[str] = None) -> APIError:
+    if code is None:
+        code = next((code for text, code in _ERROR_CODES if text in message), "XX000")
+    return APIError({"message": message, "code": code, "hint": None, "details": None})
+
+
+def _rewrite(definition: str) -> str:
+    for pattern, replacement in _REWRITES:
+        definition = pattern.sub(replacement, definition)
+    return definition
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> Dict[str, str]:
+    """Column name -> declared type, including generated columns."""
+    return {row[1]: (row[2] or "").upper() for row in conn.execute(f'PRAGMA table_xinfo("{table}")')}
+
+
+def _create_search_index(conn: sqlite3.Connection, table: str, columns: List[str]) -> str:
+    """FTS5 shadow of `table` standing in for its tsvector column."""
+    fts = f"{table}_fts"
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (fts,)).fetchone()
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{column}" for column in columns)
+    old = ", ".join(f"old.{column}" for column in columns)
+    # One statement per execute(): executescript() would commit the
+    # migration's transaction.
+    conn.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {names}, content='{table}', content_rowid='rowid', tokenize='porter unicode61')""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});
+        END""")
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN
+            INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.rowid, {old});
+            INSERT INTO {fts}(rowid, {names}) VALUES (new.rowid, {new});
+        END""")
+    if not exists:
+        conn.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def _search_tables(conn: sqlite3.Connection) -> Dict[str, str]:
+    """table -> FTS table for every searchable table."""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE % USING fts5(%'"
+    ).fetchall()
+    return {name[: -len("_fts")]: name for (name,) in rows if name.endswith("_fts")}
+
+
+def apply_schema(conn: sqlite3.Connection, sql: str):
+    """Create and drop tables, columns and indexes from Postgres DDL."""
+    for statement in _FUNCTION.sub("", _COMMENT.sub("", sql)).split(";"):
+        statement = " ".join(statement.split())
+        if _CREATE_TABLE.match(statement):
+            conn.execute(_rewrite(statement))
+            continue
+        if _CREATE_INDEX.match(statement):
+            if " USING " not in statement.upper():
+                conn.execute(statement)
+            continue
+        if _DROP_INDEX.match(statement):
+            conn.execute(statement)
+            continue
+        dropped = _DROP_TABLE.match(statement)
+        if dropped:
+            fts = _search_tables(conn).get(dropped.group(1))
+            if fts:
+                conn.execute(f"DROP TABLE IF EXISTS {fts}")
+            conn.execute(statement)
+            continue
+        dropped = _DROP_COLUMN.match(statement)
+        if dropped:
+            table, column = dropped.groups()
+            if column in _columns(conn, table):
+                conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+            continue
+        added = _ADD_COLUMN.match(statement)
+        if not added:
+            continue
+        table, column, definition = added.groups()
+        existing = _columns(conn, table)
+        if definition.upper().startswith("TSVECTOR"):
+            sources = [name for name in _SEARCH_SOURCE.findall(definition) if name in existing]
+            if sources:
+                _create_search_index(conn, table, sources)
+            continue
+        if column in existing:
+            continue
+        generated = _GENERATED.match(definition)
+        if generated:
+            definition = f"{generated.group(1)} GENERATED ALWAYS AS ({generated.group(2)}) VIRTUAL"
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {_rewrite(definition)}")
+
+
+def applied_versions(conn: sqlite3.Connection) -> List[int]:
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'schema_migrations'").fetchone():
+        return []
+    return [version for (version,) in conn.execute("SELECT version FROM schema_migrations ORDER BY version")]
+
+
+def migrate(conn: sqlite3.Connection, target: Optional[int] = None) -> List[str]:
+    """Apply or roll back migrations up to target (default latest), one
+    transaction per step; returns the steps taken."""
+    steps = []
+    for direction, migration in plan(applied_versions(conn), target):
+        conn.execute("BEGIN")
+        try:
+            apply_schema(conn, SCHEMA_MIGRATIONS_SQL)
+            if direction == "up":
+                apply_schema(conn, migration.up)
+                conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)",
+                             (migration.version, migration.name))
+            else:
+                apply_schema(conn, migration.down)
+                conn.execute("DELETE FROM schema_migrations WHERE version = ?", (migration.version,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        steps.append(f"{direction} {migration.version} {migration.name}")
+    return steps
+
+
+def explain_plan(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for sql."""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def _split(text: str) -> List[str]:
+    """Split a PostgREST logic tree on top-level commas."""
+    parts, current, depth, quoted, escaped = [], [], 0, False, False
+    for char in text:
+        if escaped:
+            escaped = False
+        elif char == "\\" and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    parts.append("".join(current))
+    return [part for part in parts if part]
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    return value
+
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class SqliteResponse(NamedTuple):
+    data: List[dict]
+    count: Optional[int] = None
+
+
+class SqliteRequest(NamedTuple):
+    """The PostgREST request a query corresponds to (path, method, params)."""
+    path: str
+    http_method: str
+    params: httpx.QueryParams
+
+
+class SqliteQuery:
+    """One table(...) chain; mirrors the postgrest-py request builder."""
+
+    def __init__(self, client: "SqliteClient", table: str):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = "*"
+        self._values: Any = None
+        self._where: List[Tuple[str, list]] = []
+        self._order: List[str] = []
+        self._limit: Optional[int] = None
+        self._offset: Optional[int] = None
+        self._params: List[Tuple[str, str]] = []
+        self._count: Optional[str] = None
+
+    @property
+    def request(self) -> SqliteRequest:
+        return SqliteRequest(f"/{self._table}", _HTTP_METHODS[self._action], httpx.QueryParams(self._params))
+
+    def select(self, *columns: str, count: Optional[str] = None):
+        self._count = count
+        names = [name for group in columns for name in group.split(",") if name.strip()]
+        if names and names != ["*"]:
+            self._columns = ", ".join(self._client.quote(self._table, name) for name in names)
+        return self
+
+    def insert(self, values):
+        self._action, self._values = "insert", values
+        return self
+
+    def update(self, values: dict):
+        self._action, self._values = "update", values
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    def _add(self, column: str, operator: str, value: Any, raw: bool = False):
+        if isinstance(value, list):
+            self._params.append((column, f"{operator}.({','.join(map(str, value))})"))
+        else:
+            self._params.append((column, f"{operator}.{value}"))
+        self._where.append(self._client.condition(self._table, column, operator, value, raw))
+        return self
+
+    def eq(self, column: str, value: Any):
+        return self._add(column, "eq", value)
+
+    def neq(self, column: str, value: Any):
+        return self._add(column, "neq", value)
+
+    def gt(self, column: str, value: Any):
+        return self._add(column, "gt", value)
+
+    def gte(self, column: str, value: Any):
+        return self._add(column, "gte", value)
+
+    def lt(self, column: str, value: Any):
+        return self._add(column, "lt", value)
+
+    def lte(self, column: str, value: Any):
+        return self._add(column, "lte", value)
+
+    def in_(self, column: str, values):
+        return self._add(column, "in", list(values))
+
+    def is_(self, column: str, value: Any):
+        return self._add(column, "is", value)
+
+    def ilike(self, column: str, pattern: str):
+        return self._add(column, "ilike", pattern)
+
+    def filter(self, column: str, operator: str, criteria: str):
+        return self._add(column, operator, criteria, raw=True)
+
+    def or_(self, filters: str):
+        self._params.append(("or", f"({filters})"))
+        self._where.append(self._client.logic_tree(self._table, "or", filters))
+        return self
+
+    def order(self, column: str, *, desc: bool = False, nullsfirst: Optional[bool] = None):
+        if nullsfirst is None:
+            nullsfirst = desc
+        direction = "DESC" if desc else "ASC"
+        nulls = "FIRST" if nullsfirst else "LAST"
+        self._params.append(("order", f"{column}.{direction.lower()}"))
+        self._order.append(f"{self._client.quote(self._table, column)} {direction} NULLS {nulls}")
+        return self
+
+    def limit(self, size: int):
+        self._params.append(("limit", str(size)))
+        self._limit = size
+        return self
+
+    def range(self, start: int, end: int):
+        self._params.extend([("offset", str(start)), ("limit", str(end - start + 1))])
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def _where_clause(self) -> Tuple[str, list]:
+        if not self._where:
+            return "", []
+        params = [param for _, group in self._where for param in group]
+        return " WHERE " + " AND ".join(sql for sql, _ in self._where), params
+
+    def _statements(self) -> List[Tuple[str, list]]:
+        quote = self._client.quote
+        table = quote(self._table)
+        where, params = self._where_clause()
+        if self._action == "insert":
+            rows = self._values if isinstance(self._values, list) else [self._values]
+            statements = []
+            for row in rows:
+                columns = ", ".join(quote(self._table, column) for column in row)
+                marks = ", ".join("?" for _ in row)
+                sql = f"INSERT INTO {table} ({columns}) VALUES ({marks}) RETURNING *"
+                if not row:
+                    sql = f"INSERT INTO {table} DEFAULT VALUES RETURNING *"
+                statements.append((sql, [_encode(value) for value in row.values()]))
+            return statements
+        if self._action in ("update", "delete") and not where:
+            raise _api_error(f"{self._action.upper()} requires a WHERE clause", "21000")
+        if self._action == "update":
+            assignments = ", ".join(f"{quote(self._table, column)} = ?" for column in self._values)
+            values = [_encode(value) for value in self._values.values()]
+            return [(f"UPDATE {table} SET {assignments}{where} RETURNING *", values + params)]
+        if self._action == "delete":
+            return [(f"DELETE FROM {table}{where} RETURNING *", params)]
+        sql = f"SELECT {self._columns} FROM {table}{where}"
+        if self._order:
+            sql += " ORDER BY " + ", ".join(self._order)
+        if self._limit is not None or self._offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = params + [-1 if self._limit is None else self._limit, self._offset or 0]
+        return [(sql, params)]
+
+    async def execute(self) -> SqliteResponse:
+        statements = self._statements()
+        response = await self._client.run(self._table, statements)
+        if self._count and self._action == "select":
+            where, params = self._where_clause()
+            counted = await self._client.run(self._table, [
+                (f"SELECT COUNT(*) AS total FROM {self._client.quote(self._table)}{where}", params)
+            ])
+            response = response._replace(count=counted.data[0]["total"])
+        return response
+
+
+class SqliteClient:
+    def __init__(self, path: str):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._tables: Dict[str, Dict[str, str]] = {}
+        self._search: Dict[str, str] = {}
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA foreign_keys = ON")
+        migrate(conn)
+        self._search = _search_tables(conn)
+        tables = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+        self._tables = {name: _columns(conn, name) for (name,) in tables}
+        self._conn = conn
+
+    async def open(self) -> "SqliteClient":
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._open)
+        return self
+
+    async def close(self):
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def table(self, name: str) -> SqliteQuery:
+        return SqliteQuery(self, name)
+
+    def quote(self, table: str, column: Optional[str] = None) -> str:
+        """Quoted table or column name; unknown names fail like PostgREST."""
+        columns = self._tables.get(table)
+        if columns is None:
+            raise _api_error(f'relation "public.{table}" does not exist', "42P01")
+        if column is None:
+            return f'"{table}"'
+        column = column.strip()
+        if column not in columns:
+            raise _api_error(f"column {table}.{column} does not exist", "42703")
+        return f'"{column}"'
+
+    def rpc(self, name: str, params: dict):
+        raise _api_error(f"Function {name} is not available on the SQLite backend", "42883")
+
+    def _coerce(self, table: str, column: str, value: Any) -> Any:
+        """Turn a PostgREST string value into what the column stores."""
+        kind = self._tables.get(table, {}).get(column, "")
+        if kind == "BOOLEAN" and value in ("true", "false"):
+            return int(value == "true")
+        return value
+
+    def condition(self, table: str, column: str, operator: str, value: Any, raw: bool = False) -> Tuple[str, list]:
+        """SQL and parameters for one `column.operator.value` filter."""
+        negate = operator.startswith("not.")
+        if negate:
+            operator = operator[4:]
+        if raw and operator != "in":
+            value = self._coerce(table, column, _unquote(value))
+        if _FTS_OPERATOR.match(operator) and table in self._search:
+            fts = self._search[table]
+            terms = [f'"{term}"*' if prefix else f'"{term}"' for term, prefix in _TSQUERY_TERM.findall(value)]
+            sql, params = f"rowid IN (SELECT rowid FROM {fts} WHERE {fts} MATCH ?)", [" AND ".join(terms)]
+            return (f"NOT ({sql})" if negate else sql), params
+        name = self.quote(table, column)
+        if operator in _COMPARISONS:
+            sql, params = f"{name} {_COMPARISONS[operator]} ?", [_encode(value)]
+        elif operator == "ilike":
+            sql, params = f"{name} LIKE ?", [value.replace("*", "%")]
+        elif operator == "is":
+            keyword = {None: "NULL", "null": "NULL", True: "TRUE", "true": "TRUE", False: "FALSE", "false": "FALSE"}.get(value)
+            if keyword is None:
+                raise _api_error(f"Invalid is filter value: {value!r}", "22P02")
+            sql, params = f"{name} IS {keyword}", []
+        elif operator == "in":
+            if raw:
+                value = [self._coerce(table, column, _unquote(item)) for item in _split(value.strip()[1:-1])]
+            sql = f"{name} IN ({', '.join('?' for _ in value)})" if value else "0"
+            params = [_encode(item) for item in value]
+        else:
+            raise _api_error(f"Unsupported filter operator: {operator}", "42883")
+        return (f"NOT ({sql})" if negate else sql), params
+
+    def logic_tree(self, table: str, joiner: str, filters: str) -> Tuple[str, list]:
+        """SQL for a PostgREST `or=(...)` / `and(...)` filter string."""
+        clauses, params = [], []
+        for part in _split(filters):
+            group = _LOGIC_GROUP.match(part)
+            if group:
+                negate, inner_joiner, inner = group.groups()
+                sql, inner_params = self.logic_tree(table, inner_joiner, inner)
+                sql = f"NOT {sql}" if negate else sql
+            else:
+                column, _, rest = part.partition(".")
+                operator, _, value = rest.partition(".")
+                if operator == "not":
+                    operator, _, value = value.partition(".")
+                    operator = f"not.{operator}"
+                sql, inner_params = self.condition(table, column, operator, value, raw=True)
+            clauses.append(sql)
+            params.extend(inner_params)
+        if not clauses:
+            return "1", []
+        return "(" + f" {joiner.upper()} ".join(clauses) + ")", params
+
+    def _decode(self, table: str, row: sqlite3.Row) -> dict:
+        kinds = self._tables.get(table, {})
+        data = dict(row)
+        for column, value in data.items():
+            if value is None:
+                continue
+            kind = kinds.get(column, "")
+            if kind == "BOOLEAN":
+                data[column] = bool(value)
+            elif kind in ("JSON", "JSONB") and isinstance(value, str):
+                data[column] = json.loads(value)
+        return data
+
+    def _run(self, table: str, statements: List[Tuple[str, list]]) -> SqliteResponse:
+        conn = self._conn
+        rows: List[dict] = []
+        try:
+            if len(statements) > 1:
+                conn.execute("BEGIN")
+            for sql, params in statements:
+                rows.extend(self._decode(table, row) for row in conn.execute(sql, params).fetchall())
+            if conn.in_transaction:
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise _api_error(str(e))
+        return SqliteResponse(rows)
+
+    async def run(self, table: str, statements: List[Tuple[str, list]]) -> SqliteResponse:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, table, statements)
+
+
+async def open_sqlite(path: str) -> SqliteClient:
+    """Open (creating if needed) the database at path with the app schema."""
+    return await SqliteClient(path).open()
@@ -0,0 +1,465 @@
+"""
+Streaming ticket import from NDJSON or CSV, for bringing an org's history
+over from Freshservice and similar helpdesks.
+
+Records are parsed from the byte stream as it arrives, so memory stays flat
+whatever the file size. Each record is mapped onto TicketCreate through
+FIELD_ALIASES, which covers Freshservice export headers and API field
+names. It is then validated and inserted IMPORT_BATCH_SIZE tickets per
+insert. Parsing runs at most IMPORT_MAX_PENDING_BATCHES batches ahead of the
+writer; when the database falls behind, reading stops, and that pushes back
+on the upload (or the file read).
+
+After every batch the import's checkpoint is saved to ticket_imports: rows
+done, byte offset, counts and the first errors. Ticket ids are derived from
+the import id and the source ticket id (or the row number), so rerunning
+an import id never creates a ticket twice. The endpoint skips the
+checkpointed rows of the re-sent stream, and the CLI seeks straight to the
+checkpointed byte offset.
+
+A ticket's SLA deadline is the source's resolution due date when it has
+one, else the org's policy applied to its created time. Open tickets whose
+deadline has already passed are imported with sla_exempt set. They keep
+their status and deadline, but the SLA scheduler never warns about them or
+escalates them, so migrating a backlog does not escalate it all at once.
+
+    python ticket_import.py tickets.csv --org ORG_ID [--import-id ID] [--format csv|ndjson]
+
+Environment:
+    IMPORT_BATCH_SIZE            tickets per insert (default 500)
+    IMPORT_MAX_PENDING_BATCHES   parsed batches waiting for the writer (default 2)
+    IMPORT_MAX_ERRORS            row errors kept in the checkpoint (default 50)
+"""
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from postgrest.exceptions import APIError
+from pydantic import ValidationError
+
+import org_config
+import sla
+import sla_scheduler
+from db import execute
+
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_PENDING_BATCHES = int(os.getenv("IMPORT_MAX_PENDING_BATCHES", "2"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "50"))
+IMPORT_RETRIES = 3
+IMPORT_FORMATS = ["ndjson", "csv"]
+UNIQUE_VIOLATION = "23505"
+
+_NAMESPACE = uuid.UUID("6f1c1b0e-4d0e-4f57-9a64-3b7d2c1e8a90")
+
+# Normalized source field name (lower case, runs of space/underscore as one
+# space) -> import field.
+FIELD_ALIASES = {
+    "title": "title", "subject": "title",
+    "description": "description", "description text": "description",
+    "priority": "priority",
+    "status": "status",
+    "category": "category", "sub category": "subcategory",
+    "asset tag": "assetTag", "assettag": "assetTag",
+    "asset name": "assetName", "assetname": "assetName", "asset": "assetName",
+    "requester": "requester", "requester name": "requester", "requester email": "requester",
+    "agent": "assignee", "responder": "assignee", "assignee": "assignee", "assignee name": "assignee",
+    "created at": "createdAt", "created date": "createdAt", "created time": "createdAt", "createdat": "createdAt",
+    "resolved at": "resolvedAt", "resolved date": "resolvedAt", "resolved time": "resolvedAt",
+    "closed time": "closedAt", "resolvedat": "resolvedAt",
+    "due by": "dueBy", "due by time": "dueBy", "resolution due by": "dueBy", "due by date": "dueBy",
+    "id": "externalId", "ticket id": "externalId", "display id": "externalId", "external id": "externalId",
+    "has bounty": "hasBounty", "hasbounty": "hasBounty",
+    "bounty amount": "bountyAmount", "bountyamount": "bountyAmount",
+}
+
+# Freshservice uses names in exports and numbers in the API.
+PRIORITY_VALUES = {
+    "low": "low", "1": "low",
+    "medium": "medium", "2": "medium",
+    "high": "high", "3": "high",
+    "urgent": "critical", "critical": "critical", "4": "critical",
+}
+STATUS_VALUES = {
+    "open": "open", "2": "open",
+    "pending": "in_progress", "3": "in_progress", "in progress": "in_progress", "in_progress": "in_progress",
+    "assigned": "assigned",
+    "escalated": "escalated",
+    "resolved": "resolved", "4": "resolved", "closed": "resolved", "5": "resolved",
+}
+
+_SEPARATORS = re.compile(r"[\s_]+")
+
+
+def _field(name: str) -> Optional[str]:
+    return FIELD_ALIASES.get(_SEPARATORS.sub(" ", str(name).strip().lower()))
+
+
+def _timestamp(value) -> Optional[str]:
+    """Naive UTC ISO timestamp, as the app stores them."""
+    if value in (None, ""):
+        return None
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed.isoformat()
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Split a byte stream into lines, each with its newline."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        start = 0
+        while True:
+            end = pending.find(b"\n", start)
+            if end < 0:
+                break
+            yield pending[start:end + 1]
+            start = end + 1
+        pending = pending[start:]
+    if pending:
+        yield pending
+
+
+async def records(chunks: AsyncIterator[bytes], fmt: str,
+                  columns: Optional[List[str]] = None) -> AsyncIterator[Tuple[object, int]]:
+    """(record, bytes consumed so far) per record. A record is a dict, or the
+    error message for a line that could not be parsed. The CSV header comes
+    first as a list unless `columns` is given."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    consumed = 0
+    text = ""
+    async for line in _lines(chunks):
+        consumed += len(line)
+        text += decoder.decode(line)
+        if fmt == "ndjson":
+            text, raw = "", text.strip()
+            if not raw:
+                continue
+            try:
+                record = json.loads(raw)
+            except ValueError as e:
+                yield f"Invalid JSON: {e}", consumed
+                continue
+            yield (record if isinstance(record, dict) else "Expected a JSON object"), consumed
+            continue
+        # A CSV record ends at a newline outside quotes: an even quote count.
+        if text.count('"') % 2:
+            continue
+        text, raw = "", text
+        if not raw.strip():
+            continue
+        values = next(csv.reader([raw]))
+        if columns is None:
+            columns = values
+            yield columns, consumed
+            continue
+        if len(values) != len(columns):
+            yield f"Expected {len(columns)} columns, got {len(values)}", consumed
+            continue
+        yield dict(zip(columns, values)), consumed
+    if text.strip():
+        yield "Unterminated quoted field at end of input", consumed
+
+
+class TicketImport:
+    """One import, identified by import_id and checkpointed in ticket_imports.
+
+    model validates the mapped fields (the app's TicketCreate). Imported
+    tickets are requested by requester_name unless the source names one.
+    """
+
+    def __init__(self, db, org_id: str, import_id: str, fmt: str, model,
+                 requester_id: str, requester_name: str, source: Optional[str] = None,
+                 on_progress: Optional[Callable[[dict], None]] = None):
+        self.db = db
+        self.org_id = org_id
+        self.import_id = import_id
+        self.fmt = fmt
+        self.model = model
+        self.requester_id = requester_id
+        self.requester_name = requester_name
+        self.source = source
+        self.on_progress = on_progress
+        self.checkpoint: dict = {}
+        self._policies: Dict[str, Optional[dict]] = {}
+        self._config = None
+
+    async def open(self) -> dict:
+        """Load the checkpoint, creating it for a new import id. Raises
+        ValueError for an unknown format, or an id that belongs to another
+        org or format."""
+        if self.fmt not in IMPORT_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+        result = await execute(self.db.table("ticket_imports").select("*").eq("id", self.import_id))
+        if result.data:
+            checkpoint = result.data[0]
+            if str(checkpoint["organization_id"]) != str(self.org_id):
+                raise ValueError("Import id belongs to another organization")
+            if checkpoint["format"] != self.fmt:
+                raise ValueError(f"Import {self.import_id} is a {checkpoint['format']} import")
+        else:
+            checkpoint = (await execute(self.db.table("ticket_imports").insert({
+                "id": self.import_id,
+                "organization_id": self.org_id,
+                "format": self.fmt,
+                "source": self.source,
+            }))).data[0]
+        self.checkpoint = checkpoint
+        self._config = await org_config.get_org_config(self.db, self.org_id)
+        return checkpoint
+
+    def ticket(self, record: dict, row: int) -> dict:
+        """The tickets row for a source record. Raises ValueError (or
+        pydantic's ValidationError) for a record that cannot be imported."""
+        fields = {}
+        for name, value in record.items():
+            field = _field(name)
+            if field and field not in fields and value not in (None, ""):
+                fields[field] = value.strip() if isinstance(value, str) else value
+        priority = PRIORITY_VALUES.get(str(fields.get("priority", "medium")).lower())
+        if priority is None:
+            raise ValueError(f"Unknown priority: {fields['priority']}")
+        status = STATUS_VALUES.get(str(fields.get("status", "")).lower())
+        if status is None:
+            if fields.get("status"):
+                raise ValueError(f"Unknown status: {fields['status']}")
+            status = "resolved" if fields.get("resolvedAt") or fields.get("closedAt") else "open"
+        ticket = self.model(
+            title=fields.get("title"),
+            description=fields.get("description", ""),
+            priority=priority,
+            category=fields.get("category", "other"),
+            assetTag=fields.get("assetTag"),
+            assetName=fields.get("assetName"),
+            hasBounty=fields.get("hasBounty", False),
+            bountyAmount=fields.get("bountyAmount", 0),
+        )
+        created_at = _timestamp(fields.get("createdAt")) or datetime.utcnow().isoformat()
+        resolved_at = _timestamp(fields.get("resolvedAt") or fields.get("closedAt"))
+        deadline = _timestamp(fields.get("dueBy"))
+        if deadline is None:
+            if priority not in self._policies:
+                self._policies[priority] = self._config.sla_policy(priority) if self._config else None
+            deadline = sla.deadline(self._policies[priority], priority, created_at).isoformat()
+        active = status in sla_scheduler.SLA_ACTIVE_STATUSES
+        key = f"{self.import_id}:{fields.get('externalId') or f'row {row}'}"
+        return {
+            "id": str(uuid.uuid5(_NAMESPACE, key)),
+            "title": ticket.title,
+            "description": ticket.description,
+            "priority": ticket.priority,
+            "status": status,
+            "category": ticket.category,
+            "requester_id": self.requester_id,
+            "requester_name": fields.get("requester") or self.requester_name,
+            "assignee_name": fields.get("assignee"),
+            "asset_tag": ticket.assetTag,
+            "asset_name": ticket.assetName,
+            "sla_deadline": deadline,
+            "sla_exempt": active and sla_scheduler.timestamp(deadline) <= time.time(),
+            "created_at": created_at,
+            "updated_at": resolved_at or created_at,
+            "resolved_at": resolved_at if status == "resolved" else None,
+            "has_bounty": ticket.hasBounty,
+            "bounty_amount": ticket.bountyAmount,
+            "organization_id": self.org_id,
+        }
+
+    async def _insert(self, rows: List[dict]) -> Tuple[List[dict], int]:
+        """Insert a batch; returns (inserted rows, duplicates skipped). A
+        batch that was partly written before a restart falls back to
+        row-by-row inserts that skip the existing ids."""
+        for attempt in range(IMPORT_RETRIES):
+            try:
+                try:
+                    return (await execute(self.db.table("tickets").insert(rows))).data, 0
+                except APIError as e:
+                    if e.code != UNIQUE_VIOLATION:
+                        raise
+                inserted, duplicates = [], 0
+                for row in rows:
+                    try:
+                        inserted.extend((await execute(self.db.table("tickets").insert(row))).data)
+                    except APIError as e:
+                        if e.code != UNIQUE_VIOLATION:
+                            raise
+                        duplicates += 1
+                return inserted, duplicates
+            except Exception as e:
+                if attempt == IMPORT_RETRIES - 1:
+                    raise
+                print(f"Import batch error, retrying: {e}")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _save(self, **changes) -> dict:
+        changes["updated_at"] = datetime.utcnow().isoformat()
+        result = await execute(self.db.table("ticket_imports").update(changes).eq("id", self.import_id))
+        self.checkpoint = result.data[0] if result.data else {**self.checkpoint, **changes}
+        if self.on_progress:
+            self.on_progress(self.checkpoint)
+        return self.checkpoint
+
+    async def _produce(self, chunks: AsyncIterator[bytes], from_offset: bool, queue: asyncio.Queue):
+        checkpoint = self.checkpoint
+        columns = checkpoint.get("columns") if from_offset else None
+        base = checkpoint["byte_offset"] if from_offset else 0
+        skip = 0 if from_offset else checkpoint["rows_done"]
+        row = checkpoint["rows_done"] if from_offset else 0
+        batch, errors, end = [], [], base
+        async for record, consumed in records(chunks, self.fmt, columns):
+            end = base + consumed
+            if isinstance(record, list):
+                columns = record
+                await queue.put(([], [], row, end, columns))
+                continue
+            row += 1
+            if row <= skip:
+                continue
+            if isinstance(record, str):
+                errors.append({"row": row, "error": record})
+            else:
+                try:
+                    batch.append(self.ticket(record, row))
+                except ValidationError as e:
+                    errors.append({"row": row, "error": "; ".join(
+                        f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())})
+                except ValueError as e:
+                    errors.append({"row": row, "error": str(e)})
+            if len(batch) + len(errors) >= IMPORT_BATCH_SIZE:
+                await queue.put((batch, errors, row, end, None))
+                batch, errors = [], []
+        await queue.put((batch, errors, row, end, None))
+        await queue.put(None)
+
+    async def run(self, chunks: AsyncIterator[bytes], from_offset: bool = False) -> dict:
+        """Import every record in chunks and return the final checkpoint.
+
+        With from_offset, chunks start at the checkpoint's byte_offset (a
+        seeked file). Otherwise they are the whole source again, and rows
+        already checkpointed are skipped. On failure the checkpoint is left
+        at the last written batch and the error is raised.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=max(IMPORT_MAX_PENDING_BATCHES, 1))
+        producer = asyncio.create_task(self._produce(chunks, from_offset, queue))
+        try:
+            await self._save(state="running")
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                rows, errors, row, end, columns = item
+                inserted, duplicates = await self._insert(rows) if rows else ([], 0)
+                for ticket in inserted:
+                    if ticket.get("status") in sla_scheduler.SLA_ACTIVE_STATUSES and not ticket.get("sla_exempt"):
+                        sla_scheduler.track(str(ticket["id"]), ticket.get("sla_deadline"))
+                kept = self.checkpoint.get("errors") or []
+                changes = {
+                    "rows_done": max(row, self.checkpoint["rows_done"]),
+                    "byte_offset": max(end, self.checkpoint["byte_offset"]),
+                    "imported": self.checkpoint["imported"] + len(inserted),
+                    "duplicates": self.checkpoint["duplicates"] + duplicates,
+                    "failed": self.checkpoint["failed"] + len(errors),
+                    "errors": (kept + errors)[:IMPORT_MAX_ERRORS],
+                }
+                if columns is not None:
+                    changes["columns"] = columns
+                await self._save(**changes)
+            await producer
+        except BaseException as e:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            try:
+                await self._save(state="failed")
+            except Exception as save_error:
+                print(f"Import checkpoint error: {save_error}")
+            if isinstance(e, Exception):
+                print(f"Import {self.import_id} failed at row {self.checkpoint.get('rows_done')}: {e}")
+            raise
+        return await self._save(state="done")
+
+
+def progress(checkpoint: dict) -> dict:
+    """API view of a checkpoint."""
+    return {
+        "importId": checkpoint["id"],
+        "format": checkpoint["format"],
+        "source": checkpoint.get("source"),
+        "state": checkpoint["state"],
+        "rowsDone": checkpoint["rows_done"],
+        "byteOffset": checkpoint["byte_offset"],
+        "imported": checkpoint["imported"],
+        "duplicates": checkpoint["duplicates"],
+        "failed": checkpoint["failed"],
+        "errors": checkpoint.get("errors") or [],
+        "updatedAt": checkpoint.get("updated_at"),
+    }
+
+
+async def _file_chunks(path: str, offset: int) -> AsyncIterator[bytes]:
+    with open(path, "rb") as source:
+        source.seek(offset)
+        while True:
+            chunk = await asyncio.to_thread(source.read, 1 << 16)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def _import_file(args) -> int:
+    # Imported here: main imports this module for the endpoint.
+    from db import close_db, get_db
+    from main import TicketCreate
+
+    fmt = args.format or ("csv" if args.path.lower().endswith(".csv") else "ndjson")
+    import_id = args.import_id or f"{os.path.basename(args.path)}:{args.org}"
+    db = await get_db()
+    try:
+        importer = TicketImport(db, args.org, import_id, fmt, TicketCreate, args.requester_id,
+                                args.requester_name, source=os.path.basename(args.path),
+                                on_progress=lambda c: print(f"rows {c['rows_done']}  imported {c['imported']}  "
+                                                            f"duplicates {c['duplicates']}  failed {c['failed']}"))
+        checkpoint = await importer.open()
+        if checkpoint["state"] == "done" and not args.force:
+            print(f"Import {import_id} is already done; --force re-reads the file")
+            return 0
+        resume = checkpoint["rows_done"] > 0 and not args.force
+        if resume:
+            print(f"Resuming {import_id} at row {checkpoint['rows_done']} (byte {checkpoint['byte_offset']})")
+        final = await importer.run(_file_chunks(args.path, checkpoint["byte_offset"] if resume else 0),
+                                   from_offset=resume)
+        for error in final.get("errors") or []:
+            print(f"row {error['row']}: {error['error']}")
+        return 0
+    finally:
+        await close_db()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import tickets from an NDJSON or CSV export")
+    parser.add_argument("path")
+    parser.add_argument("--org", required=True, help="organization id to import into")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, help="default: from the file extension")
+    parser.add_argument("--import-id", help="checkpoint key (default: file name and org)")
+    parser.add_argument("--requester-id", default="import")
+    parser.add_argument("--requester-name", default="Imported")
+    parser.add_argument("--force", action="store_true", help="re-read from the start; existing tickets are skipped")
+    args = parser.parse_args(argv)
+    try:
+        return asyncio.run(_import_file(args))
+    except ValueError as e:
+        print(f"Import error: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
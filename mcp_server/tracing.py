@@ -0,0 +1,251 @@
+"""
+Request tracing with a local file exporter.
+
+TracingMiddleware opens a server span for every HTTP request, named after
+the route template ("POST /mcp/tickets/{ticket_id}/resolve"). Every
+db.execute() made while serving it becomes a client child span carrying the
+table, operation, filters and row count, so a trace shows exactly which
+queries a request made, in order, and which one was slow or failed.
+
+Sampling is decided when the request finishes, per route. Responses with a
+5xx status are always kept, and an incoming W3C traceparent header with the
+sampled flag forces sampling and continues the caller's trace.
+
+Kept traces are written one per line to TRACE_FILE as OTLP/JSON
+(ExportTraceServiceRequest), the same format the OpenTelemetry collector's
+file exporter writes, so the file can be loaded into any OTLP-aware viewer.
+Writes happen on a background thread and the file rotates by size.
+
+Environment:
+    TRACE_FILE            JSONL output path; tracing is off when unset
+    TRACE_SAMPLE_RATE     fraction of requests kept (default 0.1)
+    TRACE_ROUTE_RATES     per-route overrides, fnmatch patterns on the route
+                          template: "/mcp/tickets/*/resolve=1,/mcp/health=0"
+    TRACE_FILE_MAX_BYTES  rotate after this size (default 10 MB)
+    TRACE_FILE_BACKUPS    rotated files to keep (default 3)
+    TRACE_SERVICE_NAME    service.name resource attribute (default streamops-mcp)
+"""
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import re
+import time
+from fnmatch import fnmatchcase
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import List, Optional, Tuple
+
+from db import DB_BACKEND, add_query_listener, describe_query
+
+TRACE_FILE = os.getenv("TRACE_FILE")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "streamops-mcp")
+
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+
+def _parse_route_rates(value: str) -> List[Tuple[str, float]]:
+    rates = []
+    for entry in value.split(","):
+        pattern, _, rate = entry.strip().rpartition("=")
+        if pattern:
+            rates.append((pattern.strip(), float(rate)))
+    return rates
+
+
+TRACE_ROUTE_RATES = _parse_route_rates(os.getenv("TRACE_ROUTE_RATES", ""))
+
+
+def sample_rate(route: str) -> float:
+    for pattern, rate in TRACE_ROUTE_RATES:
+        if fnmatchcase(route, pattern):
+            return rate
+    return TRACE_SAMPLE_RATE
+
+
+def _attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, kind: int, start_ns: int):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns
+        self.end_ns = start_ns
+        self.attributes: dict = {}
+        self.error: Optional[str] = None
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_attribute(key, value) for key, value in self.attributes.items()],
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.error is not None:
+            span["status"] = {"code": STATUS_ERROR, "message": self.error}
+        return span
+
+
+class _Trace:
+    __slots__ = ("root", "children")
+
+    def __init__(self, root: Span):
+        self.root = root
+        self.children: List[Span] = []
+
+
+_current: contextvars.ContextVar[Optional[_Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def _on_query(query, seconds: float, outcome):
+    trace = _current.get()
+    if trace is None:
+        return
+    end_ns = time.time_ns()
+    try:
+        operation, table, params = describe_query(query)
+    except Exception:
+        operation, table, params = "query", type(query).__name__, []
+    span = Span(trace.root.trace_id, trace.root.span_id, f"{operation} {table}", SPAN_KIND_CLIENT,
+                end_ns - int(seconds * 1e9))
+    span.end_ns = end_ns
+    span.attributes.update({
+        "db.system": "sqlite" if DB_BACKEND == "sqlite" else "postgresql",
+        "db.operation": operation,
+        "db.sql.table": table,
+    })
+    if params:
+        span.attributes["db.filters"] = "&".join(f"{key}={value}" for key, value in params)
+    if isinstance(outcome, Exception):
+        span.error = f"{type(outcome).__name__}: {outcome}"
+    else:
+        data = getattr(outcome, "data", None)
+        if isinstance(data, list):
+            span.attributes["db.rows"] = len(data)
+        elif data is not None:
+            span.attributes["db.rows"] = 1
+    trace.children.append(span)
+
+
+add_query_listener(_on_query)
+
+_exporter: Optional[logging.Logger] = None
+_listener: Optional[QueueListener] = None
+
+
+def _start_exporter() -> logging.Logger:
+    global _exporter, _listener
+    if _exporter is None:
+        handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES,
+                                      backupCount=TRACE_FILE_BACKUPS, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        _listener = QueueListener(records, handler)
+        _listener.start()
+        atexit.register(stop_exporter)
+        _exporter = logging.getLogger("streamops.traces")
+        _exporter.propagate = False
+        _exporter.setLevel(logging.INFO)
+        _exporter.addHandler(QueueHandler(records))
+    return _exporter
+
+
+def stop_exporter():
+    """Flush queued traces and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def export(spans: List[Span]):
+    """Queue one trace for writing as an OTLP/JSON line."""
+    payload = {"resourceSpans": [{
+        "resource": {"attributes": [_attribute("service.name", TRACE_SERVICE_NAME)]},
+        "scopeSpans": [{
+            "scope": {"name": "streamops.tracing"},
+            "spans": [span.to_otlp() for span in spans],
+        }],
+    }]}
+    _start_exporter().info(json.dumps(payload, separators=(",", ":")))
+
+
+def _traceparent(scope) -> Tuple[Optional[str], Optional[str], bool]:
+    for name, value in scope.get("headers", []):
+        if name == b"traceparent":
+            match = _TRACEPARENT.match(value.decode("latin-1").strip().lower())
+            if match:
+                return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+    return None, None, False
+
+
+class TracingMiddleware:
+    """Pure ASGI middleware, so streamed responses pass through untouched."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace_id, parent_id, forced = _traceparent(scope)
+        root = Span(trace_id or os.urandom(16).hex(), parent_id, scope["method"], SPAN_KIND_SERVER, time.time_ns())
+        trace = _Trace(root)
+        token = _current.set(trace)
+        status = 500
+
+        async def status_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, status_send)
+        except Exception as e:
+            root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current.reset(token)
+            root.end_ns = time.time_ns()
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            if forced or status >= 500 or random.random() < sample_rate(route):
+                root.name = f"{scope['method']} {route}"
+                root.attributes.update({
+                    "http.request.method": scope["method"],
+                    "http.route": route,
+                    "url.path": scope["path"],
+                    "http.response.status_code": status,
+                })
+                if status >= 500 and root.error is None:
+                    root.error = f"HTTP {status}"
+                try:
+                    export([root, *trace.children])
+                except Exception as e:
+                    print(f"Trace export error: {e}")
@@ -0,0 +1,310 @@
+"""
+Ticket state transitions that also move gamification counters.
+
+Assigning or resolving a ticket updates the ticket, the agent's stats and
+(for resolve) the activity wall. In production each transition is a single
+call to a Postgres function (see TRANSITIONS_SQL in setup_db.py) that does
+all of it in one transaction with atomic increments, so parallel swipes
+never lose updates.
+
+The bulk variants take a list of ticket ids in the caller's org. Each is one
+set-based UPDATE, plus a single stats increment (and, for resolve, one daily
+bucket and one activity event) covering every ticket that actually changed
+(bulk_ticket_actions migration in migrations.py).
+
+With DB_RPC_MODE=local the same steps run through the table API instead,
+serialized per agent with an in-process lock. That mode exists for tests
+and offline runs against backends without the SQL functions installed.
+"""
+import asyncio
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from db import call_rpc, execute
+
+DEFAULT_BASE_POINTS = 25
+
+_agent_locks = defaultdict(asyncio.Lock)
+
+
+async def resolve_ticket_tx(db, ticket_id: str, user_id: str, user_name: str,
+                            user_avatar: Optional[str], org_id: Optional[str],
+                            priority_points: Optional[Dict[str, int]] = None) -> Optional[dict]:
+    """Resolve a ticket and credit the agent if it is not resolved yet.
+
+    Returns {"ticket", "stats", "points", "event"} on success,
+    {"conflict": True, "ticket"} with the current row when it was already
+    resolved, or None when the ticket does not exist.
+
+    priority_points maps lower-cased priority names to base points (from the
+    org config cache); without it the points are looked up in the database.
+    """
+    params = {
+        "p_ticket_id": ticket_id,
+        "p_user_id": user_id,
+        "p_user_name": user_name,
+        "p_user_avatar": user_avatar,
+        "p_org_id": org_id,
+        "p_priority_points": priority_points,
+    }
+    return await call_rpc(db, "resolve_ticket_tx", params, local_resolve_ticket) or None
+
+
+async def assign_ticket_tx(db, ticket_id: str, user_id: str, user_name: str,
+                           org_id: Optional[str]) -> Optional[dict]:
+    """Claim a ticket for the agent if it is still open and unassigned.
+
+    Returns {"ticket", "stats"} on success, {"conflict": True, "ticket"}
+    with the current row when someone else got there first, or None when
+    the ticket does not exist.
+    """
+    params = {
+        "p_ticket_id": ticket_id,
+        "p_user_id": user_id,
+        "p_user_name": user_name,
+        "p_org_id": org_id,
+    }
+    return await call_rpc(db, "assign_ticket_tx", params, local_assign_ticket) or None
+
+
+async def bulk_assign_tickets_tx(db, ticket_ids: List[str], user_id: str, user_name: str,
+                                org_id: Optional[str]) -> dict:
+    """Claim every listed ticket that is still open and unassigned.
+    Returns {"tickets": [claimed rows], "stats"}."""
+    params = {
+        "p_ticket_ids": ticket_ids,
+        "p_user_id": user_id,
+        "p_user_name": user_name,
+        "p_org_id": org_id,
+    }
+    return await call_rpc(db, "bulk_assign_tickets", params, local_bulk_assign_tickets)
+
+
+async def bulk_resolve_tickets_tx(db, ticket_ids: List[str], user_id: str, user_name: str,
+                                 user_avatar: Optional[str], org_id: Optional[str],
+                                 priority_points: Optional[Dict[str, int]] = None) -> dict:
+    """Resolve every listed ticket that is not resolved yet and credit the
+    agent once for all of them. Returns {"tickets": [resolved rows, each
+    with its "points"], "stats", "points", "event"}."""
+    params = {
+        "p_ticket_ids": ticket_ids,
+        "p_user_id": user_id,
+        "p_user_name": user_name,
+        "p_user_avatar": user_avatar,
+        "p_org_id": org_id,
+        "p_priority_points": priority_points,
+    }
+    return await call_rpc(db, "bulk_resolve_tickets", params, local_bulk_resolve_tickets)
+
+
+async def _bump_agent_stats(db, user_id: str, user_name: str, org_id: Optional[str], deltas: dict) -> dict:
+    now = datetime.utcnow().isoformat()
+    stats_result = await execute(db.table("agent_stats").select("*").eq("agent_id", user_id))
+    if stats_result.data:
+        current = stats_result.data[0]
+        update_stats = {column: (current.get(column) or 0) + delta for column, delta in deltas.items()}
+        update_stats["updated_at"] = now
+        if org_id and not current.get("organization_id"):
+            update_stats["organization_id"] = org_id
+        result = await execute(db.table("agent_stats").update(update_stats).eq("agent_id", user_id))
+    else:
+        new_stats = {
+            "agent_id": user_id,
+            "agent_name": user_name,
+            "tickets_assigned": 0,
+            "tickets_resolved": 0,
+            "streak": 0,
+            "coins": 0,
+        }
+        new_stats.update(deltas)
+        if org_id:
+            new_stats["organization_id"] = org_id
+        result = await execute(db.table("agent_stats").insert(new_stats))
+    return result.data[0] if result.data else {}
+
+
+async def _bump_daily_stats(db, user_id: str, org_id: Optional[str], points: int, resolved: int = 1):
+    day = datetime.utcnow().date().isoformat()
+    bucket = await execute(db.table("agent_stats_daily").select("*").eq("agent_id", user_id).eq("day", day))
+    if bucket.data:
+        current = bucket.data[0]
+        await execute(db.table("agent_stats_daily")
+            .update({
+                "tickets_resolved": (current.get("tickets_resolved") or 0) + resolved,
+                "coins": (current.get("coins") or 0) + points,
+                "organization_id": org_id or current.get("organization_id")
+            })
+            .eq("agent_id", user_id)
+            .eq("day", day))
+    else:
+        await execute(db.table("agent_stats_daily").insert({
+            "agent_id": user_id,
+            "organization_id": org_id,
+            "day": day,
+            "tickets_resolved": resolved,
+            "coins": points,
+        }))
+
+
+async def _base_points(db, org_id: Optional[str], priority: Optional[str],
+                       priority_points: Optional[Dict[str, int]]) -> int:
+    """Base points for resolving a ticket of this priority: from the
+    caller's points table, else the org's priority config."""
+    if priority_points is not None:
+        return priority_points.get((priority or "").lower(), DEFAULT_BASE_POINTS)
+    if org_id:
+        priority_result = await execute(db.table("priority_configs")
+            .select("base_points")
+            .eq("organization_id", org_id)
+            .ilike("name", priority or "medium"))
+        if priority_result.data:
+            return priority_result.data[0].get("base_points") or DEFAULT_BASE_POINTS
+    return DEFAULT_BASE_POINTS
+
+
+async def local_resolve_ticket(db, params: dict) -> Optional[dict]:
+    ticket_id, user_id, user_name = params["p_ticket_id"], params["p_user_id"], params["p_user_name"]
+    org_id = params["p_org_id"]
+    async with _agent_locks[user_id]:
+        ticket_result = await execute(db.table("tickets").select("*").eq("id", ticket_id))
+        if not ticket_result.data:
+            return None
+        ticket = ticket_result.data[0]
+        now = datetime.utcnow().isoformat()
+        update_data = {"status": "resolved", "resolved_at": now, "updated_at": now}
+        if not ticket.get("assignee_id"):
+            update_data["assignee_id"] = user_id
+            update_data["assignee_name"] = user_name
+        update_result = await execute(db.table("tickets")
+            .update(update_data)
+            .eq("id", ticket_id)
+            .neq("status", "resolved"))
+        if not update_result.data:
+            current = await execute(db.table("tickets").select("*").eq("id", ticket_id))
+            if not current.data:
+                return None
+            return {"conflict": True, "ticket": current.data[0]}
+        ticket = update_result.data[0]
+
+        base_points = await _base_points(db, org_id, ticket.get("priority"), params.get("p_priority_points"))
+        bounty_coins = (ticket.get("bounty_amount") or 0) if ticket.get("has_bounty") else 0
+        points = base_points + bounty_coins
+
+        stats = await _bump_agent_stats(db, user_id, user_name, org_id, {
+            "tickets_resolved": 1,
+            "streak": 1,
+            "coins": points,
+        })
+        await _bump_daily_stats(db, user_id, org_id, points)
+        event = None
+        try:
+            event_result = await execute(db.table("activity_events").insert({
+                "event_type": "ticket_resolved",
+                "user_id": user_id,
+                "user_name": user_name.split("@")[0] if "@" in user_name else user_name,
+                "user_avatar": params.get("p_user_avatar"),
+                "organization_id": org_id,
+                "message": f"resolved a ticket and earned {points} points",
+                "metadata": {"points": points, "ticketId": ticket_id, "ticketTitle": ticket.get("title", "")},
+                "created_at": now,
+            }))
+            event = event_result.data[0] if event_result.data else None
+        except Exception as e:
+            print(f"Create activity event error: {e}")
+    return {"ticket": ticket, "stats": stats, "points": points, "event": event}
+
+
+async def local_assign_ticket(db, params: dict) -> Optional[dict]:
+    ticket_id, user_id, user_name = params["p_ticket_id"], params["p_user_id"], params["p_user_name"]
+    async with _agent_locks[user_id]:
+        update_result = await execute(db.table("tickets")
+            .update({
+                "assignee_id": user_id,
+                "assignee_name": user_name,
+                "status": "assigned",
+                "updated_at": datetime.utcnow().isoformat()
+            })
+            .eq("id", ticket_id)
+            .eq("status", "open")
+            .is_("assignee_id", "null"))
+        if not update_result.data:
+            current = await execute(db.table("tickets").select("*").eq("id", ticket_id))
+            if not current.data:
+                return None
+            return {"conflict": True, "ticket": current.data[0]}
+        stats = await _bump_agent_stats(db, user_id, user_name, params["p_org_id"], {"tickets_assigned": 1})
+    return {"ticket": update_result.data[0], "stats": stats}
+
+
+def _in_org(query, org_id: Optional[str]):
+    return query.eq("organization_id", org_id) if org_id else query.is_("organization_id", "null")
+
+
+async def local_bulk_assign_tickets(db, params: dict) -> dict:
+    user_id, user_name, org_id = params["p_user_id"], params["p_user_name"], params["p_org_id"]
+    async with _agent_locks[user_id]:
+        update_result = await execute(_in_org(db.table("tickets")
+            .update({
+                "assignee_id": user_id,
+                "assignee_name": user_name,
+                "status": "assigned",
+                "updated_at": datetime.utcnow().isoformat()
+            })
+            .in_("id", params["p_ticket_ids"])
+            .eq("status", "open")
+            .is_("assignee_id", "null"), org_id))
+        stats = None
+        if update_result.data:
+            stats = await _bump_agent_stats(db, user_id, user_name, org_id,
+                                            {"tickets_assigned": len(update_result.data)})
+    return {"tickets": update_result.data, "stats": stats}
+
+
+async def local_bulk_resolve_tickets(db, params: dict) -> dict:
+    user_id, user_name, org_id = params["p_user_id"], params["p_user_name"], params["p_org_id"]
+    base_points: Dict[Optional[str], int] = {}
+    async with _agent_locks[user_id]:
+        now = datetime.utcnow().isoformat()
+        resolved = {"status": "resolved", "resolved_at": now, "updated_at": now}
+        # Unassigned tickets are credited to the resolving agent.
+        unassigned = await execute(_in_org(db.table("tickets")
+            .update({**resolved, "assignee_id": user_id, "assignee_name": user_name})
+            .in_("id", params["p_ticket_ids"])
+            .neq("status", "resolved")
+            .is_("assignee_id", "null"), org_id))
+        assigned = await execute(_in_org(db.table("tickets")
+            .update(resolved)
+            .in_("id", params["p_ticket_ids"])
+            .neq("status", "resolved"), org_id))
+        tickets = unassigned.data + assigned.data
+        for ticket in tickets:
+            priority = ticket.get("priority")
+            if priority not in base_points:
+                base_points[priority] = await _base_points(db, org_id, priority, params.get("p_priority_points"))
+            bounty_coins = (ticket.get("bounty_amount") or 0) if ticket.get("has_bounty") else 0
+            ticket["points"] = base_points[priority] + bounty_coins
+        points = sum(ticket["points"] for ticket in tickets)
+        stats, event = None, None
+        if tickets:
+            stats = await _bump_agent_stats(db, user_id, user_name, org_id, {
+                "tickets_resolved": len(tickets),
+                "streak": len(tickets),
+                "coins": points,
+            })
+            await _bump_daily_stats(db, user_id, org_id, points, len(tickets))
+            try:
+                event_result = await execute(db.table("activity_events").insert({
+                    "event_type": "tickets_resolved",
+                    "user_id": user_id,
+                    "user_name": user_name.split("@")[0] if "@" in user_name else user_name,
+                    "user_avatar": params.get("p_user_avatar"),
+                    "organization_id": org_id,
+                    "message": f"resolved {len(tickets)} tickets and earned {points} points",
+                    "metadata": {"points": points, "ticketCount": len(tickets)},
+                    "created_at": now,
+                }))
+                event = event_result.data[0] if event_result.data else None
+            except Exception as e:
+                print(f"Create activity event error: {e}")
+    return {"tickets": tickets, "stats": stats, "points": points, "event": event}
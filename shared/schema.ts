@@ -139,6 +139,14 @@ export interface SlaPolicy {
   responseTimeMinutes: number;
   resolutionTimeMinutes: number;
   isDefault: boolean;
+  businessHours?: BusinessHours | null;
+}
+
+// Opening hours an SLA policy counts; days left out are closed.
+export interface BusinessHours {
+  timezone: string;
+  hours: Partial<Record<'mon' | 'tue' | 'wed' | 'thu' | 'fri' | 'sat' | 'sun', [string, string] | [string, string][]>>;
+  holidays?: string[];
 }
 
 export interface TicketCategory {